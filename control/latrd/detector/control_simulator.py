@@ -14,23 +14,33 @@ from latrd_channel import LATRDChannel
 from latrd_message import LATRDMessageException, LATRDMessage, GetMessage, PutMessage, PostMessage, ResponseMessage
 from latrd_reactor import LATRDReactor
 from tristan_control_adapter import TriggerInType, TriggerOutType, TriggerTimestampType, TriggerInTerminationType, TriggerOutTerminationType, TriggerClockSourceType, TriggerTZeroType
-from event_simulator import TristanEventProducer
+from event_simulator import TristanEventProducer, TristanModule
+try:
+    from .udp_routing import UdpRouting
+except (ImportError, ValueError):
+    from udp_routing import UdpRouting
 
 class LATRDControlSimulator(object):
     DETECTOR_1M  = 1
     DETECTOR_2M  = 2
     DETECTOR_10M = 10
 
-    def __init__(self, sensor=DETECTOR_1M, endpoints=None):
+    # Interval between samples of the sender telemetry
+    TELEMETRY_INTERVAL_MS = 1000
+
+    def __init__(self, sensor=DETECTOR_1M, endpoints=None, producer_options=None,
+                 module_streams=False, clock_skew=None, seed=None, udp_file=None):
         logging.basicConfig(format='%(asctime)-15s %(message)s')
         self._log = logging.getLogger(".".join([__name__, self.__class__.__name__]))
         self._log.setLevel(logging.DEBUG)
         self._ctrl_channel = None
         self._script_thread = None
+        # UDP routing downloaded during an acquisition, applied when it ends
+        self._acquiring = False
+        self._pending_routing = None
+        self._routing_lock = threading.Lock()
         self._sensor = sensor
         self._reactor = LATRDReactor()
-        self._daq = TristanEventProducer(endpoints)
-        self._daq.init(80000000)
         variant = '10M'
         module_dimensions = {
             "x_min": [
@@ -79,6 +89,20 @@ class LATRDControlSimulator(object):
                 ]
             }
 
+        # Generate a single event stream, or an independent stream for each module
+        modules = None
+        if module_streams:
+            modules = TristanModule.from_dimensions(module_dimensions, clock_skew)
+        self._daq = TristanEventProducer(endpoints, modules=modules, seed=seed)
+        # Route the time slices as the detector would for a UDP configuration file
+        if udp_file is not None:
+            self._daq.set_routing(UdpRouting.from_file(udp_file))
+        # Apply any event producer options (send rate, sender processes)
+        if producer_options is not None:
+            for key in producer_options:
+                setattr(self._daq.defaults, key, producer_options[key])
+        self._daq.init(80000000)
+
         self._store = {
             'status':
                 {
@@ -104,6 +128,7 @@ class LATRDControlSimulator(object):
                             'timeslice_warning': [0],
                             'timing_error': [0],
                             'udp_packets_sent': [0],
+                            'sender_telemetry': self._daq.telemetry.samples(),
                             'data_overrun': [False],
                             'frames_acquired': 0,
                             'shutteropen': False,
@@ -190,6 +215,14 @@ class LATRDControlSimulator(object):
                 }
         }
 
+        # Sample the sender counters on a timer rather than for every control message
+        self._reactor.register_timer(self.TELEMETRY_INTERVAL_MS, 0, self.update_telemetry)
+
+    def update_telemetry(self):
+        detector = self._store['status']['detector']
+        detector['sender_telemetry'] = self._daq.telemetry.samples()
+        detector['udp_packets_sent'] = [self._daq.telemetry.packets()]
+
     def setup_control_channel(self, endpoint):
         self._ctrl_channel = LATRDChannel(LATRDChannel.CHANNEL_TYPE_ROUTER)
         self._ctrl_channel.bind(endpoint)
@@ -203,8 +236,6 @@ class LATRDControlSimulator(object):
         id = self._ctrl_channel.recv()
         msg = LATRDMessage.parse_json(self._ctrl_channel.recv())
 
-        self._store['status']['detector']['udp_packets_sent'] = [self._daq._sent_packets]
-
         #self._log.debug("Received message ID[%s]: %s", id, msg)
         if isinstance(msg, GetMessage):
             #self._log.debug("Received GetMessage, parsing...")
@@ -232,10 +263,33 @@ class LATRDControlSimulator(object):
         self._log.debug("Put params: %s", msg.params)
         for key in params:
             self.apply_parameters(self._store, key, params[key])
+        if 'config' in params:
+            self.apply_udp_config(params['config'])
         self._log.debug("Updated parameter Store: %s", self._store)
         reply = ResponseMessage(msg.msg_id)
         self._ctrl_channel.send_multi([send_id, reply])
 
+    def apply_udp_config(self, config):
+        # A downloaded UDP configuration sets the destinations of the time slices
+        try:
+            routing = UdpRouting.from_config(config)
+        except ValueError:
+            return
+        with self._routing_lock:
+            if self._acquiring:
+                # Changing the destinations mid acquisition would split the packets of
+                # a time slice, so the new routing is applied once the run has finished
+                self._log.debug("Deferring UDP routing until the acquisition ends: %s", routing)
+                self._pending_routing = routing
+                return
+            self.set_routing(routing)
+
+    def set_routing(self, routing):
+        self._pending_routing = None
+        self._log.debug("Routing time slices to UDP destinations: %s", routing)
+        self._daq.set_routing(routing)
+        self.update_telemetry()
+
     def parse_post_msg(self, msg, send_id):
         # Nothing to do here, just wait two seconds before replying
         # Check for the "Run" command.  If it is sent and the simulated script has been supplied then execute it
@@ -248,6 +302,8 @@ class LATRDControlSimulator(object):
                 # Execute any run scripts
                 time.sleep(1.0)
                 self._store['status']['state'] = 'running'
+                with self._routing_lock:
+                    self._acquiring = True
                 self._script_thread = threading.Thread(target=self.execute_script)
                 self._script_thread.start()
             elif 'stop' == msg.params['command']:
@@ -269,6 +325,14 @@ class LATRDControlSimulator(object):
         while self._daq.running() == True:
             #print("self._daq_running() = {}".format(self._daq.running()))
             time.sleep(0.5)
+        self.finish_run()
+
+    def finish_run(self):
+        # Apply any UDP routing downloaded during the acquisition
+        with self._routing_lock:
+            self._acquiring = False
+            if self._pending_routing is not None:
+                self.set_routing(self._pending_routing)
         self._store['status']['state'] = 'idle'
 
     def apply_parameters(self, store, key, param):
@@ -296,6 +360,33 @@ def options():
     parser.add_argument("-c", "--control", default="tcp://127.0.0.1:7001", help="Control endpoint")
     parser.add_argument("-d", "--endpoints", default=None, help="Data endpoints (eg 127.0.0.1:61649,127.0.0.1:61650")
     parser.add_argument("-m", "--sensor", default=1, help="Sensor module count (1 - 10)")
+    parser.add_argument("--udp-file", default=None,
+                        help="UDP configuration file to route time slices by (eg udp_tristan.json)")
+    parser.add_argument("--rate", type=float, default=None,
+                        help="Data packets per second sent to each endpoint")
+    parser.add_argument("--gbps", type=float, default=None,
+                        help="Data rate in Gbit/s sent to each endpoint")
+    parser.add_argument("--burst", type=int, default=1, help="Number of packets sent back to back")
+    parser.add_argument("--sndbuf", type=int, default=None,
+                        help="UDP socket send buffer size in bytes")
+    parser.add_argument("--processes", action="store_true",
+                        help="Send from one process per endpoint")
+    parser.add_argument("--cpus", default=None, help="CPUs to pin sender processes to (eg 2,3,4,5)")
+    parser.add_argument("--module-streams", action="store_true",
+                        help="Generate an independent event stream for each sensor module")
+    parser.add_argument("--clock-skew", default=None, help="Module clock skews in ppm (eg 0,5,-5)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for the module event streams")
+    parser.add_argument("--corpus", default=None,
+                        help="Packet corpus files to send, one per event stream "
+                             "(eg m0.corpus,m1.corpus)")
+    parser.add_argument("--image", default=None,
+                        help="Send count mode images of this size instead of events (eg 2048x512)")
+    parser.add_argument("--images", type=int, default=1000,
+                        help="Number of count mode images to send")
+    parser.add_argument("--frame-rate", type=float, default=None,
+                        help="Count mode images per second")
+    parser.add_argument("--occupancy", type=float, default=0.01,
+                        help="Fraction of pixels hit in each image")
     args = parser.parse_args()
     return args
 
@@ -322,7 +413,33 @@ def main():
         sensor = int(''.join(filter(lambda i: i.isdigit(), args.sensor)))
     else:
         sensor = args.sensor
-    simulator = LATRDControlSimulator(sensor, eps)
+    cpu_list = None
+    if args.cpus is not None:
+        cpu_list = [int(cpu) for cpu in args.cpus.split(',')]
+    producer_options = {
+        'packet_rate': args.rate,
+        'data_rate': args.gbps,
+        'burst': args.burst,
+        'send_buffer': args.sndbuf,
+        'sender_processes': args.processes,
+        'cpu_list': cpu_list,
+        'corpus': args.corpus.split(',') if args.corpus else None
+    }
+    if args.image is not None:
+        width, height = [int(size) for size in args.image.lower().split('x')]
+        producer_options.update({
+            'count_mode': True,
+            'image_width': width,
+            'image_height': height,
+            'num_images': args.images,
+            'frame_rate': args.frame_rate,
+            'occupancy': args.occupancy
+        })
+    clock_skew = None
+    if args.clock_skew is not None:
+        clock_skew = [float(skew) for skew in args.clock_skew.split(',')]
+    simulator = LATRDControlSimulator(sensor, eps, producer_options,
+                                      args.module_streams, clock_skew, args.seed, args.udp_file)
     simulator.setup_control_channel(args.control)
     simulator.start_reactor()
 
@@ -4,8 +4,37 @@ import argparse
 import os
 import socket
 import time
+import math
 import random
 import threading
+import multiprocessing
+import numpy as np
+try:
+    from .packet_corpus import PacketCorpus
+    from .udp_pacer import PacketPacer, set_send_buffer
+    from .sender_telemetry import SenderTelemetry
+    from .udp_routing import UdpRouting
+except (ImportError, ValueError):
+    # Run as a script (or by control_simulator) from the detector directory
+    from packet_corpus import PacketCorpus
+    from udp_pacer import PacketPacer, set_send_buffer
+    from sender_telemetry import SenderTelemetry
+    from udp_routing import UdpRouting
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# Sender processes run the send loop of the producer itself, sharing its packet
+# sources and telemetry, so they must be forked rather than spawned
+try:
+    SENDER_CONTEXT = multiprocessing.get_context('fork')
+except AttributeError:
+    # Python 2 always forks on POSIX
+    SENDER_CONTEXT = multiprocessing
+except ValueError:
+    # Fork is not available on this platform
+    SENDER_CONTEXT = None
 
 
 class TristanDefinitions(object):
@@ -24,13 +53,142 @@ class TristanDefinitions(object):
     HEADER_WORD_2          = 0xE000000000000000
     HEADER_WORD_3          = 0xE400000000000000
     NO_OF_BUFFERS          = 4
+    COUNT_MODE             = 0x0000000000000800
+    IMAGE_NUMBER_MASK      = 0x00FFFFFF00000000
+    INTEGRAL_DATA_WORD     = 0x9000000000000000
+    INTEGRAL_CHIP_X_MASK   = 0x0003FFE000000000
+    INTEGRAL_CHIP_Y_MASK   = 0x0000001FFF000000
+    INTEGRAL_I_TOT_MASK    = 0x0000000000FFFC00
+    INTEGRAL_COUNT_MASK    = 0x00000000000003FF
+    FINAL_PACKET_WORD      = 0xC00071B000000000
+    TICK_HZ                = 640000000
+
+
+class GeneratorState(object):
+    """
+    Counters for a single generated event stream.
+
+    Every stream (one per detector module or producer) owns a GeneratorState, so
+    streams can be generated independently, concurrently or in separate processes,
+    and each is reproduced exactly from the same starting state and seed.  The
+    random attribute is a NumPy RandomState seeded from (seed, stream_id) for any
+    randomised event content.
+    """
+    def __init__(self, word_index=0, timestamp=0, packet_number=0, seed=None, stream_id=0):
+        """
+        Initialise the stream state.
+
+        :param word_index: position index of the next event
+        :param timestamp: timestamp of the next event
+        :param packet_number: packet number of the next packet
+        :param seed: seed for the random state, None for an unseeded stream
+        :param stream_id: identifies the stream when one seed is shared by many streams
+        """
+        self.word_index = word_index
+        self.timestamp = timestamp
+        self.packet_number = packet_number
+        self.seed = seed
+        self.stream_id = stream_id
+        if seed is None:
+            self.random = np.random.RandomState()
+        else:
+            self.random = np.random.RandomState([seed, stream_id])
 
+    def advance(self, events, ticks=None):
+        """
+        Advance the timestamp and word index past a number of events.
 
-class TristanData(object):
-    WORD_INDEX = 0
-    TIMESTAMP = 0
-    TIME_SLICE_NUMBER = 0
-    PACKET_NUMBER = 0
+        :param events: number of events
+        :param ticks: clock ticks taken by the events, defaults to one per event
+        """
+        if ticks is None:
+            ticks = events
+        self.timestamp += ticks
+        self.word_index += events
+
+
+class TristanModule(object):
+    """
+    A single simulated detector module.
+
+    Each module generates its own event stream with its producer ID in the packet
+    headers, event positions that lie within the module's pixel geometry and a
+    clock that runs clock_skew parts per million fast (or slow if negative).
+    """
+    def __init__(self, producer_id=0, x_min=0, y_min=0, x_max=2068, y_max=514, clock_skew=0.0):
+        """
+        Initialise the module.
+
+        :param producer_id: producer ID placed in the packet headers
+        :param x_min: first x pixel of the module
+        :param y_min: first y pixel of the module
+        :param x_max: x pixel after the last of the module
+        :param y_max: y pixel after the last of the module
+        :param clock_skew: clock rate error in parts per million
+        """
+        self.producer_id = producer_id
+        self.x_min = x_min
+        self.y_min = y_min
+        self.x_max = x_max
+        self.y_max = y_max
+        self.clock_skew = clock_skew
+
+    @property
+    def width(self):
+        return self.x_max - self.x_min
+
+    @property
+    def pixels(self):
+        return self.width * (self.y_max - self.y_min)
+
+    @property
+    def clock_rate(self):
+        return 1.0 + self.clock_skew * 1.0e-6
+
+    def pixel_order(self, random_state=None):
+        """
+        Return the (stride, start) of the sequence in which the module's pixels are
+        hit.  Event n hits pixel (n * stride + start) % pixels, which visits every
+        pixel once per cycle.  Without a random state the pixels are hit in raster
+        order, otherwise the stride and start are drawn from it.
+
+        :param random_state: NumPy RandomState, or None for raster order
+        :return: tuple of (stride, start)
+        """
+        if random_state is None:
+            return 1, 0
+        while True:
+            stride = int(random_state.randint(1, self.pixels))
+            if _gcd(stride, self.pixels) == 1:
+                return stride, int(random_state.randint(0, self.pixels))
+
+    @staticmethod
+    def from_dimensions(module_dimensions, clock_skew=None):
+        """
+        Create one module for each entry of a module_dimensions dictionary (as
+        reported by the detector status), numbering the producer IDs from zero.
+
+        :param module_dimensions: dictionary of x_min, y_min, x_max and y_max lists
+        :param clock_skew: list of clock skews in ppm, applied to the modules in turn
+        :return: list of TristanModule objects
+        """
+        if not clock_skew:
+            clock_skew = [0.0]
+        modules = []
+        for index in range(len(module_dimensions['x_min'])):
+            modules.append(TristanModule(producer_id=index,
+                                         x_min=module_dimensions['x_min'][index],
+                                         y_min=module_dimensions['y_min'][index],
+                                         x_max=module_dimensions['x_max'][index],
+                                         y_max=module_dimensions['y_max'][index],
+                                         clock_skew=clock_skew[index % len(clock_skew)]))
+        return modules
+
+
+def _gcd(a, b):
+    while b:
+        a, b = b, a % b
+    return a
 
 
 class TristanTimestampWord(object):
@@ -43,9 +201,9 @@ class TristanTimestampWord(object):
 
 
 class TristanWord(object):
-    def __init__(self, ts):
-        self._index = TristanData.WORD_INDEX
-        TristanData.WORD_INDEX+=1
+    def __init__(self, ts, state):
+        self._index = state.word_index
+        state.word_index+=1
         self._ts = ts
 
     def to_64_bit_word(self):
@@ -72,12 +230,12 @@ class TristanIdlePacket(object):
 
 
 class TristanPacket(object):
-    def __init__(self, words, time_slice):
+    def __init__(self, words, time_slice, state):
         self._words = []
 
         # Calculate the current course and fine timestamp
-        self._course_ts = TristanData.TIMESTAMP&TristanDefinitions.COURSE_TIMESTAMP_MASK
-        self._fine_ts = TristanData.TIMESTAMP&TristanDefinitions.FINE_TIMESTAMP_MASK
+        self._course_ts = state.timestamp&TristanDefinitions.COURSE_TIMESTAMP_MASK
+        self._fine_ts = state.timestamp&TristanDefinitions.FINE_TIMESTAMP_MASK
 
         self._ts_word = TristanTimestampWord(self._course_ts)
         extra_words = 0
@@ -85,18 +243,18 @@ class TristanPacket(object):
         for index in range(words):
             if index > 0:
                 if self._fine_ts&TristanDefinitions.FINE_TIMESTAMP_MASK == 0:
-                    self._course_ts = TristanData.TIMESTAMP&TristanDefinitions.COURSE_TIMESTAMP_MASK
+                    self._course_ts = state.timestamp&TristanDefinitions.COURSE_TIMESTAMP_MASK
                     self._words.append(TristanTimestampWord(self._course_ts))
                     extra_words += 1
-            self._words.append(TristanWord(self._fine_ts))
+            self._words.append(TristanWord(self._fine_ts, state))
             self._fine_ts += 1
-            TristanData.TIMESTAMP += 1
+            state.timestamp += 1
 
         # Record the header information
         self._ts_buffer = time_slice%TristanDefinitions.NO_OF_BUFFERS
         self._ts_wrap = int(time_slice/TristanDefinitions.NO_OF_BUFFERS)
-        self._packet = TristanData.PACKET_NUMBER
-        TristanData.PACKET_NUMBER += 1
+        self._packet = state.packet_number
+        state.packet_number += 1
 
         # Create the header words
         # Fixed header 1
@@ -126,6 +284,525 @@ class TristanPacket(object):
         return byte_array
 
 
+class TristanPacketBuilder(object):
+    """
+    Vectorised packet builder.
+
+    Produces exactly the same words as a sequence of TristanPacket objects, using
+    and advancing the counters of its GeneratorState in the same way, but computes
+    the header, timestamp and event words of many packets at once as uint64 arrays.
+    Packets are returned as zero copy memoryview slices of a single buffer.
+    """
+    CONTROL_WORDS = 4
+
+    def __init__(self, words_per_packet=800, state=None, module=None):
+        """
+        Initialise the builder.
+
+        :param words_per_packet: number of events in each packet
+        :param state: GeneratorState of the stream, a new state is created if None
+        :param module: TristanModule generating the stream, None for a single stream
+                       with sequential event positions
+        """
+        self._words = words_per_packet
+        if state is None:
+            state = GeneratorState()
+        self.state = state
+        self.module = module
+        if module is not None:
+            self._pixel_order = module.pixel_order(state.random if state.seed is not None else None)
+
+    def ticks(self, events):
+        """
+        Return the number of clock ticks taken by a number of events.
+        """
+        if self.module is None or self.module.clock_skew == 0:
+            return events
+        return int(math.floor(events * self.module.clock_rate))
+
+    def build(self, time_slice, no_of_packets):
+        """
+        Build consecutive packets for a single time slice, numbering them from the
+        current packet number of the stream.
+
+        :param time_slice: time slice number to encode in the packet headers
+        :param no_of_packets: number of packets to build
+        :return: tuple of (uint64 array of all packet words, list of packet memoryviews)
+        """
+        packet_numbers = np.arange(no_of_packets, dtype=np.uint64) + \
+            np.uint64(self.state.packet_number)
+        time_slices = np.full(no_of_packets, time_slice, dtype=np.uint64)
+        self.state.packet_number += no_of_packets
+        first_events = np.arange(no_of_packets, dtype=np.uint64) * np.uint64(self._words)
+        data, packet_words = self._build(time_slices, packet_numbers, first_events,
+                                         self.state.timestamp, self.state.word_index)
+        self.state.advance(no_of_packets * self._words, self.ticks(no_of_packets * self._words))
+        return data, self._views(data, packet_words)
+
+    def build_slices(self, first_time_slice, no_of_slices, packets_per_slice):
+        """
+        Build the packets for a run of consecutive time slices.  Packet numbers
+        restart from zero for each time slice.
+
+        :param first_time_slice: time slice number of the first slice
+        :param no_of_slices: number of time slices to build
+        :param packets_per_slice: number of packets in each time slice
+        :return: tuple of (uint64 array of all packet words, list of packet memoryview lists)
+        """
+        time_slices = np.arange(no_of_slices, dtype=np.uint64) + np.uint64(first_time_slice)
+        built = self.build_time_slices(time_slices, packets_per_slice, first_time_slice,
+                                       self.state.timestamp, self.state.word_index)
+        events = no_of_slices * packets_per_slice * self._words
+        self.state.advance(events, self.ticks(events))
+        return built
+
+    def build_time_slices(self, time_slices, packets_per_slice, first_time_slice, timestamp,
+                          word_index):
+        """
+        Build the packets for any selection of time slices from a run of consecutive
+        time slices, without using or advancing the stream state.
+
+        The run starts at first_time_slice with the given timestamp and word index, so
+        the packets of each selected time slice are identical to those built for it
+        by build_slices over the whole run.
+
+        :param time_slices: time slice numbers to build, in the order required
+        :param packets_per_slice: number of packets in each time slice
+        :param first_time_slice: time slice number of the first slice of the run
+        :param timestamp: timestamp of the first event of the run
+        :param word_index: position index of the first event of the run
+        :return: tuple of (uint64 array of all packet words, list of packet memoryview lists)
+        """
+        time_slices = np.asarray(time_slices, dtype=np.uint64)
+        packet_numbers = np.tile(np.arange(packets_per_slice, dtype=np.uint64), len(time_slices))
+        packet_index = (np.repeat(time_slices - np.uint64(first_time_slice), packets_per_slice) *
+                        np.uint64(packets_per_slice) + packet_numbers)
+        data, packet_words = self._build(np.repeat(time_slices, packets_per_slice), packet_numbers,
+                                         packet_index * np.uint64(self._words), timestamp,
+                                         word_index)
+        return data, self.split_slices(self._views(data, packet_words), packets_per_slice)
+
+    @staticmethod
+    def split_slices(packets, packets_per_slice):
+        """
+        Split a list of packets into one list per time slice.
+        """
+        return [packets[start:start + packets_per_slice]
+                for start in range(0, len(packets), packets_per_slice)]
+
+    @staticmethod
+    def _views(data, packet_words):
+        # Hand out each packet as a zero copy view of the buffer
+        buffer = memoryview(data.view(np.uint8))
+        offsets = [0]
+        for words in packet_words:
+            offsets.append(offsets[-1] + words * 8)
+        return [buffer[offsets[index]:offsets[index + 1]] for index in range(len(packet_words))]
+
+    def _build(self, time_slices, packet_numbers, first_events, timestamp, word_index):
+        words = self._words
+        no_of_packets = len(time_slices)
+        events = no_of_packets * words
+        # Offset of every event from the start of the run, each packet holding a
+        # contiguous block of events starting at its entry in first_events
+        event_index = np.repeat(first_events, words) + \
+                      np.tile(np.arange(words, dtype=np.uint64), no_of_packets)
+        module = self.module
+        if module is None or module.clock_skew == 0:
+            ts = event_index + np.uint64(timestamp)
+        else:
+            ts = np.floor(event_index * module.clock_rate).astype(np.uint64) + np.uint64(timestamp)
+        fine_ts = ts & np.uint64(TristanDefinitions.FINE_TIMESTAMP_MASK)
+
+        # A course timestamp word is inserted before any event (other than the first
+        # of a packet) where the fine timestamp rolls over
+        if module is None or module.clock_skew == 0:
+            rollover = fine_ts == 0
+        else:
+            course_ts = ts >> np.uint64(23)
+            rollover = np.zeros(events, dtype=bool)
+            rollover[1:] = course_ts[1:] != course_ts[:-1]
+        rollover[::words] = False
+        rollover_count = np.count_nonzero(rollover)
+        extra_words = np.zeros(no_of_packets, dtype=np.intp)
+
+        # Output position of each event: header and timestamp words of every packet up
+        # to and including its own, plus any inserted timestamp words at or before it
+        position = np.arange(events, dtype=np.intp)
+        position += (position // words + 1) * self.CONTROL_WORDS
+        if rollover_count > 0:
+            position += np.cumsum(rollover, dtype=np.intp)
+            np.add.at(extra_words, np.flatnonzero(rollover) // words, 1)
+
+        packet_words = words + self.CONTROL_WORDS + extra_words
+        packet_start = np.zeros(no_of_packets + 1, dtype=np.intp)
+        np.cumsum(packet_words, out=packet_start[1:])
+
+        data = np.empty(packet_start[-1], dtype='<u8')
+        if module is None:
+            pixel = (event_index + np.uint64(word_index)) & \
+                np.uint64(TristanDefinitions.POSITION_MASK)
+        else:
+            # Position field is the x pixel in the upper 13 bits and y in the lower 13
+            stride, first = self._pixel_order
+            pixel = (event_index + np.uint64(word_index)) * np.uint64(stride) + np.uint64(first)
+            pixel = pixel % np.uint64(module.pixels)
+            pixel = (pixel % np.uint64(module.width) + np.uint64(module.x_min)) << np.uint64(13) | \
+                    (pixel // np.uint64(module.width) + np.uint64(module.y_min))
+        data[position] = pixel << np.uint64(37) | (fine_ts << np.uint64(14))
+        if rollover_count > 0:
+            data[position[rollover] - 1] = \
+                (ts[rollover] & np.uint64(TristanDefinitions.COURSE_TIMESTAMP_MASK)) | \
+                np.uint64(TristanDefinitions.TIMESTAMP_CONTROL_WORD)
+
+        # Header 2 contains the time slice wrap and the word count (the packet length
+        # excluding the first header word), header 3 the buffer number and packet ID
+        ts_buffer = time_slices % np.uint64(TristanDefinitions.NO_OF_BUFFERS)
+        ts_wrap = time_slices // np.uint64(TristanDefinitions.NO_OF_BUFFERS)
+        start = packet_start[:-1]
+        data[start] = TristanDefinitions.HEADER_WORD_1
+        producer_id = 0 if module is None else module.producer_id
+        data[start + 1] = np.uint64(TristanDefinitions.HEADER_WORD_2) | \
+            ((np.uint64(producer_id) << np.uint64(50)) &
+             np.uint64(TristanDefinitions.PRODUCER_ID_MASK)) | \
+            ((ts_wrap << np.uint64(18)) & np.uint64(TristanDefinitions.TIME_SLICE_WRAP_MASK)) | \
+            ((packet_words - 1).astype(np.uint64) & np.uint64(TristanDefinitions.WORD_COUNT_MASK))
+        data[start + 2] = np.uint64(TristanDefinitions.HEADER_WORD_3) | \
+            ((ts_buffer << np.uint64(32)) &
+             np.uint64(TristanDefinitions.TIME_SLICE_BUFFER_MASK)) | \
+            (packet_numbers & np.uint64(TristanDefinitions.PACKET_ID_MASK))
+        data[start + 3] = (ts[::words] & np.uint64(TristanDefinitions.COURSE_TIMESTAMP_MASK)) | \
+            np.uint64(TristanDefinitions.TIMESTAMP_CONTROL_WORD)
+
+        return data, packet_words.tolist()
+
+
+def plan_slices(total_events, per_slice, words_per_packet=800):
+    """
+    Return the number of packets per time slice and the number of time slices
+    needed for a run of at least total_events events.
+
+    :param total_events: minimum number of events in the run
+    :param per_slice: minimum number of events in each time slice
+    :param words_per_packet: number of events in each packet
+    :return: tuple of (packets per slice, number of time slices)
+    """
+    packets_per_slice = -(-per_slice // words_per_packet)
+    return packets_per_slice, -(-total_events // (packets_per_slice * words_per_packet))
+
+
+def _generate_stream(args):
+    """
+    Process pool entry point, build every packet of one stream.
+    """
+    state, module, total_events, per_slice, words_per_packet = args
+    builder = TristanPacketBuilder(words_per_packet, state, module)
+    packets_per_slice, no_of_slices = plan_slices(total_events, per_slice, words_per_packet)
+    data, slice_packets = builder.build_slices(1, no_of_slices, packets_per_slice)
+    packet_words = [len(packet) // 8 for packets in slice_packets for packet in packets]
+    return state, data, packet_words, packets_per_slice
+
+
+def generate_streams(states, total_events, per_slice, words_per_packet=800, processes=None,
+                     modules=None):
+    """
+    Build the packets of several independent streams using a pool of processes.
+
+    Each stream is built from its own GeneratorState, which is advanced in place
+    exactly as if the stream had been built in this process, so the output does not
+    depend on the number of processes used.
+
+    :param states: list of GeneratorState objects, one per stream
+    :param total_events: minimum number of events in each stream
+    :param per_slice: minimum number of events in each time slice
+    :param words_per_packet: number of events in each packet
+    :param processes: number of worker processes (defaults to the number of CPUs)
+    :param modules: list of TristanModule objects, one per stream
+    :return: list of (uint64 array of all packet words, list of packet memoryview lists)
+    """
+    if modules is None:
+        modules = [None] * len(states)
+    tasks = [(state, module, total_events, per_slice, words_per_packet)
+             for state, module in zip(states, modules)]
+    pool = multiprocessing.Pool(processes)
+    try:
+        results = pool.map(_generate_stream, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    streams = []
+    for state, (new_state, data, packet_words, packets_per_slice) in zip(states, results):
+        state.__dict__.update(new_state.__dict__)
+        packets = TristanPacketBuilder._views(data, packet_words)
+        streams.append((data, TristanPacketBuilder.split_slices(packets, packets_per_slice)))
+    return streams
+
+
+class TristanSliceSource(object):
+    """
+    On demand source of the packets for a run of time slices.
+
+    The timestamp and word index of the first event are captured when the source is
+    created and the stream state is advanced past the whole run, exactly as if every
+    packet had been built up front.  Packets are then only built when they
+    are iterated over, a batch of time slices at a time, by a background thread that
+    reads ahead a bounded number of batches.
+    """
+    def __init__(self, total_events, per_slice, words_per_packet=800, first_time_slice=1,
+                 events_per_batch=100000, prefetch=4, state=None, module=None):
+        """
+        Plan the run of time slices.
+
+        :param total_events: minimum number of events in the run
+        :param per_slice: minimum number of events in each time slice
+        :param words_per_packet: number of events in each packet
+        :param first_time_slice: time slice number of the first slice
+        :param events_per_batch: approximate number of events built at a time
+        :param prefetch: number of batches built ahead of the consumer
+        :param state: GeneratorState of the stream, a new state is created if None
+        :param module: TristanModule generating the stream
+        """
+        self._builder = TristanPacketBuilder(words_per_packet, state, module)
+        self.packets_per_slice, self.no_of_slices = plan_slices(total_events, per_slice,
+                                                                words_per_packet)
+        events_per_slice = self.packets_per_slice * words_per_packet
+        self.first_time_slice = first_time_slice
+        self._slices_per_batch = max(1, events_per_batch // events_per_slice)
+        self._prefetch = prefetch
+        self._timestamp = self._builder.state.timestamp
+        self._word_index = self._builder.state.word_index
+        events = self.no_of_slices * events_per_slice
+        self._builder.state.advance(events, self._builder.ticks(events))
+
+    @property
+    def no_of_packets(self):
+        return self.no_of_slices * self.packets_per_slice
+
+    def time_slices(self):
+        """
+        Return the time slice numbers of the run in order.
+        """
+        return range(self.first_time_slice, self.first_time_slice + self.no_of_slices)
+
+    def build(self, time_slices):
+        """
+        Build the packets of a list of time slices immediately.
+
+        :param time_slices: time slice numbers to build
+        :return: list of packet memoryview lists, one per time slice
+        """
+        _, packets = self._builder.build_time_slices(time_slices, self.packets_per_slice,
+                                                     self.first_time_slice,
+                                                     self._timestamp, self._word_index)
+        return packets
+
+    def iter_slices(self, time_slices):
+        """
+        Iterate over the packets of a sequence of time slices, building them in
+        batches in a background thread.
+
+        :param time_slices: time slice numbers to build, in the order required
+        :return: generator of (time slice number, list of packet memoryviews) tuples
+        """
+        time_slices = list(time_slices)
+        batches = queue.Queue(maxsize=self._prefetch)
+        stop = threading.Event()
+
+        def put(item):
+            # Block until there is space in the queue, unless the consumer has gone
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def prefetch():
+            try:
+                for start in range(0, len(time_slices), self._slices_per_batch):
+                    batch = time_slices[start:start + self._slices_per_batch]
+                    if not put(list(zip(batch, self.build(batch)))):
+                        return
+            except Exception as e:
+                put(e)
+                return
+            # None signifies the end of the time slices
+            put(None)
+
+        thread = threading.Thread(target=prefetch)
+        thread.daemon = True
+        thread.start()
+        try:
+            while True:
+                batch = batches.get()
+                if batch is None:
+                    break
+                if isinstance(batch, Exception):
+                    raise batch
+                for item in batch:
+                    yield item
+        finally:
+            stop.set()
+            thread.join()
+
+
+class TristanImageSource(TristanSliceSource):
+    """
+    On demand source of count mode (image) packets for a run of images.
+
+    Every image hits a fixed number of distinct pixels, set by the occupancy, each
+    with a random event count and integrated ToT.  The hits of an image are sent in
+    raster order, words_per_packet integral words to a packet, and the final packet
+    of the image ends with the end of image word.  The source has the same
+    interface as TristanSliceSource, with image numbers in place of time slice
+    numbers, so images are sent by the same paced senders.
+    """
+    CONTROL_WORDS = 4
+
+    def __init__(self, no_of_images, width, height, occupancy=0.01, frame_rate=None,
+                 words_per_packet=800, first_image=0, mean_count=1.0,
+                 events_per_batch=100000, prefetch=4, state=None, producer_id=0):
+        """
+        Plan the run of images.
+
+        :param no_of_images: number of images in the run
+        :param width: image width in pixels
+        :param height: image height in pixels
+        :param occupancy: fraction of the pixels hit in each image
+        :param frame_rate: images per second, sets the timestamp step between images
+        :param words_per_packet: number of integral words in each packet
+        :param first_image: image number of the first image
+        :param mean_count: mean event count of a hit pixel
+        :param events_per_batch: approximate number of hits built at a time
+        :param prefetch: number of batches built ahead of the consumer
+        :param state: GeneratorState of the stream, a new state is created if None
+        :param producer_id: producer ID placed in the packet headers
+        """
+        if state is None:
+            state = GeneratorState()
+        self.state = state
+        self.width = width
+        self.height = height
+        self.producer_id = producer_id
+        self.mean_count = mean_count
+        self._words = words_per_packet
+        self._pixels = width * height
+        self.hits = min(self._pixels, int(round(occupancy * self._pixels)))
+        self.packets_per_slice = max(1, -(-self.hits // words_per_packet))
+        self.no_of_slices = no_of_images
+        self.first_time_slice = first_image
+        self._slices_per_batch = max(1, events_per_batch // max(1, self.hits))
+        self._prefetch = prefetch
+
+        # Each image is built from its own random state so that any selection of
+        # images can be built, in any order, identically
+        self._seed = int(state.random.randint(0, 2**31 - 1))
+        if frame_rate:
+            self._frame_ticks = int(TristanDefinitions.TICK_HZ // frame_rate)
+        else:
+            self._frame_ticks = max(1, self.hits)
+        self._timestamp = state.timestamp
+        state.advance(no_of_images * self.hits, no_of_images * self._frame_ticks)
+
+        # Layout of the words of one image, the same for every image
+        hits = np.arange(self.hits, dtype=np.intp)
+        self._positions = hits + (hits // words_per_packet + 1) * self.CONTROL_WORDS
+        self._packet_words = np.full(self.packets_per_slice, words_per_packet + self.CONTROL_WORDS,
+                                     dtype=np.intp)
+        self._packet_words[-1] = self.hits - (self.packets_per_slice - 1) * words_per_packet + \
+            self.CONTROL_WORDS + 1
+        self._packet_start = np.zeros(self.packets_per_slice, dtype=np.intp)
+        np.cumsum(self._packet_words[:-1], out=self._packet_start[1:])
+        self._image_words = int(self._packet_words.sum())
+
+    def _hits(self, image):
+        # Distinct pixels (in raster order), event counts and ToT of one image
+        random_state = np.random.RandomState([self._seed, image])
+        region = TristanModule(x_max=self.width, y_max=self.height)
+        stride, start = region.pixel_order(random_state)
+        pixels = np.arange(self.hits, dtype=np.uint64) * np.uint64(stride) + np.uint64(start)
+        pixels = np.sort(pixels % np.uint64(self._pixels))
+        counts = np.clip(random_state.poisson(self.mean_count, self.hits), 1,
+                         TristanDefinitions.INTEGRAL_COUNT_MASK).astype(np.uint64)
+        i_tot = random_state.randint(0, 0x4000, self.hits).astype(np.uint64)
+        return pixels, counts, i_tot
+
+    def build(self, time_slices):
+        """
+        Build the packets of a list of images immediately.
+
+        :param time_slices: image numbers to build
+        :return: list of packet memoryview lists, one per image
+        """
+        images = np.asarray(time_slices, dtype=np.uint64)
+        data = np.empty((len(images), self._image_words), dtype='<u8')
+        if self.hits > 0:
+            hits = [self._hits(int(image)) for image in images]
+            pixels = np.array([hit[0] for hit in hits])
+            counts = np.array([hit[1] for hit in hits])
+            i_tot = np.array([hit[2] for hit in hits])
+            x = pixels % np.uint64(self.width)
+            y = pixels // np.uint64(self.width)
+            data[:, self._positions] = np.uint64(TristanDefinitions.INTEGRAL_DATA_WORD) | \
+                ((x << np.uint64(37)) &
+                 np.uint64(TristanDefinitions.INTEGRAL_CHIP_X_MASK)) | \
+                ((y << np.uint64(24)) &
+                 np.uint64(TristanDefinitions.INTEGRAL_CHIP_Y_MASK)) | \
+                ((i_tot << np.uint64(10)) &
+                 np.uint64(TristanDefinitions.INTEGRAL_I_TOT_MASK)) | \
+                counts
+        data[:, -1] = TristanDefinitions.FINAL_PACKET_WORD
+
+        # Header 2 contains the count mode flag and the word count, header 3 the
+        # image number and packet ID
+        start = self._packet_start
+        image_index = images - np.uint64(self.first_time_slice)
+        timestamps = image_index * np.uint64(self._frame_ticks) + np.uint64(self._timestamp)
+        data[:, start] = TristanDefinitions.HEADER_WORD_1
+        data[:, start + 1] = np.uint64(TristanDefinitions.HEADER_WORD_2) | \
+            ((np.uint64(self.producer_id) << np.uint64(50)) &
+             np.uint64(TristanDefinitions.PRODUCER_ID_MASK)) | \
+            np.uint64(TristanDefinitions.COUNT_MODE) | \
+            ((self._packet_words - 1).astype(np.uint64) &
+             np.uint64(TristanDefinitions.WORD_COUNT_MASK))
+        data[:, start + 2] = np.uint64(TristanDefinitions.HEADER_WORD_3) | \
+            ((images[:, np.newaxis] << np.uint64(32)) &
+             np.uint64(TristanDefinitions.IMAGE_NUMBER_MASK)) | \
+            np.arange(self.packets_per_slice, dtype=np.uint64)
+        data[:, start + 3] = ((timestamps & np.uint64(TristanDefinitions.COURSE_TIMESTAMP_MASK)) |
+                              np.uint64(TristanDefinitions.TIMESTAMP_CONTROL_WORD))[:, np.newaxis]
+
+        packets = TristanPacketBuilder._views(data.ravel(),
+                                              self._packet_words.tolist() * len(images))
+        return TristanPacketBuilder.split_slices(packets, self.packets_per_slice)
+
+
+def split_endpoints(endpoints, no_of_groups):
+    """
+    Split a list of endpoints into groups, one for each event stream.
+
+    Endpoints are divided into contiguous groups whose sizes differ by at most one.
+    If there are fewer endpoints than groups they are shared, each group having
+    a single endpoint.
+
+    :param endpoints: list of (address, port) tuples
+    :param no_of_groups: number of groups required
+    :return: list of lists of (address, port) tuples
+    """
+    if len(endpoints) < no_of_groups:
+        return [[endpoints[index % len(endpoints)]] for index in range(no_of_groups)]
+    size, extra = divmod(len(endpoints), no_of_groups)
+    groups = []
+    start = 0
+    for index in range(no_of_groups):
+        end = start + size + (1 if index < extra else 0)
+        groups.append(endpoints[start:end])
+        start = end
+    return groups
+
+
 class Range(argparse.Action):
     """
     Range validating action for argument parser.
@@ -184,17 +861,60 @@ class TristanProducerDefaults(object):
         self.duration = 60.0
         self.drop_frac = 0
         self.drop_list = None
+        # Send rate per endpoint in packets/s or Gbit/s, if neither is set the
+        # rate is chosen to send the data packets over duration seconds
+        self.packet_rate = None
+        self.data_rate = None
+        # Packets sent back to back between waits, and socket send buffer size
+        self.burst = 1
+        self.send_buffer = None
+        # Send from one process per endpoint rather than one thread, optionally
+        # pinning the process for endpoint N to CPU cpu_list[N % len(cpu_list)]
+        self.sender_processes = False
+        self.cpu_list = None
+        # Packet corpus files to send from (one per stream) instead of generating
+        self.corpus = None
+        # Send count mode (image) packets instead of events, num_images images of
+        # image_width x image_height pixels with a fraction occupancy of the pixels
+        # hit, at frame_rate images/s if no other rate is set
+        self.count_mode = False
+        self.image_width = 2048
+        self.image_height = 512
+        self.num_images = 1000
+        self.frame_rate = None
+        self.occupancy = 0.01
 
 
 class TristanEventProducer(object):
     """
     Tristan event procducer.
     """
+    EVENTS_PER_PACKET = 800
+    EVENTS_PER_BATCH = 100000
+    PREFETCH_BATCHES = 4
 
-    def __init__(self, endpoints=None):
+    def __init__(self, endpoints=None, state=None, modules=None, seed=None):
         """
         Initialise the packet producer object, setting defaults and parsing command-line options.
+
+        :param endpoints: list of (address, port) tuples to send data packets to
+        :param state: GeneratorState of the event stream, a new state is created if None
+        :param modules: list of TristanModule objects, to generate an independent
+                        stream for each module sent to its own group of endpoints
+        :param seed: seed for the stream of each module
         """
+        # Event stream states, one for each module or a single stream
+        self._modules = modules
+        if modules:
+            self._states = [GeneratorState(seed=seed, stream_id=module.producer_id)
+                            for module in modules]
+        else:
+            if state is None:
+                state = GeneratorState(seed=seed)
+            self._states = [state]
+            self._modules = [None]
+        self._state = self._states[0]
+
         # IDLE packet record
         self._idle_packet = None
 
@@ -204,8 +924,8 @@ class TristanEventProducer(object):
         # Create an empty list for timeslice information
         self._ts = []
 
-        # Time slice container
-        self._time_slices = []
+        # Time slice packet sources for each stream, packets are built as they are sent
+        self._slice_sources = []
 
         # Start packet numbers from 0
         self._pkt_number = 0
@@ -218,24 +938,55 @@ class TristanEventProducer(object):
         else:
             self._endpoints = self.defaults.endpoints
 
-        self._no_of_ports = len(self._endpoints)
-
-        self._sent_packets = 0
+        # Time slices are routed round robin to the endpoints unless a UDP
+        # configuration is applied with set_routing
+        self.set_routing(UdpRouting(self._endpoints))
+        self._send_processes = []
         self._packets_to_send = 0
         self._last_log = 0
-        self._mutex = threading.Lock()
+
+    def set_routing(self, routing):
+        """
+        Send the time slices to the destinations of a routing table.  With more
+        than one event stream the destinations are split between the streams.
+
+        :param routing: UdpRouting of time slices to endpoints
+        """
+        self._routing = routing
+        self._endpoints = routing.endpoints
+        self._no_of_ports = len(self._endpoints)
+
+        # Each sender has an endpoint, a stream, its position within the group
+        # of endpoints that the stream is sent to and the routing of the group
+        self._senders = []
+        groups = split_endpoints(self._endpoints, len(self._states))
+        for stream, group_routing in enumerate(routing.split(groups)):
+            for group_index, endpoint in enumerate(group_routing.endpoints):
+                self._senders.append((endpoint, stream, group_index, group_routing))
+
+        # Packets, bytes, errors and timing of each sender, held in shared memory so
+        # that they can be updated by sender processes.  Each slot has a single writer.
+        self._telemetry = SenderTelemetry(len(self._senders),
+                                          ["{}:{}".format(endpoint[0], endpoint[1])
+                                           for endpoint, _, _, _ in self._senders])
+
+    @property
+    def _sent_packets(self):
+        return self._telemetry.packets()
+
+    @property
+    def telemetry(self):
+        return self._telemetry
 
     def init(self, num_events):
-        self._time_slices = []
+        self._slice_sources = []
         self.create_packets(num_events, 800)
 
-    def increment_packets_sent(self):
-        self._mutex.acquire()
-        self._sent_packets += 1
-        self._mutex.release()
+    def increment_packets_sent(self, index=0, size=0, pacer=None):
+        self._telemetry.sent(index, size, pacer)
 
     def arm(self):
-        self._sent_packets = 0
+        self._telemetry.reset()
         time.sleep(1.0)
 
     def run(self):
@@ -252,53 +1003,146 @@ class TristanEventProducer(object):
 
     def create_packets(self, total_events, per_slice):
         """
-        Generate all of the necessary packets.
+        Plan all of the necessary packets.  The packets of each time slice are
+        built on demand by the sending threads.
+
+        With several modules the events are divided equally between the module
+        streams.  If corpus files are configured the packets are sent from those
+        instead, and the parameters are ignored.
         """
         # First create the idle packet
         self._idle_packet = TristanIdlePacket().to_packet()
 
+        if self.defaults.corpus:
+            self._load_corpus(self.defaults.corpus)
+            return
+
+        if self.defaults.count_mode:
+            self._create_images()
+            return
+
+        stream_events = -(-total_events // len(self._states))
+        self._slice_sources = []
         self._pkt_number = 0
-        # Now create enough packets for the number of words
-        generated_events = 0
-        time_slice = 1
-
-        while generated_events < total_events:
-            time_slice_dict = {'id': time_slice, 'packets': [], 'ts': []}
-            # Generate a new packet
-            slice_events = 0
-#            this_slice = int(((random.random() * 0.2) + 0.8) * per_slice)
-            this_slice = per_slice
-            while slice_events < this_slice:
-                pkt = TristanPacket(800, time_slice)
-                #print("Packet length bytes: {}".format(len(pkt.to_packet())))
-                generated_events += 800
-                slice_events+=800
-
-                time_slice_dict['packets'].append(pkt.to_packet())
-                time_slice_dict['ts'].append(self._pkt_number)
-                #self._packets.append(pkt.to_packet())
-                #self._ts.append(self._pkt_number)
-                self._pkt_number += 1
-            print("Generated time slice {}".format(time_slice))
-            self._time_slices.append(time_slice_dict)
-            time_slice += 1
-            TristanData.PACKET_NUMBER=0
-            self._packets_to_send = self._pkt_number
+        for state, module in zip(self._states, self._modules):
+            source = TristanSliceSource(stream_events, per_slice,
+                                        words_per_packet=self.EVENTS_PER_PACKET,
+                                        events_per_batch=self.EVENTS_PER_BATCH,
+                                        prefetch=self.PREFETCH_BATCHES,
+                                        state=state, module=module)
+            self._slice_sources.append(source)
+            self._pkt_number += source.no_of_packets
+            print("Planned {} time slices".format(source.no_of_slices))
+            state.packet_number=0
+        self._packets_to_send = self._pkt_number
+
+    def _create_images(self):
+        """
+        Plan a run of count mode images, sent round robin by image number.
+        """
+        if len(self._states) > 1:
+            raise ValueError("Count mode images are generated as a single stream, not per module")
+        source = TristanImageSource(self.defaults.num_images, self.defaults.image_width,
+                                    self.defaults.image_height, self.defaults.occupancy,
+                                    frame_rate=self.defaults.frame_rate,
+                                    words_per_packet=self.EVENTS_PER_PACKET,
+                                    events_per_batch=self.EVENTS_PER_BATCH,
+                                    prefetch=self.PREFETCH_BATCHES,
+                                    state=self._state)
+        self._slice_sources = [source]
+        self._pkt_number = source.no_of_packets
+        self._packets_to_send = self._pkt_number
+        print("Planned {} images of {} packets".format(source.no_of_slices,
+                                                       source.packets_per_slice))
+
+    def _load_corpus(self, filenames):
+        """
+        Memory map a packet corpus file for each stream.
+        """
+        if not isinstance(filenames, (list, tuple)):
+            filenames = [filenames]
+        if len(filenames) != len(self._states):
+            raise ValueError("{} corpus files given for {} event streams".format(
+                len(filenames), len(self._states)))
+        self._slice_sources = []
+        self._pkt_number = 0
+        for filename in filenames:
+            source = PacketCorpus(filename)
+            self._slice_sources.append(source)
+            self._pkt_number += source.no_of_packets
+            print("Loaded {} time slices from {}".format(source.no_of_slices, filename))
+        self._packets_to_send = self._pkt_number
 
     def send_packets(self):
 
+        # Reap any sender processes left from a previous run
+        for process in self._send_processes:
+            process.join()
+        self._send_processes = []
+
         send_threads = []
-        logging.info("Launching threads to send packets to endpoints: {}".format(self._endpoints))
+        sender_processes = self.defaults.sender_processes
+        if sender_processes and SENDER_CONTEXT is None:
+            logging.warning("Sender processes need fork, which is not available, using threads")
+            sender_processes = False
+        if sender_processes:
+            logging.info("Launching processes to send packets to endpoints: {}".format(
+                self._endpoints))
+        else:
+            logging.info("Launching threads to send packets to endpoints: {}".format(
+                self._endpoints))
 
         index = 0
-        for endpoint in self._endpoints:
+        for endpoint, _, _, _ in self._senders:
             addr = endpoint[0]
             port = endpoint[1]
-            send_thread = threading.Thread(target=self._send_packets, args=(str(addr),int(port),int(index),self))
-            send_threads.append(send_thread)
-            send_thread.start()
+            args = (str(addr), int(port), int(index), self)
+            if sender_processes:
+                send_process = SENDER_CONTEXT.Process(target=self._process_send_packets,
+                                                      args=args)
+                send_process.daemon = True
+                self._send_processes.append(send_process)
+                send_process.start()
+            else:
+                send_thread = threading.Thread(target=self._send_packets, args=args)
+                send_threads.append(send_thread)
+                send_thread.start()
             index += 1
 
+    def _process_send_packets(self, addr, port, index, owner):
+        """
+        Sender process entry point, pin to a CPU if requested and send packets.
+        """
+        cpu_list = self.defaults.cpu_list
+        if cpu_list:
+            cpu = cpu_list[index % len(cpu_list)]
+            if hasattr(os, 'sched_setaffinity'):
+                os.sched_setaffinity(0, [cpu])
+                logging.info("Pinned sender for endpoint %s:%d to CPU %d", addr, port, cpu)
+            else:
+                logging.warning("CPU pinning is not supported, sender for %s:%d is not pinned",
+                                addr, port)
+        self._send_packets(addr, port, index, owner)
+
+    def _create_pacer(self, packet_count, fraction=1.0):
+        """
+        Create the pacer for one endpoint from the configured rate.
+
+        :param packet_count: number of data packets to send to the endpoint
+        :param fraction: fraction of the images routed to the endpoint
+        """
+        packet_rate = self.defaults.packet_rate
+        bit_rate = None
+        if self.defaults.data_rate:
+            bit_rate = self.defaults.data_rate * 1.0e9
+        elif not packet_rate and self.defaults.count_mode and self.defaults.frame_rate:
+            # Each endpoint of the group sends its share of the images
+            packets_per_image = self._slice_sources[0].packets_per_slice
+            packet_rate = float(self.defaults.frame_rate) * packets_per_image * fraction
+        elif not packet_rate and packet_count > 0 and self.defaults.duration > 0:
+            packet_rate = float(packet_count) / float(self.defaults.duration)
+        return PacketPacer(packet_rate=packet_rate, bit_rate=bit_rate, burst=self.defaults.burst)
+
     def _send_packets(self, addr, port, index, owner):
         """
         Send loaded packets over UDP socket.
@@ -327,41 +1171,39 @@ class TristanEventProducer(object):
                 logging.error("Got error sending frame packet: %s", exc)
                 break
 
-        # Packet delay is total duration / number of packets
-        packet_count = 0
-        for ts in self._time_slices:
-            if ts['id'] % self._no_of_ports == index:
-                packet_count += len(ts['packets'])
+        # Packet rate is number of packets / total duration unless a rate is set
+        _, stream, group_index, routing = self._senders[index]
+        source = self._slice_sources[stream]
+        time_slices = routing.frames(source.time_slices(), group_index)
+        packet_count = len(time_slices) * source.packets_per_slice
         logging.info("Sending %d data packets in %f seconds", packet_count, self.defaults.duration)
         data_bytes_sent = 0
         data_packets_sent = 0
-        delay = 1.0
-        if packet_count > 0:
-            delay = float(self.defaults.duration)/float(packet_count)
-        logging.info("Packet send delay %f", delay)
-        if delay < 0.001:
-            delay = 0.001
+        share = float(routing.shares[group_index]) / len(routing.table)
+        pacer = self._create_pacer(packet_count, share)
+        logging.info("Packet send rate %s", pacer.requested())
+        set_send_buffer(udp_socket, self.defaults.send_buffer)
+        pacer.start()
+        owner.telemetry.start(index)
 #        for packet, ts_id in zip(self._packets, self._ts):
-        for ts in self._time_slices:
-            if (ts['id'] - 1) % self._no_of_ports == index:
-                # Send the packet over the UDP socket
-                logging.info("Sending TS {} to endpoint {}:{}".format(ts['id'], addr, port))
-                for packet in ts['packets']:
-                    try:
-                    #logging.info("Checking port number for %d at index %d", ts_id, index)
-                        #logging.info("Sending UDP packet")
-                        data_bytes_sent += udp_socket.sendto(packet, (addr, port))
-                        #logging.info("Sent UDP packet")
-                        data_packets_sent += 1
-#                        owner._sent_packets += 1
-                        owner.increment_packets_sent()
-                        # Add 1 second delay
-                        time.sleep(delay)
-                        if data_packets_sent % 1000 == 0:
-                            logging.info("Sent %d packets", data_packets_sent)
-                    except socket.error as exc:
-                        logging.error("Got error sending frame packet: %s", exc)
-                        break
+        for ts_id, packets in source.iter_slices(time_slices):
+            # Send the packet over the UDP socket
+            logging.info("Sending TS {} to endpoint {}:{}".format(ts_id, addr, port))
+            for packet in packets:
+                try:
+                    pacer.wait(len(packet))
+                    sent_bytes = udp_socket.sendto(packet, (addr, port))
+                    data_bytes_sent += sent_bytes
+                    data_packets_sent += 1
+                    owner.increment_packets_sent(index, sent_bytes, pacer)
+                    if data_packets_sent % 1000 == 0:
+                        logging.info("Sent %d packets", data_packets_sent)
+                except socket.error as exc:
+                    owner.telemetry.error(index)
+                    logging.error("Got error sending frame packet: %s", exc)
+                    break
+        logging.info("Endpoint %s:%d requested %s, achieved %s", addr, port, pacer.requested(),
+                     pacer.achieved())
 
         time.sleep(1.0)
         idle_bytes_sent = 0
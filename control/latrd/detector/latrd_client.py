@@ -0,0 +1,273 @@
+"""
+Created on 18 October 2026
+
+Asynchronous request client for the detector control channel.
+
+A single I/O thread owns the DEALER socket connected to the detector.  Requests
+are queued by any thread and return a LATRDRequest immediately; the I/O thread
+sends them, matches each reply to its request by message ID and completes the
+request with the reply, or with None if there is no reply within the timeout.
+Queuing a request wakes the I/O thread through an inproc socket, so the thread
+sleeps in a single poll until there is a request, a reply or a timeout to
+handle.
+
+A request that cannot be sent is completed with None at once unless the
+detector has replied within the timeout, in which case the channel high water
+mark has been reached and the request is sent as soon as the channel accepts
+it.  Several requests can be in flight at once, so a slow reply to one request
+does not hold up any other, and the callers never wait on the socket or on each
+other.
+"""
+import collections
+import itertools
+import logging
+import threading
+import time
+import zmq
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from latrd_channel import LATRDChannel
+from latrd_message import LATRDMessage
+
+
+class LATRDRequest(object):
+    """
+    Request queued by LATRDClient, completed with the reply by the I/O thread.
+    """
+    def __init__(self, msg):
+        self.msg = msg
+        self._reply = None
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._callbacks = []
+
+    def done(self):
+        """
+        Return True once the request has been completed.
+        """
+        return self._event.is_set()
+
+    def result(self, timeout=None):
+        """
+        Wait for the request to complete.
+
+        :param timeout: time in seconds to wait, forever if None
+        :return: reply LATRDMessage, or None if the message could not be sent or
+                 there was no reply in time
+        """
+        self._event.wait(timeout)
+        return self._reply
+
+    def add_done_callback(self, callback):
+        """
+        Call a function with this request once it is complete.  The function is
+        called by the I/O thread, or immediately if the request is already
+        complete, so it must not block.
+        """
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def set_result(self, reply):
+        with self._lock:
+            self._reply = reply
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback(self)
+            except Exception as ex:
+                logging.error("Request callback failed: %s", ex)
+
+
+class LATRDClient(object):
+    """
+    Detector control client with a dedicated I/O thread.
+    """
+    # Time in ms to wait for a reply to each request
+    DEFAULT_TIMEOUT = 1000
+    # Inproc endpoints of the sockets that wake the I/O thread of each client
+    WAKE_ENDPOINT = "inproc://latrd-client-wake-{}"
+    _client_ids = itertools.count()
+
+    def __init__(self, endpoint, timeout=DEFAULT_TIMEOUT, context=None):
+        """
+        Create the client and start its I/O thread.
+
+        :param endpoint: detector control endpoint (eg tcp://127.0.0.1:7001)
+        :param timeout: time in ms to wait for the reply to a request
+        :param context: ZeroMQ context, the shared instance is used if None
+        """
+        self._endpoint = endpoint
+        self._timeout = timeout
+        self._context = context or zmq.Context.instance()
+        self._requests = queue.Queue()
+        # Requests waiting to be sent, and requests sent by message ID (a message
+        # may be sent more than once), all with their deadlines, and the time of
+        # the last reply (I/O thread only)
+        self._unsent = collections.deque()
+        self._pending = {}
+        self._last_reply = None
+        # Pair of sockets that wake the I/O thread, the sending end is shared by
+        # the calling threads under the lock
+        wake_endpoint = self.WAKE_ENDPOINT.format(next(self._client_ids))
+        self._wake_recv = self._context.socket(zmq.PAIR)
+        self._wake_recv.bind(wake_endpoint)
+        self._wake_send = self._context.socket(zmq.PAIR)
+        self._wake_send.connect(wake_endpoint)
+        self._wake_lock = threading.Lock()
+        self._running = True
+        self._thread = threading.Thread(target=self._io_loop)
+        self._thread.daemon = True
+        self._thread.start()
+
+    @property
+    def pending(self):
+        """
+        Number of requests waiting to be sent or for their replies.
+        """
+        return self._requests.qsize() + len(self._unsent) + \
+            sum(len(requests) for requests in self._pending.values())
+
+    def request(self, msg):
+        """
+        Queue a message for the detector without waiting for the reply.
+
+        :param msg: LATRDMessage to send
+        :return: LATRDRequest completed with the reply LATRDMessage, or None if
+                 the message could not be sent or there was no reply in time
+        """
+        request = LATRDRequest(msg)
+        if not self._running:
+            request.set_result(None)
+        else:
+            self._requests.put(request)
+            self._wake()
+        return request
+
+    def send_recv(self, msg):
+        """
+        Send a message and wait for the reply.
+
+        :param msg: LATRDMessage to send
+        :return: reply LATRDMessage, or None if there was no reply in time
+        """
+        return self.request(msg).result()
+
+    def close(self):
+        """
+        Stop the I/O thread, completing any outstanding requests with None.
+        """
+        self._running = False
+        self._wake()
+        self._thread.join()
+        self._wake_send.close()
+
+    def _wake(self):
+        with self._wake_lock:
+            try:
+                self._wake_send.send(b'', zmq.NOBLOCK)
+            except zmq.ZMQError:
+                # The I/O thread already has wake ups queued
+                pass
+
+    def _io_loop(self):
+        channel = LATRDChannel(LATRDChannel.CHANNEL_TYPE_DEALER, context=self._context)
+        channel.connect(self._endpoint)
+        poller = zmq.Poller()
+        poller.register(self._wake_recv, zmq.POLLIN)
+        while self._running:
+            self._send_requests(channel)
+            # Wait for a reply, a new request or the channel to accept a request
+            # held back by the high water mark, until the next deadline
+            poller.register(channel.socket, zmq.POLLIN | (zmq.POLLOUT if self._unsent else 0))
+            events = dict(poller.poll(self._poll_timeout()))
+            if events.get(self._wake_recv, 0) & zmq.POLLIN:
+                while self._wake_recv.poll(0):
+                    self._wake_recv.recv()
+            if events.get(channel.socket, 0) & zmq.POLLIN:
+                self._receive_replies(channel)
+            self._expire_requests()
+        # Discard any messages the detector has not taken, so the context can terminate
+        channel.socket.setsockopt(zmq.LINGER, 0)
+        channel.close()
+        self._wake_recv.close()
+        for requests in self._pending.values():
+            for request, _ in requests:
+                request.set_result(None)
+        self._pending = {}
+        for request, _ in self._unsent:
+            request.set_result(None)
+        self._unsent.clear()
+        while not self._requests.empty():
+            self._requests.get().set_result(None)
+
+    def _poll_timeout(self):
+        deadlines = [requests[0][1] for requests in self._pending.values()]
+        if self._unsent:
+            deadlines.append(self._unsent[0][1])
+        if not deadlines:
+            return None
+        return max(0, int((min(deadlines) - time.time()) * 1000.0) + 1)
+
+    def _detector_replying(self):
+        return self._last_reply is not None and \
+            time.time() - self._last_reply < self._timeout / 1000.0
+
+    def _send_requests(self, channel):
+        while True:
+            try:
+                request = self._requests.get_nowait()
+            except queue.Empty:
+                break
+            logging.debug("Message Request: %s", request.msg)
+            self._unsent.append((request, time.time() + self._timeout / 1000.0))
+        # Requests are sent in order, stopping at the first that cannot be sent
+        while self._unsent:
+            request, deadline = self._unsent[0]
+            if channel.send(request.msg) < 0:
+                if self._detector_replying():
+                    # High water mark reached, send once the channel accepts it
+                    break
+                # The detector is not available
+                self._unsent.popleft()
+                request.set_result(None)
+                continue
+            self._unsent.popleft()
+            self._pending.setdefault(request.msg.msg_id, collections.deque()).append(
+                (request, deadline))
+
+    def _receive_replies(self, channel):
+        while channel.poll(0) == LATRDChannel.POLLIN:
+            try:
+                reply = LATRDMessage.parse_json(channel.recv())
+            except Exception as ex:
+                logging.error("Failed to parse reply from detector: %s", ex)
+                continue
+            logging.debug("Reply: %s", reply)
+            self._last_reply = time.time()
+            requests = self._pending.get(reply.msg_id)
+            if not requests:
+                # The request has already timed out
+                logging.debug("Discarding reply to expired request %s", reply.msg_id)
+                continue
+            request, _ = requests.popleft()
+            if not requests:
+                del self._pending[reply.msg_id]
+            request.set_result(reply)
+
+    def _expire_requests(self):
+        now = time.time()
+        while self._unsent and self._unsent[0][1] < now:
+            self._unsent.popleft()[0].set_result(None)
+        for msg_id in list(self._pending):
+            requests = self._pending[msg_id]
+            while requests and requests[0][1] < now:
+                requests.popleft()[0].set_result(None)
+            if not requests:
+                del self._pending[msg_id]
@@ -0,0 +1,152 @@
+"""
+Created on 18 October 2026
+
+Persistent corpus of pre-generated Tristan packets.
+
+A corpus file holds the packets of a run of time slices back to back, followed
+by an index with the offset, length, time slice ID and packet number of every
+packet and a JSON description of the parameters the run was generated with:
+
+    header (4096 bytes) | packet data | index | JSON parameters
+
+The file is memory mapped for replay and packets are handed out as zero copy
+views of the mapped pages, so a corpus is ready to send as soon as it is opened.
+"""
+import json
+import mmap
+import struct
+
+import numpy as np
+
+
+CORPUS_MAGIC = b'TRISCORP'
+CORPUS_VERSION = 1
+# Packet data starts on a page boundary after the header
+CORPUS_DATA_OFFSET = 4096
+# Magic, version, index offset, number of packets, parameters offset and length
+CORPUS_HEADER = struct.Struct('<8sIQQQQ')
+
+CORPUS_INDEX_DTYPE = np.dtype([
+    ('offset', '<u8'),
+    ('length', '<u4'),
+    ('time_slice', '<u4'),
+    ('packet_number', '<u4')
+])
+
+
+class PacketCorpusError(Exception):
+    pass
+
+
+def write_corpus(filename, source, parameters=None):
+    """
+    Write every time slice of a packet source to a corpus file.
+
+    :param filename: corpus file to create
+    :param source: TristanSliceSource (or any object with the same interface)
+    :param parameters: dictionary of generation parameters to record in the file
+    :return: number of packets written
+    """
+    time_slices = list(source.time_slices())
+    index = np.zeros(source.no_of_packets, dtype=CORPUS_INDEX_DTYPE)
+    offset = CORPUS_DATA_OFFSET
+    count = 0
+    with open(filename, 'wb') as corpus_file:
+        corpus_file.write(b'\0' * CORPUS_DATA_OFFSET)
+        for ts_id, packets in source.iter_slices(time_slices):
+            for packet_number, packet in enumerate(packets):
+                index[count] = (offset, len(packet), ts_id, packet_number)
+                corpus_file.write(packet)
+                offset += len(packet)
+                count += 1
+
+        description = dict(parameters or {})
+        description.update({
+            'no_of_slices': source.no_of_slices,
+            'packets_per_slice': source.packets_per_slice,
+            'first_time_slice': source.first_time_slice
+        })
+        meta = json.dumps(description, sort_keys=True).encode('utf-8')
+        index_offset = offset
+        corpus_file.write(index[:count].tobytes())
+        meta_offset = index_offset + index[:count].nbytes
+        corpus_file.write(meta)
+
+        corpus_file.seek(0)
+        corpus_file.write(CORPUS_HEADER.pack(CORPUS_MAGIC, CORPUS_VERSION, index_offset,
+                                             count, meta_offset, len(meta)))
+    return count
+
+
+class PacketCorpus(object):
+    """
+    Memory mapped corpus of packets.
+
+    Provides the same interface as TristanSliceSource (time_slices, build and
+    iter_slices), so the event producer can send from either.  Packets are
+    memoryview slices of the mapped file.
+    """
+    def __init__(self, filename):
+        """
+        Open and map a corpus file.
+
+        :param filename: corpus file written by write_corpus
+        """
+        self.filename = filename
+        with open(filename, 'rb') as corpus_file:
+            self._mmap = mmap.mmap(corpus_file.fileno(), 0, access=mmap.ACCESS_READ)
+        self._data = np.frombuffer(self._mmap, dtype=np.uint8)
+
+        magic, version, index_offset, count, meta_offset, meta_length = \
+            CORPUS_HEADER.unpack_from(self._mmap, 0)
+        if magic != CORPUS_MAGIC:
+            raise PacketCorpusError("{} is not a packet corpus file".format(filename))
+        if version != CORPUS_VERSION:
+            raise PacketCorpusError("Unsupported packet corpus version {} in {}".format(
+                version, filename))
+
+        self.index = np.frombuffer(self._mmap, dtype=CORPUS_INDEX_DTYPE, count=count,
+                                   offset=index_offset)
+        meta = self._mmap[meta_offset:meta_offset + meta_length]
+        self.parameters = json.loads(meta.decode('utf-8'))
+        self.packets_per_slice = self.parameters['packets_per_slice']
+        self.no_of_slices = self.parameters['no_of_slices']
+        self.first_time_slice = self.parameters['first_time_slice']
+
+    @property
+    def no_of_packets(self):
+        return len(self.index)
+
+    def time_slices(self):
+        """
+        Return the time slice numbers of the corpus in order.
+        """
+        return range(self.first_time_slice, self.first_time_slice + self.no_of_slices)
+
+    def build(self, time_slices):
+        """
+        Return the packets of a list of time slices.
+
+        :param time_slices: time slice numbers
+        :return: list of packet memoryview lists, one per time slice
+        """
+        view = memoryview(self._data)
+        slice_packets = []
+        for ts_id in time_slices:
+            first = (ts_id - self.first_time_slice) * self.packets_per_slice
+            entries = self.index[first:first + self.packets_per_slice]
+            offsets = entries['offset'].tolist()
+            lengths = entries['length'].tolist()
+            slice_packets.append([view[offset:offset + length]
+                                  for offset, length in zip(offsets, lengths)])
+        return slice_packets
+
+    def iter_slices(self, time_slices):
+        """
+        Iterate over the packets of a sequence of time slices.
+
+        :param time_slices: time slice numbers, in the order required
+        :return: generator of (time slice number, list of packet memoryviews) tuples
+        """
+        for ts_id in time_slices:
+            yield ts_id, self.build([ts_id])[0]
@@ -0,0 +1,414 @@
+"""
+Created on 18 October 2026
+
+Replay of the Tristan packets of a capture to UDP destinations, shared by the
+time slice (latrd_pcap_replay.py) and image (latrd_image_pcap_replay.py)
+replay tools.
+
+A loaded capture is planned in one go and each destination is sent its packets
+spread over the duration, paced by their capture timestamps, or as fast as
+possible.  A streamed capture is read in batches that are planned with a single
+streaming send plan and queued for the sender of each destination, so only the
+queued packets are held in memory.  The packet index of the capture (about 56
+bytes a packet) is still built, or read from its sidecar, before the first
+packet is sent.
+"""
+import logging
+import random
+import socket
+import threading
+import time
+
+import numpy as np
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+from latrd.pcap import TRISTAN_HEADER_SIZE
+from latrd.detector.send_plan import SendPlan, StreamingSendPlan
+from latrd.detector.udp_pacer import CapturePacer
+from latrd.detector.udp_routing import UdpRouting
+
+
+class PcapReplay(object):
+    """
+    Replay of the selected packets of a capture.
+
+    The replay tools parse their command line into args, open the capture as
+    pcap and select the packets to send, routing the packets by the frame number
+    in the FRAME_FIELD of the packet index.
+    """
+    # Packet index field of the frame number that packets are routed by
+    FRAME_FIELD = 'time_slice'
+    # Number of packets planned and queued at a time when streaming
+    STREAM_BATCH = 1000
+
+    def __init__(self):
+        self.args = None
+        self.pcap = None
+
+        # IDLE packet record
+        self._idle_packet = None
+
+        # Loaded packets, with their frame and packet numbers
+        self._packets = []
+        self._frames = []
+        self._pkt_ids = []
+
+        # Capture timestamp of each packet and of the first packet sent, in ns, and
+        # the clock reading that the senders to every port pace from
+        self._times = []
+        self._origin = None
+        self._pacer_start = None
+        self._pacer_lock = threading.Lock()
+
+        # Routing of frames to destinations, and send plan for each destination
+        self._routing = None
+        self._plan = None
+        self._no_of_ports = 1
+
+        # Streaming mode queues of packet lists for each port, the reader state and
+        # the estimated number of packets sent to each port
+        self._queues = []
+        self._reader = None
+        self._idle_ready = threading.Event()
+        self._estimated_sends = None
+
+    def select(self):
+        """
+        Return the record indices of the capture packets to send.
+        """
+        raise NotImplementedError
+
+    def run(self):
+        """
+        Run the frame producer.
+        """
+        if isinstance(self.args.ports, str):
+            self.args.ports = [self.args.ports]
+        if self.args.udp_config:
+            self._routing = UdpRouting.from_file(self.args.udp_config)
+        else:
+            self._routing = UdpRouting([(self.args.ip_addr, port) for port in self.args.ports])
+        self._no_of_ports = self._routing.no_of_endpoints
+
+        if self.args.stream:
+            self.stream_pcap()
+        else:
+            self.load_pcap()
+            self.create_plan()
+        self.send_packets()
+
+    def _read_pcap(self, records):
+        """
+        Iterate over the selected LATRD data packets of the capture file.
+
+        The first idle packet of the capture is recorded.
+
+        :param records: record indices of the selected packets
+        :return: generator of (packet, frame number, packet number, capture time) tuples
+        """
+        index = self.pcap.packet_index()
+        ignored = np.count_nonzero(index['length'] < TRISTAN_HEADER_SIZE)
+        if ignored:
+            logging.debug("Ignoring %d packets shorter than a packet header...", ignored)
+
+        # Record the first idle packet
+        idle = self.pcap.idle_records()
+        if self._idle_packet is None and len(idle):
+            logging.debug("IDLE Packet processed...")
+            self._idle_packet = self.pcap.payload(int(idle[0]))
+
+        logging.debug("Selected %d of %d packets", len(records), len(index))
+
+        # Record the source frame so that we can use it for routing
+        frames = index[self.FRAME_FIELD][records].tolist()
+        packet_ids = index['packet_number'][records].tolist()
+        times = index['timestamp_ns'][records].tolist()
+
+        # Pass on the packets exactly as recorded
+        for record, frame, packet_id, capture_time in zip(records.tolist(), frames, packet_ids,
+                                                          times):
+            yield self.pcap.payload(record), frame, packet_id, capture_time
+
+    def load_pcap(self):
+        """
+        Load frame packets from a packet capture file.
+        """
+        logging.info(
+            "Extracting LATRD packets from PCAP file %s",
+            self.args.pcap_file.name
+        )
+
+        for packet, frame, packet_id, capture_time in self._read_pcap(self.select()):
+            self._packets.append(packet)
+            self._pkt_ids.append(packet_id)
+            self._times.append(capture_time)
+            self._frames.append(frame)
+        if self._times:
+            self._origin = min(self._times)
+
+        logging.debug("Number of data packets processed: %d", len(self._packets))
+
+    def stream_pcap(self):
+        """
+        Start reading frame packets from the packet capture file in a background
+        thread, queueing them for the sender of each port as they are read.
+        """
+        logging.info(
+            "Streaming LATRD packets from PCAP file %s",
+            self.args.pcap_file.name
+        )
+        self._queues = [queue.Queue(maxsize=self.args.queue_depth)
+                        for _ in range(self._no_of_ports)]
+        # The number of packets routed to each port (for the send delay) and the
+        # first capture time of the selected packets are known from the capture index
+        records = self.select()
+        index = self.pcap.packet_index()
+        routed = np.bincount(self._routing.endpoint_indices(index[self.FRAME_FIELD][records]),
+                             minlength=self._no_of_ports)
+        scale = (1.0 - (self.args.drop_frac or 0.0)) * (1.0 + (self.args.dup_frac or 0.0))
+        self._estimated_sends = [int(count * scale) for count in routed.tolist()]
+        if len(records):
+            self._origin = int(index['timestamp_ns'][records].min())
+        self._reader = threading.Thread(target=self._stream_reader, args=(records,))
+        self._reader.daemon = True
+        self._reader.start()
+
+    def _stream_reader(self, records):
+        """
+        Read the capture in batches of packets, planning each batch with a single
+        streaming send plan and queueing the packets of each port.  The packets
+        are sent exactly as a loaded capture would be with the same seed, and
+        memory use is bounded by the depth of the port queues.
+        """
+        seed = self.args.seed
+        if seed is None:
+            seed = random.randint(0, 2**31 - 1)
+        plan = StreamingSendPlan(self._no_of_ports,
+                                 drop_frac=self.args.drop_frac, drop_list=self.args.drop_list,
+                                 reorder=self.args.reorder, duplicate_frac=self.args.dup_frac,
+                                 seed=seed, routing=self._routing)
+        batch = []
+        try:
+            for item in self._read_pcap(records):
+                batch.append(item)
+                self._idle_ready.set()
+                if len(batch) == self.STREAM_BATCH:
+                    self._queue_batch(plan, batch)
+                    batch = []
+            self._queue_batch(plan, batch)
+            self._queue_released(plan.finish())
+        finally:
+            self._idle_ready.set()
+            # None signifies the end of the capture
+            for port_queue in self._queues:
+                port_queue.put(None)
+
+        plan.write_manifest(self.args.manifest, self._manifest_options())
+        manifest = plan.manifest()
+        logging.info("Streamed %d packets, dropped %d (seed %d), manifest written to %s",
+                     manifest['packets'], manifest['dropped'], seed, self.args.manifest)
+
+    def _queue_batch(self, plan, batch):
+        """
+        Plan a batch of packets and queue the packets of each port released by
+        the plan.
+        """
+        if batch:
+            _, frames, packet_ids, _ = zip(*batch)
+            self._queue_released(plan.add(frames, packet_ids, batch))
+
+    def _queue_released(self, released):
+        for items, port_queue in zip(released, self._queues):
+            if items:
+                port_queue.put(([item[0] for item in items], [item[3] for item in items]))
+
+    def _manifest_options(self):
+        return {
+            'pcap_file': self.args.pcap_file.name,
+            'address': self.args.ip_addr,
+            'ports': self.args.ports,
+            'destinations': self._routing.endpoints
+        }
+
+    def create_plan(self):
+        """
+        Decide which packets to drop, reorder and duplicate for each port, and
+        write the manifest.
+        """
+        self._plan = SendPlan(self._frames, self._pkt_ids, self._no_of_ports,
+                              drop_frac=self.args.drop_frac, drop_list=self.args.drop_list,
+                              reorder=self.args.reorder, duplicate_frac=self.args.dup_frac,
+                              seed=self.args.seed, routing=self._routing)
+        self._plan.write_manifest(self.args.manifest, self._manifest_options())
+        logging.info("Dropping %d of %d packets (seed %d), manifest written to %s",
+                     self._plan.manifest()['dropped'], len(self._packets), self._plan.seed,
+                     self.args.manifest)
+
+    def send_packets(self):
+
+        send_threads = []
+        logging.info("Launching threads to send packets to {} destinations".format(
+            self._no_of_ports
+        ))
+
+        index = 0
+        for endpoint in self._routing.endpoints:
+            send_thread = threading.Thread(target=self._send_packets, args=(endpoint, int(index)))
+            send_threads.append(send_thread)
+            send_thread.start()
+            index += 1
+
+    def _send_packets(self, endpoint, index):
+        """
+        Send loaded packets over UDP socket.
+        """
+
+        # Create the UDP socket
+        udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+        if udp_socket is None:
+            logging.error("Failed to open UDP socket")
+            return
+
+        if self.args.stream:
+            # Wait for the reader to find the idle packet and start queueing data
+            self._idle_ready.wait()
+            if self._idle_packet is None:
+                logging.warning("No IDLE packet in the capture, not sending IDLE packets")
+
+        self._send_idle_packets(udp_socket, endpoint)
+
+        if self.args.stream:
+            self._send_streamed_packets(udp_socket, endpoint, index)
+        elif self.args.speed or self.args.max_rate:
+            order = self._plan.order(index)
+            self._send_timed_packets(udp_socket, endpoint,
+                                     [self._packets[packet_index] for packet_index in order],
+                                     [self._times[packet_index] for packet_index in order])
+        else:
+            # Packet delay is total duration / number of packets sent to this port,
+            # including duplicates and excluding drops
+            sends = len(self._plan.order(index))
+            logging.info("Sending %d data packets in %f seconds", sends, self.args.duration)
+            data_bytes_sent = 0
+            data_packets_sent = 0
+            delay = float(self.args.duration)/float(max(1, sends))
+            packets = self._packets
+            try:
+                for chunk in self._plan.chunks(index, self.args.pkt_gap):
+                    for packet_index in chunk:
+                        # Send the packet over the UDP socket
+                        data_bytes_sent += udp_socket.sendto(packets[packet_index], endpoint)
+                        data_packets_sent += 1
+                        if delay > 0.001:
+                            time.sleep(delay)
+                    if self.args.pkt_gap:
+                        time.sleep(self.args.gap_time)
+            except socket.error as exc:
+                logging.error("Got error sending frame packet: %s", exc)
+
+        time.sleep(1.0)
+        self._send_idle_packets(udp_socket, endpoint)
+
+        udp_socket.close()
+
+    def _send_idle_packets(self, udp_socket, endpoint):
+        """
+        Send idle packets at a rate of 1Hz.
+        """
+        idle_packets = int(self.args.num_idle) if self._idle_packet is not None else 0
+        logging.info("Sending %d idle packets at 1 Hz", idle_packets)
+        for _ in range(idle_packets):
+            # Send the packet over the UDP socket
+            try:
+                udp_socket.sendto(self._idle_packet, endpoint)
+                # Add 1 second delay
+                time.sleep(1.0)
+            except socket.error as exc:
+                logging.error("Got error sending frame packet: %s", exc)
+                break
+
+    def _send_streamed_packets(self, udp_socket, endpoint, index):
+        """
+        Send the packets queued for a destination by the capture reader.
+        """
+        logging.info("Streaming data packets to %s:%d in %f seconds", endpoint[0], endpoint[1],
+                     self.args.duration)
+        data_bytes_sent = 0
+        data_packets_sent = 0
+        # Packet delay is total duration / estimated number of packets sent to this port
+        delay = float(self.args.duration)/float(max(1, self._estimated_sends[index]))
+        sending = True
+        port_queue = self._queues[index]
+        pacer = None
+        while True:
+            batch = port_queue.get()
+            if batch is None:
+                break
+            if not sending:
+                # Keep draining the queue so that the reader is not blocked
+                continue
+            packets, times = batch
+            if self.args.speed or self.args.max_rate:
+                # Pacing starts when the first packets are ready to send
+                if pacer is None:
+                    pacer = self._create_pacer(endpoint)
+                sending = self._send_paced(udp_socket, endpoint, pacer, packets, times)
+                continue
+            try:
+                for packet in packets:
+                    # Send the packet over the UDP socket
+                    data_bytes_sent += udp_socket.sendto(packet, endpoint)
+                    data_packets_sent += 1
+                    if delay > 0.001:
+                        time.sleep(delay)
+                    if self.args.pkt_gap and data_packets_sent % self.args.pkt_gap == 0:
+                        time.sleep(self.args.gap_time)
+            except socket.error as exc:
+                logging.error("Got error sending frame packet: %s", exc)
+                sending = False
+        if pacer is not None:
+            logging.info("%s:%d achieved %s", endpoint[0], endpoint[1], pacer.achieved())
+        else:
+            logging.info("Sent %d data packets (%d bytes) to %s:%d", data_packets_sent,
+                         data_bytes_sent, endpoint[0], endpoint[1])
+
+    def _create_pacer(self, endpoint):
+        pacer = CapturePacer(speed=None if self.args.max_rate else self.args.speed,
+                             origin=self._origin)
+        logging.info("Sending data packets to %s:%d at %s", endpoint[0], endpoint[1],
+                     pacer.requested())
+        # The first sender to start sets the clock reading that every port paces
+        # from, so the ports stay aligned however late their first packets are
+        with self._pacer_lock:
+            pacer.start(self._pacer_start)
+            self._pacer_start = pacer.start_time
+        return pacer
+
+    def _send_timed_packets(self, udp_socket, endpoint, packets, times):
+        """
+        Send loaded packets with the timing of the capture, or as fast as possible.
+        """
+        pacer = self._create_pacer(endpoint)
+        self._send_paced(udp_socket, endpoint, pacer, packets, times)
+        logging.info("%s:%d achieved %s", endpoint[0], endpoint[1], pacer.achieved())
+
+    def _send_paced(self, udp_socket, endpoint, pacer, packets, times):
+        """
+        Send a list of packets paced by their capture timestamps.
+
+        :return: False if sending failed
+        """
+        try:
+            for packet, capture_time in zip(packets, times):
+                pacer.wait(len(packet), capture_time)
+                udp_socket.sendto(packet, endpoint)
+                if self.args.pkt_gap and pacer.packets % self.args.pkt_gap == 0:
+                    pacer.pause(self.args.gap_time)
+        except socket.error as exc:
+            logging.error("Got error sending frame packet: %s", exc)
+            return False
+        return True
@@ -0,0 +1,286 @@
+"""
+Created on 18 October 2026
+
+Precomputed packet send plans for the replay and packet generator tools.
+
+Packets are assigned to endpoints by frame (time slice or image number), round
+robin or by the UdpRouting table of a UDP configuration.  The packets to drop,
+the reordering of packets within small windows and the packets to send twice
+are all decided up front with NumPy operations, so the send loops only walk a
+list of packet indices.  A manifest of every packet that was dropped or
+duplicated can be written for comparison with the receiver statistics.
+
+The drops, and the reordering and duplicates of each endpoint, are drawn from
+their own random streams in packet order, so a capture planned batch by batch
+as it is streamed (StreamingSendPlan) is sent exactly as if it had been planned
+in one go.
+"""
+import json
+
+import numpy as np
+
+
+def _isin(values, test_values):
+    if hasattr(np, 'isin'):
+        return np.isin(values, test_values)
+    return np.in1d(values, test_values)
+
+
+class _PacketPlanner(object):
+    """
+    Drops, reordering and duplicates of the packets of each endpoint, decided in
+    capture order, and the manifest of the packets dropped and duplicated.
+    """
+    # Keys of the random streams of the reordering and duplicates of each endpoint
+    REORDER_STREAM = 1
+    DUPLICATE_STREAM = 2
+
+    def __init__(self, no_of_ports, drop_frac=0.0, drop_list=None, reorder=0,
+                 duplicate_frac=0.0, seed=None, routing=None):
+        """
+        :param no_of_ports: number of endpoints, frame N is sent to endpoint N % no_of_ports
+        :param drop_frac: fraction of packets to drop at random
+        :param drop_list: packet numbers to drop from every frame
+        :param reorder: shuffle the packets of each endpoint within windows of this many packets
+        :param duplicate_frac: fraction of the remaining packets to send twice
+        :param seed: random seed, a seed is chosen (and recorded) if None
+        :param routing: UdpRouting of frames to endpoints, used instead of round robin
+        """
+        self.no_of_ports = no_of_ports
+        self.drop_frac = drop_frac or 0.0
+        self.drop_list = list(drop_list or [])
+        self.reorder = reorder or 0
+        self.duplicate_frac = duplicate_frac or 0.0
+        if seed is None:
+            seed = int(np.random.randint(0, 2**31 - 1))
+        self.seed = seed
+        self._routing = routing
+        self._drop_state = np.random.RandomState(seed)
+        self._reorder_states = [np.random.RandomState([seed, self.REORDER_STREAM, index])
+                                for index in range(no_of_ports)]
+        self._duplicate_states = [np.random.RandomState([seed, self.DUPLICATE_STREAM, index])
+                                  for index in range(no_of_ports)]
+        self._packets = 0
+        # Index, frame and packet number of the packets of each endpoint held back
+        # until their reorder window is complete
+        empty = np.zeros(0, dtype=np.int64)
+        self._pending = [(empty, empty, empty) for _ in range(no_of_ports)]
+        # Manifest entries of each endpoint
+        self._assigned = [0] * no_of_ports
+        self._sent = [0] * no_of_ports
+        self._reordered = [0] * no_of_ports
+        self._dropped = [[] for _ in range(no_of_ports)]
+        self._duplicated = [[] for _ in range(no_of_ports)]
+
+    def _add(self, frames, packet_numbers):
+        """
+        Plan the next packets, in capture order.
+
+        :return: list of the packet indices released to each endpoint, in send order
+        """
+        frames = np.asarray(frames, dtype=np.int64)
+        packet_numbers = np.asarray(packet_numbers, dtype=np.int64)
+        indices = np.arange(self._packets, self._packets + len(frames), dtype=np.int64)
+        self._packets += len(frames)
+        if self._routing is not None:
+            endpoints = self._routing.endpoint_indices(frames)
+        else:
+            endpoints = frames % self.no_of_ports
+        dropped = np.zeros(len(frames), dtype=bool)
+        if self.drop_frac > 0.0:
+            dropped |= self._drop_state.random_sample(len(frames)) < self.drop_frac
+        if self.drop_list:
+            dropped |= _isin(packet_numbers, self.drop_list)
+
+        released = []
+        for index in range(self.no_of_ports):
+            assigned = endpoints == index
+            self._assigned[index] += int(np.count_nonzero(assigned))
+            lost = assigned & dropped
+            self._dropped[index].extend(
+                np.column_stack((frames[lost], packet_numbers[lost])).tolist())
+            keep = assigned & ~dropped
+            pending = [np.concatenate((held, new[keep])) for held, new in
+                       zip(self._pending[index], (indices, frames, packet_numbers))]
+            # Only whole reorder windows are released
+            ready = len(pending[0])
+            if self.reorder > 1:
+                ready -= ready % self.reorder
+            released.append(self._release(index, [field[:ready] for field in pending]))
+            self._pending[index] = [field[ready:] for field in pending]
+        return released
+
+    def _finish(self):
+        """
+        Release the packets held back in the final (partial) reorder windows.
+        """
+        released = [self._release(index, self._pending[index])
+                    for index in range(self.no_of_ports)]
+        empty = np.zeros(0, dtype=np.int64)
+        self._pending = [(empty, empty, empty) for _ in range(self.no_of_ports)]
+        return released
+
+    def _release(self, index, packets):
+        indices, frames, packet_numbers = packets
+        positions = np.arange(len(indices))
+        if self.reorder > 1 and len(positions) > 1:
+            # Sorting on window number plus a random fraction shuffles each window
+            keys = positions // self.reorder + \
+                self._reorder_states[index].random_sample(len(positions))
+            shuffled = np.argsort(keys, kind='mergesort')
+            self._reordered[index] += int(np.count_nonzero(shuffled != positions))
+            positions = shuffled
+        if self.duplicate_frac > 0.0 and len(positions):
+            # Each duplicate is sent immediately after the original
+            duplicates = self._duplicate_states[index].random_sample(len(positions)) < \
+                self.duplicate_frac
+            duplicated = np.sort(positions[duplicates])
+            self._duplicated[index].extend(
+                np.column_stack((frames[duplicated], packet_numbers[duplicated])).tolist())
+            positions = np.repeat(positions, duplicates.astype(np.intp) + 1)
+        self._sent[index] += len(positions)
+        return indices[positions]
+
+    def manifest(self):
+        """
+        Return a description of the plan, listing the frame and packet number of
+        every dropped and duplicated packet for each endpoint.
+        """
+        endpoints = []
+        for index in range(self.no_of_ports):
+            endpoints.append({
+                'index': index,
+                'packets': self._assigned[index],
+                'sent': self._sent[index],
+                'dropped': self._dropped[index],
+                'duplicated': self._duplicated[index],
+                'reordered': self._reordered[index]
+            })
+        return {
+            'seed': self.seed,
+            'drop_frac': self.drop_frac,
+            'drop_list': self.drop_list,
+            'reorder': self.reorder,
+            'duplicate_frac': self.duplicate_frac,
+            'packets': self._packets,
+            'dropped': sum(len(dropped) for dropped in self._dropped),
+            'endpoints': endpoints
+        }
+
+    def write_manifest(self, filename, extra=None):
+        """
+        Write the manifest to a JSON file.
+
+        :param filename: manifest file name
+        :param extra: dictionary of additional entries (eg the tool options)
+        """
+        manifest = self.manifest()
+        if extra:
+            manifest.update(extra)
+        with open(filename, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=2)
+
+
+class SendPlan(_PacketPlanner):
+    """
+    Send order of a set of packets for each endpoint.
+    """
+    def __init__(self, frames, packet_numbers, no_of_ports, drop_frac=0.0, drop_list=None,
+                 reorder=0, duplicate_frac=0.0, seed=None, routing=None):
+        """
+        Create the send plan.
+
+        :param frames: frame (time slice or image) number of each packet
+        :param packet_numbers: packet number within its frame of each packet
+        :param no_of_ports: number of endpoints, frame N is sent to endpoint N % no_of_ports
+        :param drop_frac: fraction of packets to drop at random
+        :param drop_list: packet numbers to drop from every frame
+        :param reorder: shuffle the packets of each endpoint within windows of this many packets
+        :param duplicate_frac: fraction of the remaining packets to send twice
+        :param seed: random seed, a seed is chosen (and recorded) if None
+        :param routing: UdpRouting of frames to endpoints, used instead of round robin
+        """
+        super(SendPlan, self).__init__(no_of_ports, drop_frac, drop_list, reorder,
+                                       duplicate_frac, seed, routing)
+        orders = [[] for _ in range(no_of_ports)]
+        for released in (self._add(frames, packet_numbers), self._finish()):
+            for index, order in enumerate(released):
+                orders[index].append(order)
+        self._orders = [np.concatenate(order) for order in orders]
+
+    def order(self, index):
+        """
+        Return the indices of the packets to send to an endpoint, in send order.
+
+        :param index: endpoint index
+        :return: list of packet indices
+        """
+        return self._orders[index].tolist()
+
+    def chunks(self, index, pkt_gap=None):
+        """
+        Return the send order of an endpoint split into chunks of pkt_gap packets,
+        so that a pause can be made between chunks.
+
+        :param index: endpoint index
+        :param pkt_gap: number of packets between pauses, None or 0 for a single chunk
+        :return: list of lists of packet indices
+        """
+        order = self.order(index)
+        if not pkt_gap:
+            return [order]
+        return [order[start:start + pkt_gap] for start in range(0, len(order), pkt_gap)]
+
+
+class StreamingSendPlan(_PacketPlanner):
+    """
+    Send plan built batch by batch as a capture is read.
+
+    Each batch of packets releases the packets of each endpoint whose reorder
+    window is complete, and finish releases the rest, so the packets are sent
+    exactly as by a SendPlan of the whole capture with the same options and
+    seed.  Only the packets held back for reordering are kept, so there is no
+    send order to split into chunks; the sender pauses every pkt_gap packets as
+    it sends the released packets.
+    """
+    def __init__(self, no_of_ports, drop_frac=0.0, drop_list=None, reorder=0,
+                 duplicate_frac=0.0, seed=None, routing=None):
+        """
+        Create the send plan, see SendPlan for the parameters.
+        """
+        super(StreamingSendPlan, self).__init__(no_of_ports, drop_frac, drop_list, reorder,
+                                                duplicate_frac, seed, routing)
+        self._items = {}
+
+    def add(self, frames, packet_numbers, items):
+        """
+        Plan the next batch of packets.
+
+        :param frames: frame (time slice or image) number of each packet
+        :param packet_numbers: packet number within its frame of each packet
+        :param items: the packets (or any per packet object) to hand back
+        :return: list of the items released to each endpoint, in send order
+        """
+        first = self._packets
+        self._items.update(zip(range(first, first + len(items)), items))
+        return self._items_of(self._add(frames, packet_numbers))
+
+    def finish(self):
+        """
+        Release the remaining packets at the end of the capture.
+
+        :return: list of the items released to each endpoint, in send order
+        """
+        return self._items_of(self._finish())
+
+    def _items_of(self, released):
+        items = [[self._items[packet_index] for packet_index in order.tolist()]
+                 for order in released]
+        # Drop the items that have now been released to every endpoint
+        held = set()
+        for pending in self._pending:
+            held.update(pending[0].tolist())
+        for packet_index in list(self._items):
+            if packet_index not in held:
+                del self._items[packet_index]
+        return items
@@ -0,0 +1,171 @@
+"""
+Created on 18 October 2026
+
+Telemetry for the simulated detector UDP senders.
+
+Every sender owns a slot of counters in shared memory (so that sender processes
+can update them) which it updates for each packet: packets, bytes and send errors,
+how far it is behind its pacing schedule and the interval since the previous
+packet, kept in a ring of recent intervals.  Each slot has a single writer, so no
+locking is required, and the counters are read and summarised by a sampler on a
+timer rather than on every control message.
+"""
+import ctypes
+import multiprocessing
+
+import numpy as np
+
+try:
+    from .udp_pacer import _clock
+except (ImportError, ValueError):
+    from udp_pacer import _clock
+
+
+class SenderTelemetry(object):
+    """
+    Shared memory counters for a set of UDP senders.
+    """
+    # Counters of each sender
+    PACKETS = 0
+    BYTES = 1
+    ERRORS = 2
+    COUNTERS = 3
+    # Times of each sender: clock at start and last packet, and pacing lag
+    START = 0
+    LAST = 1
+    LAG = 2
+    TIMES = 3
+    # Recent inter-packet intervals kept for the jitter percentiles
+    SAMPLES = 1024
+    PERCENTILES = [50, 90, 99]
+
+    def __init__(self, no_of_senders, names=None):
+        """
+        Create the counters.
+
+        :param no_of_senders: number of senders
+        :param names: name of each sender (eg its endpoint) for the summaries
+        """
+        self.no_of_senders = no_of_senders
+        self.names = names or [str(index) for index in range(no_of_senders)]
+        self._counters = multiprocessing.RawArray(ctypes.c_ulonglong, no_of_senders * self.COUNTERS)
+        self._times = multiprocessing.RawArray(ctypes.c_double, no_of_senders * self.TIMES)
+        self._intervals = multiprocessing.RawArray(ctypes.c_double, no_of_senders * self.SAMPLES)
+        # Counters at the previous sample, for the current rates (sampler only)
+        self._previous = [(0, 0, None)] * no_of_senders
+
+    def reset(self):
+        """
+        Zero all of the counters.
+        """
+        ctypes.memset(self._counters, 0, ctypes.sizeof(self._counters))
+        ctypes.memset(self._times, 0, ctypes.sizeof(self._times))
+        ctypes.memset(self._intervals, 0, ctypes.sizeof(self._intervals))
+        self._previous = [(0, 0, None)] * self.no_of_senders
+
+    def start(self, index):
+        """
+        Mark the start of sending for a sender.
+
+        :param index: sender index
+        """
+        now = _clock()
+        self._times[index * self.TIMES + self.START] = now
+        self._times[index * self.TIMES + self.LAST] = now
+
+    def sent(self, index, size, pacer=None):
+        """
+        Account for a packet sent.
+
+        :param index: sender index
+        :param size: length of the packet in bytes
+        :param pacer: PacketPacer of the sender, to record the pacing lag
+        """
+        now = _clock()
+        counters = self._counters
+        times = self._times
+        base = index * self.COUNTERS
+        packets = counters[base + self.PACKETS]
+        counters[base + self.PACKETS] = packets + 1
+        counters[base + self.BYTES] += size
+        base = index * self.TIMES
+        interval = now - times[base + self.LAST]
+        self._intervals[index * self.SAMPLES + packets % self.SAMPLES] = interval
+        times[base + self.LAST] = now
+        if pacer is not None:
+            times[base + self.LAG] = pacer.lag(now)
+
+    def error(self, index):
+        """
+        Account for a failed send.
+
+        :param index: sender index
+        """
+        self._counters[index * self.COUNTERS + self.ERRORS] += 1
+
+    def packets(self, index=None):
+        """
+        Return the packets sent by one sender, or by all senders if index is None.
+        """
+        if index is None:
+            return sum(self._counters[self.PACKETS::self.COUNTERS])
+        return self._counters[index * self.COUNTERS + self.PACKETS]
+
+    def sample(self, index):
+        """
+        Summarise the counters of a sender.
+
+        The rates are averaged since the previous sample of the sender, and the
+        jitter percentiles are of the deviation of the recent inter-packet intervals
+        from their mean.
+
+        :param index: sender index
+        :return: dictionary of telemetry items
+        """
+        base = index * self.COUNTERS
+        packets = self._counters[base + self.PACKETS]
+        sent_bytes = self._counters[base + self.BYTES]
+        errors = self._counters[base + self.ERRORS]
+        base = index * self.TIMES
+        start = self._times[base + self.START]
+        last = self._times[base + self.LAST]
+        lag = self._times[base + self.LAG]
+
+        now = _clock()
+        previous_packets, previous_bytes, previous_time = self._previous[index]
+        packet_rate = 0.0
+        data_rate = 0.0
+        if previous_time is not None and now > previous_time:
+            packet_rate = (packets - previous_packets) / (now - previous_time)
+            data_rate = (sent_bytes - previous_bytes) * 8.0 / (now - previous_time) / 1.0e9
+        self._previous[index] = (packets, sent_bytes, now)
+
+        jitter = [0.0] * (len(self.PERCENTILES) + 1)
+        # The first interval of a sender is from its start, not a previous packet
+        count = min(packets - 1, self.SAMPLES)
+        if count > 1:
+            offset = index * self.SAMPLES
+            intervals = np.frombuffer(self._intervals, dtype=np.float64)
+            intervals = intervals[offset:offset + self.SAMPLES]
+            if packets <= self.SAMPLES:
+                intervals = intervals[1:packets]
+            deviation = np.abs(intervals - intervals.mean()) * 1.0e6
+            jitter = np.percentile(deviation, self.PERCENTILES).tolist() + [float(deviation.max())]
+
+        return {
+            'endpoint': self.names[index],
+            'packets': packets,
+            'bytes': sent_bytes,
+            'errors': errors,
+            'packet_rate': packet_rate,
+            'data_rate': data_rate,
+            'average_packet_rate': packets / (last - start) if last > start else 0.0,
+            'lag': lag,
+            'jitter_us': jitter
+        }
+
+    def samples(self):
+        """
+        Summarise the counters of every sender.
+        """
+        return [self.sample(index) for index in range(self.no_of_senders)]
@@ -7,10 +7,11 @@ import json
 import logging
 import time
 import threading
-from latrd_channel import LATRDChannel
+from latrd_client import LATRDClient
 from latrd_message import LATRDMessage, GetMessage, PutMessage, PostMessage
 from odin.adapters.adapter import ApiAdapter, ApiAdapterResponse, request_types, response_types
-from tornado import escape
+from tornado import escape, gen
+from tornado.concurrent import Future
 from tornado.ioloop import IOLoop
 from datetime import datetime
 from dateutil.tz import tzlocal
@@ -212,6 +213,9 @@ class TristanControlAdapter(ApiAdapter):
     This class provides the adapter interface between the ODIN server and the Tristan detector system,
     transforming the REST-like API HTTP verbs into the appropriate Tristan ZeroMQ control messages
     """
+    # The HTTP verb handlers are coroutines, awaited by the odin-control API handler
+    is_async = True
+
     TEMP_ASICS_COUNT = 16
     TEMP_PCB_COUNT = 2
     HUMIDITY_COUNT = 2
@@ -373,6 +377,7 @@ class TristanControlAdapter(ApiAdapter):
         self._start_time = datetime.now()
         self._username = getpass.getuser()
         self._comms_lock = threading.RLock()
+        self._starting_acquisition = False
 
         logging.debug(kwargs)
 
@@ -407,9 +412,9 @@ class TristanControlAdapter(ApiAdapter):
             self._udp_config_file = './udp_tristan.json'
         self._kwargs['udp_file'] = self._udp_config_file
 
-        # Create the connection to the hardware
-        self._detector = LATRDChannel(LATRDChannel.CHANNEL_TYPE_DEALER)
-        self._detector.connect(self._endpoint)
+        # Create the connection to the hardware, the client owns the socket in
+        # its own I/O thread so requests never wait on the socket or each other
+        self._detector = LATRDClient(self._endpoint, TristanControlAdapter.DETECTOR_TIMEOUT)
 
         # Setup the time between client update requests
         self._update_interval = float(self.options.get('update_interval', 0.5))
@@ -423,9 +428,12 @@ class TristanControlAdapter(ApiAdapter):
 
     def cleanup(self):
         self._executing_updates = False
+        self._status_thread.join()
+        self._detector.close()
 
     @request_types('application/json')
     @response_types('application/json', default='application/json')
+    @gen.coroutine
     def get(self, path, request):
 
         """
@@ -500,11 +508,15 @@ class TristanControlAdapter(ApiAdapter):
 
     @request_types('application/json')
     @response_types('application/json', default='application/json')
+    @gen.coroutine
     def put(self, path, request):  # pylint: disable=W0613
 
         """
         Implementation of the HTTP PUT verb for TristanControlAdapter
 
+        The handler is a coroutine that waits for the replies from the detector
+        without blocking the IOLoop.
+
         :param path: URI path of the PUT request
         :param request: Tornado HTTP request object
         :return: ApiAdapterResponse object to be returned to the client
@@ -525,63 +537,22 @@ class TristanControlAdapter(ApiAdapter):
             logging.debug("Command message: %s", config_items[1])
             # Intercept the start_acquisition command and send arm followed by run
             if 'start_acquisition' == config_items[1]:
-                # Send an arm command
-                logging.info("Starting acquisition sequence")
-                msg = PostMessage()
-                msg.set_param('command', 'arm')
-                reply = self.send_recv(msg)
-                counter = 0
-                # Wait for the status to become armed
-                logging.info("Arm command sent, waiting for armed response")
-                while self._parameters['status']['state'] != 'armed' and counter < 50:
-                    time.sleep(0.2)
-                    counter += 1
-                # Check for a timeout and if there is raise an error
-                if self._parameters['status']['state'] != 'armed':
-                    self.set_error('Time out waiting for detector armed state')
-                    status_code = 408
-                    response['reply'] = str('Time out waiting for detector armed state')
+                if self._starting_acquisition:
+                    status_code = 409
+                    response['reply'] = str('Acquisition sequence already in progress')
                 else:
-                    logging.info("Confirmed armed response")
-                    # Detector armed OK, now tell it to run
-                    # Send a run command
-                    msg = PostMessage()
-                    msg.set_param('command', 'run')
-                    with self._comms_lock:
-                        reply = self.send_recv(msg)
-
-                    counter = 0
-                    # Wait for the status to become running
-                    logging.info("Run command sent, waiting for running response")
-                    while self._parameters['status']['state'] != 'running' and counter < 50:
-                        time.sleep(0.2)
-                        counter += 1
-                    # Check for a timeout and if there is raise an error
-                    if self._parameters['status']['state'] != 'running':
-                        self.set_error('Time out waiting for detector running state')
-                        status_code = 408
-                        response['reply'] = str('Time out waiting for detector running state')
-
-                    else:
-                        logging.info("Confirmed running response")
-                        with self._comms_lock:
-                            # Once the reply has been received set the acquisition status to active
-                            self._parameters['status']['acquisition_complete'] = False
-                            logging.info("Acquisition confirmed, setting state to active")
-                        response['reply'] = str(reply)
+                    status_code, response['reply'] = yield self.start_acquisition()
 
             elif 'stop_acquisition' == config_items[1]:
                 # Send a stop command
                 msg = PostMessage()
                 msg.set_param('command', 'stop')
-                reply = self.send_recv(msg)
-                response['reply'] = str(reply)
+                status_code, response['reply'] = yield self.request_reply(msg)
 
             else:
                 msg = PostMessage()
                 msg.set_param('command', config_items[1])
-                reply = self.send_recv(msg)
-                response['reply'] = str(reply)
+                status_code, response['reply'] = yield self.request_reply(msg)
 
         if 'engineering' in config_items[0]:
             # This is a special command that allows an arbitrary JSON object to be sent to the hardware
@@ -595,8 +566,7 @@ class TristanControlAdapter(ApiAdapter):
             if 'engineering_get' in config_items[0]:
                 msg = GetMessage()
             msg.set_param('config', value_dict)
-            reply = self.send_recv(msg)
-            response['reply'] = str(reply)
+            status_code, response['reply'] = yield self.request_reply(msg)
 
         # Verify that config[0] is a config item
         if 'config' in config_items[0]:
@@ -606,13 +576,76 @@ class TristanControlAdapter(ApiAdapter):
             logging.info("Config dict: %s", value_dict)
             msg = PutMessage()
             msg.set_param('config', value_dict)
-            reply = self.send_recv(msg)
-            response['reply'] = str(reply)
+            status_code, response['reply'] = yield self.request_reply(msg)
 
-        return ApiAdapterResponse(response, status_code=status_code)
+        raise gen.Return(ApiAdapterResponse(response, status_code=status_code))
+
+    @gen.coroutine
+    def start_acquisition(self):
+        """
+        Arm the detector and then start it running, waiting for the reply to each
+        command and for the detector to report each state.
+
+        :return: (HTTP status code, reply) of the start_acquisition request
+        """
+        self._starting_acquisition = True
+        try:
+            # Send an arm command
+            logging.info("Starting acquisition sequence")
+            msg = PostMessage()
+            msg.set_param('command', 'arm')
+            status_code, reply = yield self.request_reply(msg)
+            if status_code != 200:
+                raise gen.Return((status_code, reply))
+            # Wait for the status to become armed
+            logging.info("Arm command sent, waiting for armed response")
+            armed = yield self.wait_for_state('armed')
+            # Check for a timeout and if there is raise an error
+            if not armed:
+                self.set_error('Time out waiting for detector armed state')
+                raise gen.Return((408, str('Time out waiting for detector armed state')))
+            logging.info("Confirmed armed response")
+            # Detector armed OK, now tell it to run
+            # Send a run command
+            msg = PostMessage()
+            msg.set_param('command', 'run')
+            status_code, reply = yield self.request_reply(msg)
+            if status_code != 200:
+                raise gen.Return((status_code, reply))
+            # Wait for the status to become running
+            logging.info("Run command sent, waiting for running response")
+            running = yield self.wait_for_state('running')
+            # Check for a timeout and if there is raise an error
+            if not running:
+                self.set_error('Time out waiting for detector running state')
+                raise gen.Return((408, str('Time out waiting for detector running state')))
+            logging.info("Confirmed running response")
+            with self._comms_lock:
+                # Once the reply has been received set the acquisition status to active
+                self._parameters['status']['acquisition_complete'] = False
+                logging.info("Acquisition confirmed, setting state to active")
+            raise gen.Return((status_code, reply))
+        finally:
+            self._starting_acquisition = False
+
+    @gen.coroutine
+    def wait_for_state(self, state):
+        """
+        Wait for the detector to report a state, as read by the update loop.
+
+        :param state: detector state to wait for
+        :return: True if the state was reported, False on timeout or cleanup
+        """
+        counter = 0
+        while self._parameters['status'].get('state') != state and counter < 50 and \
+                self._executing_updates:
+            yield gen.sleep(0.2)
+            counter += 1
+        raise gen.Return(self._parameters['status'].get('state') == state)
 
     @request_types('application/json')
     @response_types('application/json', default='application/json')
+    @gen.coroutine
     def delete(self, path, request):  # pylint: disable=W0613
         """
         Implementation of the HTTP DELETE verb for TristanControlAdapter
@@ -702,6 +735,47 @@ class TristanControlAdapter(ApiAdapter):
         reply = self.send_recv(msg)
         logging.info("Reply from message: {}".format(reply))
 
+    def send_request(self, msg):
+        """
+        Send a message without waiting for the response
+        :param self:
+        :param msg:
+        :return: LATRDRequest completed with the response, or None if there is no response
+        """
+        return self._detector.request(msg)
+
+    def wait_for_reply(self, msg):
+        """
+        Send a message, returning a Future completed on the IOLoop with the reply
+        :param self:
+        :param msg:
+        :return: Future of the reply, None if there is no reply within the timeout
+        """
+        future = Future()
+        io_loop = IOLoop.current()
+
+        def request_done(request):
+            # Called by the client I/O thread
+            io_loop.add_callback(future.set_result, request.result())
+
+        self.send_request(msg).add_done_callback(request_done)
+        return future
+
+    @gen.coroutine
+    def request_reply(self, msg):
+        """
+        Send a message and wait for the reply without blocking the IOLoop
+        :param self:
+        :param msg:
+        :return: (HTTP status code, reply) for the PUT response, 408 if there is no reply
+        """
+        reply = yield self.wait_for_reply(msg)
+        logging.debug("Reply: %s", reply)
+        if reply is None:
+            self.set_error(TristanControlAdapter.ERROR_NO_RESPONSE)
+            raise gen.Return((408, str(TristanControlAdapter.ERROR_NO_RESPONSE)))
+        raise gen.Return((200, str(reply)))
+
     def send_recv(self, msg):
         """
         Send a message and wait for the response
@@ -709,23 +783,7 @@ class TristanControlAdapter(ApiAdapter):
         :param msg:
         :return:
         """
-        logging.debug("Message Request: %s", msg)
-        reply = None
-        with self._comms_lock:
-            status = self._detector.send(msg)
-
-            if status > -1:
-                pollevts = self._detector.poll(TristanControlAdapter.DETECTOR_TIMEOUT)
-                if pollevts == LATRDChannel.POLLIN:
-                    reply = LATRDMessage.parse_json(self._detector.recv())
-
-                # Continue to attempt to get the correct reply until we timeout (or get the correct reply)
-                while reply and reply.msg_id != msg.msg_id:
-                    reply = None
-                    pollevts = self._detector.poll(TristanControlAdapter.DETECTOR_TIMEOUT)
-                    if pollevts == LATRDChannel.POLLIN:
-                        reply = LATRDMessage.parse_json(self._detector.recv())
-
+        reply = self._detector.send_recv(msg)
         logging.debug("Reply: %s", reply)
         return reply
 
@@ -741,15 +799,23 @@ class TristanControlAdapter(ApiAdapter):
                 self._update_time = datetime.now()
                 trigger_udp_config = False
                 try:
+                    logging.debug("Updating status from detector...")
+                    # Request the status and configuration together, waiting for the replies
+                    # outside of the lock so that the handlers are never held up by the detector
+                    msg = GetMessage()
+                    msg.set_param('status', TristanControlAdapter.STATUS_ITEM_LIST)
+                    status_request = self.send_request(msg)
+                    config_dict = self.create_config_request(self._param)
+                    msg = GetMessage()
+                    msg.set_param('config', config_dict)
+                    config_request = self.send_request(msg)
+                    reply = status_request.result()
+                    config_reply = config_request.result()
+
                     with self._comms_lock:
-                        logging.debug("Updating status from detector...")
                         # Update server uptime
                         self._kwargs['up_time'] = str(datetime.now() - self._start_time)
 
-                        msg = GetMessage()
-                        msg.set_param('status', TristanControlAdapter.STATUS_ITEM_LIST)
-                        reply = self.send_recv(msg)
-
                         if reply is not None:
                             logging.debug("Raw reply: %s", reply)
                             if LATRDMessage.MSG_TYPE_RESPONSE in reply.msg_type:
@@ -769,15 +835,20 @@ class TristanControlAdapter(ApiAdapter):
                                         pckts = self._parameters['status']['detector']['udp_packets_sent']
                                         if isinstance(pckts, list):
                                             self._parameters['status']['detector']['udp_packets_sent'] = sum(pckts)
+                                    # Sender telemetry (simulator only) is supplied as a list of
+                                    # items for each endpoint, we need to split that out for
+                                    # monitoring
+                                    detector = self._parameters['status']['detector']
+                                    if 'sender_telemetry' in detector:
+                                        for sender in detector['sender_telemetry']:
+                                            for item in sender:
+                                                key = 'sender_{}'.format(item)
+                                                detector.setdefault(key, []).append(sender[item])
                                 # Check if we have just reconnected
                                 if not currently_connected:
-                                    # Reconnection event so send down the time stamp config item
-                                    connect_time = datetime.now(tzlocal()).strftime("%Y-%m-%dT%H:%M%z")
-                                    msg = PutMessage()
-                                    msg.set_param('config', {'time': connect_time})
-                                    reply = self.send_recv(msg)
-                                    # Resend the UDP configuration on re-connection
-                                    self.send_udp_config()
+                                    # Reconnection event so send down the configuration once the
+                                    # lock is released
+                                    trigger_udp_config = True
 
                                 # Now set the connection status to True
                                 self._parameters['status']['connected'] = True
@@ -827,21 +898,25 @@ class TristanControlAdapter(ApiAdapter):
                         logging.debug("self._parameters: %s", self._parameters)
                         self._parameters['status'].update(self.CORE_STATUS_LIST)
 
-                        config_dict = self.create_config_request(self._param)
-                        msg = GetMessage()
-                        msg.set_param('config', config_dict)
-                        reply = self.send_recv(msg)
-
-                        if reply is not None:
-                            logging.debug("Raw reply: %s", reply)
-                            if LATRDMessage.MSG_TYPE_RESPONSE in reply.msg_type:
-                                data = reply.data['config']
+                        if config_reply is not None:
+                            logging.debug("Raw reply: %s", config_reply)
+                            if LATRDMessage.MSG_TYPE_RESPONSE in config_reply.msg_type:
+                                data = config_reply.data['config']
                                 logging.debug("Reply data: %s", data)
                                 self.update_config(self._param, data)
 
                         logging.debug("Status items: %s", self._parameters)
                         logging.debug("Config parameters: %s", self._param)
 
+                    if trigger_udp_config:
+                        # Send down the time stamp config item
+                        connect_time = datetime.now(tzlocal()).strftime("%Y-%m-%dT%H:%M%z")
+                        msg = PutMessage()
+                        msg.set_param('config', {'time': connect_time})
+                        self.send_recv(msg)
+                        # Resend the UDP configuration on re-connection
+                        self.send_udp_config()
+
                 except Exception as ex:
                     logging.error("Exception: %s", ex)
 
@@ -0,0 +1,293 @@
+"""
+Created on 18 October 2026
+
+Rate control for the simulated detector UDP senders.
+
+A token bucket is refilled at the requested rate, in packets or bytes per
+second.  When the bucket runs dry the sender waits until a whole burst of
+tokens is available, sleeping for most of the wait and spinning on the clock for
+the final fraction, so that rates well above the resolution of time.sleep can be
+held accurately.
+"""
+import logging
+import socket
+import time
+
+# Highest resolution monotonic clock available
+_clock = getattr(time, 'perf_counter', time.time)
+
+
+def set_send_buffer(udp_socket, size):
+    """
+    Request a socket send buffer size, returning the size actually granted.
+
+    :param udp_socket: UDP socket to configure
+    :param size: requested send buffer size in bytes (None leaves the default)
+    :return: send buffer size reported by the socket
+    """
+    if size:
+        try:
+            udp_socket.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, int(size))
+        except socket.error as exc:
+            logging.warning("Unable to set socket send buffer to %d bytes: %s", size, exc)
+    granted = udp_socket.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF)
+    if size and granted < size:
+        logging.warning("Socket send buffer is %d bytes, %d requested (check net.core.wmem_max)",
+                        granted, size)
+    return granted
+
+
+class PacketPacer(object):
+    """
+    Token bucket pacer for a single UDP sender.
+
+    Either packet_rate (packets/s) or bit_rate (bits/s) sets the target rate, with
+    packet_rate taking precedence.  If neither is given packets are sent as fast as
+    possible.  Up to burst packets are sent back to back before the sender waits,
+    and time lost to oversleeping or scheduling delays of up to CATCH_UP seconds is
+    made up by sending the packets that are due immediately.
+    """
+    # Waits shorter than this are spun rather than slept
+    SPIN_THRESHOLD = 0.0002
+    # Maximum lag in seconds that is made up after a delay
+    CATCH_UP = 0.01
+
+    def __init__(self, packet_rate=None, bit_rate=None, burst=1):
+        """
+        Initialise the pacer.
+
+        :param packet_rate: target rate in packets per second
+        :param bit_rate: target rate in bits per second
+        :param burst: number of packets sent back to back
+        """
+        self._burst = max(1, int(burst))
+        self._by_bytes = not packet_rate and bool(bit_rate)
+        if packet_rate:
+            self._rate = float(packet_rate)
+        elif bit_rate:
+            self._rate = float(bit_rate) / 8.0
+        else:
+            self._rate = None
+        self._capacity = None
+        self._limit = None
+        self._tokens = 0.0
+        self._last = None
+        self._start = None
+        self.packets = 0
+        self.bytes = 0
+
+    def requested(self):
+        """
+        Return a description of the requested rate.
+        """
+        if self._rate is None:
+            return "unpaced"
+        if self._by_bytes:
+            return "{:.3f} Gbit/s".format(self._rate * 8.0 / 1.0e9)
+        return "{:.1f} packets/s".format(self._rate)
+
+    def start(self):
+        """
+        Start (or restart) pacing from the current time with a full bucket.
+        """
+        self._start = self._last = _clock()
+        self._capacity = None
+        self.packets = 0
+        self.bytes = 0
+
+    def wait(self, size):
+        """
+        Wait until a packet of size bytes may be sent, and account for it.
+
+        :param size: length of the packet in bytes
+        """
+        if self._start is None:
+            self.start()
+        self.packets += 1
+        self.bytes += size
+        if self._rate is None:
+            return
+
+        cost = float(size) if self._by_bytes else 1.0
+        if self._capacity is None:
+            self._capacity = cost * self._burst
+            self._limit = max(self._capacity, self._rate * self.CATCH_UP)
+            self._tokens = self._capacity
+
+        now = self._refill(_clock())
+        if self._tokens < cost:
+            # Wait for a whole burst worth of tokens so that the sleep is amortised
+            # over the packets of the burst
+            deadline = now + (self._capacity - self._tokens) / self._rate
+            remaining = deadline - now
+            if remaining > self.SPIN_THRESHOLD:
+                time.sleep(remaining - self.SPIN_THRESHOLD)
+            while _clock() < deadline:
+                pass
+            self._refill(_clock())
+        self._tokens -= cost
+
+    def pause(self, duration):
+        """
+        Pause sending for a fixed time without the pause being made up afterwards.
+
+        :param duration: length of the pause in seconds
+        """
+        if self._capacity is not None:
+            self._refill(_clock())
+        time.sleep(duration)
+        if self._last is not None:
+            # Tokens are not accumulated while paused
+            self._last = _clock()
+
+    def _refill(self, now):
+        self._tokens = min(self._limit, self._tokens + (now - self._last) * self._rate)
+        self._last = now
+        return now
+
+    def lag(self, now=None):
+        """
+        Return how far in seconds the sender is behind the requested schedule.
+
+        :param now: current clock reading, read if not given
+        """
+        if self._rate is None or self._start is None:
+            return 0.0
+        if now is None:
+            now = _clock()
+        sent = self.bytes if self._by_bytes else self.packets
+        return max(0.0, (now - self._start) - sent / self._rate)
+
+    def elapsed(self):
+        if self._start is None:
+            return 0.0
+        return _clock() - self._start
+
+    def achieved(self):
+        """
+        Return a description of the rate achieved since pacing started.
+        """
+        elapsed = self.elapsed()
+        if elapsed <= 0.0:
+            return "0 packets in 0 s"
+        return "{} packets, {} bytes in {:.3f} s: {:.1f} packets/s, {:.3f} Gbit/s".format(
+            self.packets, self.bytes, elapsed,
+            self.packets / elapsed, self.bytes * 8.0 / elapsed / 1.0e9)
+
+
+class CapturePacer(PacketPacer):
+    """
+    Pacer that reproduces the packet timing of a capture.
+
+    Each packet is sent when the time since pacing started reaches its capture
+    timestamp (relative to the origin) divided by speed, so microbursts in the
+    capture are reproduced.  Capture timestamps are integer nanoseconds, and only
+    the offset from the origin is converted to seconds, so the spacing of packets
+    is kept to the nanosecond.  Senders to several ports share both the origin
+    (the first timestamp of the capture) and the clock reading that pacing starts
+    from, to keep their packets aligned.  Packets that are already due are sent
+    back to back.  If speed is None packets are sent as fast as possible, and the
+    capture timestamps are only used to report the original throughput.
+    """
+    def __init__(self, speed=1.0, origin=None):
+        """
+        Initialise the pacer.
+
+        :param speed: replay speed multiplier, None to send as fast as possible
+        :param origin: capture time in ns at which pacing starts, the first timestamp if None
+        """
+        super(CapturePacer, self).__init__()
+        self._speed = float(speed) if speed else None
+        self._origin = origin
+        self._first = None
+        self._latest = None
+
+    @property
+    def start_time(self):
+        """
+        Clock reading that pacing started from, to share with other pacers.
+        """
+        return self._start
+
+    def requested(self):
+        if self._speed is None:
+            return "maximum rate"
+        return "capture timing x{:g}".format(self._speed)
+
+    def start(self, start_time=None):
+        """
+        Start pacing.
+
+        :param start_time: clock reading (start_time of another pacer) to pace
+                           from, so that the schedules of several ports line up
+        """
+        super(CapturePacer, self).start()
+        if start_time is not None:
+            self._start = start_time
+        self._first = None
+        self._latest = None
+
+    def wait(self, size, timestamp=None):
+        """
+        Wait until the packet captured at timestamp is due, and account for it.
+
+        :param size: length of the packet in bytes
+        :param timestamp: capture timestamp of the packet in ns
+        """
+        if self._start is None:
+            self.start()
+        self.packets += 1
+        self.bytes += size
+        if timestamp is None:
+            return
+        if self._first is None:
+            self._first = self._latest = timestamp
+            if self._origin is None:
+                self._origin = timestamp
+        # Packets may be reordered, so the capture span runs to the latest timestamp
+        self._first = min(self._first, timestamp)
+        self._latest = max(self._latest, timestamp)
+        if self._speed is None:
+            return
+
+        deadline = self._start + (timestamp - self._origin) * 1.0e-9 / self._speed
+        remaining = deadline - _clock()
+        if remaining > self.SPIN_THRESHOLD:
+            time.sleep(remaining - self.SPIN_THRESHOLD)
+        while _clock() < deadline:
+            pass
+
+    def pause(self, duration):
+        """
+        Pause sending for a fixed time, delaying the rest of the schedule by the
+        length of the pause.
+
+        :param duration: length of the pause in seconds
+        """
+        before = _clock()
+        time.sleep(duration)
+        if self._start is not None:
+            self._start += _clock() - before
+
+    def lag(self, now=None):
+        if self._speed is None or self._first is None:
+            return 0.0
+        if now is None:
+            now = _clock()
+        return max(0.0, (now - self._start) - (self._latest - self._origin) * 1.0e-9 / self._speed)
+
+    def original(self):
+        """
+        Return a description of the throughput of the packets sent in the capture.
+        """
+        if self._first is None or self._latest <= self._first:
+            return "capture span unknown"
+        span = (self._latest - self._first) * 1.0e-9
+        return "capture {:.1f} packets/s, {:.3f} Gbit/s in {:.3f} s".format(
+            self.packets / span, self.bytes * 8.0 / span / 1.0e9, span)
+
+    def achieved(self):
+        """
+        Return a description of the rate achieved, and of the original rate.
+        """
+        return "{} ({})".format(super(CapturePacer, self).achieved(), self.original())
@@ -0,0 +1,197 @@
+"""
+Created on 18 October 2026
+
+Routing of time slices (or count mode images) to UDP destinations.
+
+The detector sends the packets of each time slice to one of the destinations
+downloaded to it in the UDP configuration file (udp_tristan.json, sent by
+TristanControlAdapter.send_udp_config).  Destination N is received by frame
+receiver N, and the frame processor of rank N numbers its frames rank + n *
+processes, so time slice T is routed to destination T % destinations.  A
+destination can be given a larger share of the time slices, in which case it
+receives that many consecutive time slices of each cycle.
+
+The table of destination indices for one cycle is built once, so the
+destination of any number of frames is a single array lookup.  The simulators
+and replay tools all route their packets with this class so that they load the
+frame receivers and processors exactly as the detector would.
+"""
+import json
+
+import numpy as np
+
+
+class UdpRouting(object):
+    """
+    Time slice to UDP destination routing table.
+    """
+    # Keys recognised for the address and port of a destination
+    ADDRESS_KEYS = ('ip', 'ip_addr', 'dest_ip', 'dst_ip', 'destination_ip', 'address', 'host')
+    PORT_KEYS = ('port', 'dest_port', 'dst_port', 'destination_port')
+    # Key of the number of consecutive time slices routed to a destination
+    SHARE_KEY = 'time_slices'
+
+    def __init__(self, endpoints, shares=None):
+        """
+        Create the routing table.
+
+        :param endpoints: list of (address, port) tuples, in frame receiver order
+        :param shares: number of consecutive time slices routed to each endpoint
+                       per cycle (defaults to one each)
+        """
+        if not endpoints:
+            raise ValueError("No UDP destinations to route time slices to")
+        self.endpoints = [(str(address), int(port)) for address, port in endpoints]
+        if shares is None:
+            shares = [1] * len(self.endpoints)
+        shares = np.asarray(shares, dtype=np.int64)
+        if len(shares) != len(self.endpoints) or (shares < 1).any():
+            raise ValueError("Invalid time slice shares {} for {} UDP destinations".format(
+                shares.tolist(), len(self.endpoints)))
+        self.shares = shares.tolist()
+        self.table = np.repeat(np.arange(len(self.endpoints)), shares)
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        Create the routing table from a UDP configuration.
+
+        The configuration is searched for the first list of destinations, which
+        may be a list of objects with address and port keys (and optionally a
+        time_slices share), "address:port" strings or [address, port] pairs, or
+        an object with parallel lists of addresses and ports (a single address
+        or port is used for every destination).
+
+        :param config: UDP configuration dictionary
+        :return: UdpRouting object
+        """
+        destinations = cls._find_destinations(config)
+        if not destinations:
+            raise ValueError("No UDP destinations found in the UDP configuration")
+        endpoints = [(address, port) for address, port, _ in destinations]
+        return cls(endpoints, [share for _, _, share in destinations])
+
+    @classmethod
+    def from_file(cls, filename):
+        """
+        Create the routing table from a UDP configuration file.
+
+        :param filename: JSON UDP configuration file (eg udp_tristan.json)
+        :return: UdpRouting object
+        """
+        with open(filename) as config_file:
+            return cls.from_config(json.load(config_file))
+
+    @classmethod
+    def _find_destinations(cls, config):
+        if isinstance(config, dict):
+            addresses = cls._lookup(config, cls.ADDRESS_KEYS)
+            ports = cls._lookup(config, cls.PORT_KEYS)
+            if addresses is not None and ports is not None:
+                shares = config.get(cls.SHARE_KEY, 1)
+                count = max(len(item) if isinstance(item, list) else 1
+                            for item in (addresses, ports, shares))
+
+                def expand(item):
+                    return item if isinstance(item, list) else [item] * count
+
+                addresses, ports, shares = expand(addresses), expand(ports), expand(shares)
+                if len(addresses) == len(ports) == len(shares):
+                    return list(zip(addresses, ports, shares))
+            children = config.values()
+        elif isinstance(config, list):
+            destinations = [cls._destination(item) for item in config]
+            if destinations and all(destinations):
+                return destinations
+            children = config
+        else:
+            return None
+        for child in children:
+            destinations = cls._find_destinations(child)
+            if destinations:
+                return destinations
+        return None
+
+    @classmethod
+    def _destination(cls, item):
+        if isinstance(item, dict):
+            address = cls._lookup(item, cls.ADDRESS_KEYS)
+            port = cls._lookup(item, cls.PORT_KEYS)
+            if address is None or port is None:
+                return None
+            if isinstance(address, list) or isinstance(port, list):
+                return None
+            return address, port, item.get(cls.SHARE_KEY, 1)
+        if hasattr(item, 'rsplit') and ':' in item:
+            address, port = item.rsplit(':', 1)
+            if port.isdigit():
+                return address, int(port), 1
+        if isinstance(item, (list, tuple)) and len(item) == 2 and isinstance(item[1], int):
+            return item[0], item[1], 1
+        return None
+
+    @staticmethod
+    def _lookup(item, keys):
+        for key in keys:
+            if key in item:
+                return item[key]
+        return None
+
+    @property
+    def no_of_endpoints(self):
+        return len(self.endpoints)
+
+    def endpoint_indices(self, frames):
+        """
+        Return the destination index of each of an array of frames.
+
+        :param frames: time slice (or image) numbers
+        :return: int64 array of indices into endpoints
+        """
+        return self.table[np.asarray(frames, dtype=np.int64) % len(self.table)]
+
+    def endpoint_index(self, frame):
+        """
+        Return the destination index of a single frame.
+        """
+        return int(self.table[frame % len(self.table)])
+
+    def endpoint(self, frame):
+        """
+        Return the (address, port) destination of a single frame.
+        """
+        return self.endpoints[self.endpoint_index(frame)]
+
+    def frames(self, frames, index):
+        """
+        Return the frames routed to one destination.
+
+        :param frames: time slice (or image) numbers
+        :param index: destination index
+        :return: list of the frames routed to the destination, in order
+        """
+        frames = np.asarray(frames, dtype=np.int64)
+        return frames[self.endpoint_indices(frames) == index].tolist()
+
+    def split(self, groups):
+        """
+        Split the routing into a routing for each of a list of contiguous groups
+        of destinations, as used when several event streams are sent.
+
+        :param groups: list of lists of (address, port) tuples, taken in order
+                       from the endpoints
+        :return: list of UdpRouting objects
+        """
+        routings = []
+        start = 0
+        for group in groups:
+            if self.endpoints[start:start + len(group)] == list(group):
+                routings.append(UdpRouting(group, self.shares[start:start + len(group)]))
+                start += len(group)
+            else:
+                # Endpoints shared between groups keep an equal share
+                routings.append(UdpRouting(group))
+        return routings
+
+    def __repr__(self):
+        return "UdpRouting({}, shares={})".format(self.endpoints, self.shares)
@@ -0,0 +1,622 @@
+"""
+Created on 18 October 2026
+
+Fast reader for packet capture (pcap) files of Tristan UDP data.
+
+The capture file is memory mapped and its 16 byte record headers are located
+with NumPy: runs of records of the same length (almost every record of a
+Tristan capture) are found by checking the lengths through a strided view of
+the headers rather than visiting each record in turn.  The UDP payload of every
+Ethernet (optionally VLAN tagged) IPv4 UDP frame is then located with array
+operations on the fixed layout of those headers, and payloads are handed out as
+zero copy memoryviews of the mapped file.
+
+Frames that do not have that layout (IPv4 options are handled, but not IP
+fragments, other protocols or other link types) are decoded with dpkt, if it
+is installed, and otherwise skipped.
+
+The Tristan packet header of every record (producer ID, time slice, image and
+packet number, idle and count mode flags) is decoded into a packet index, which
+can be kept in a sidecar file next to the capture:
+
+    header (64 bytes) | index records
+
+The sidecar (capture file name + .idx) is reused in place of scanning the
+capture as long as it is newer than the capture, so selecting eg the packets of
+a range of time slices from one producer is an array lookup.
+"""
+import ast
+import logging
+import mmap
+import operator
+import os
+import struct
+
+import numpy as np
+
+try:
+    import dpkt
+except ImportError:
+    dpkt = None
+
+
+PCAP_HEADER_SIZE = 24
+RECORD_HEADER_SIZE = 16
+LINKTYPE_ETHERNET = 1
+LINKTYPE_LINUX_SLL = 113
+
+# Magic numbers for microsecond and nanosecond resolution timestamps
+PCAP_MAGIC_US = 0xA1B2C3D4
+PCAP_MAGIC_NS = 0xA1B23C4D
+
+ETHERNET_HEADER_SIZE = 14
+VLAN_TAG_SIZE = 4
+ETHERTYPE_IPV4 = 0x0800
+ETHERTYPE_VLAN = 0x8100
+IP_PROTOCOL_UDP = 17
+UDP_HEADER_SIZE = 8
+
+# Tristan packet header: a zero word followed by two header words
+TRISTAN_HEADER_SIZE = 24
+IDLE_PACKET_MASK = 0x000000000003F800
+COUNT_MODE_MASK = 0x0000000000000800
+PRODUCER_ID_MASK = 0x03FC000000000000
+TIME_SLICE_WRAP_MASK = 0x0003FFFFFFFC0000
+TIME_SLICE_BUFFER_MASK = 0x000000FF00000000
+IMAGE_NUMBER_MASK = 0x00FFFFFF00000000
+PACKET_ID_MASK = 0x00000000FFFFFFFF
+NO_OF_BUFFERS = 4
+
+PCAP_INDEX_SUFFIX = '.idx'
+PCAP_INDEX_MAGIC = b'TRISPIDX'
+# Version 2 holds integer nanosecond timestamps in place of float seconds
+PCAP_INDEX_VERSION = 2
+# Index records start after the header, padded to a fixed size
+PCAP_INDEX_DATA_OFFSET = 64
+# Magic, version, number of records, size and link type of the capture
+PCAP_INDEX_HEADER = struct.Struct('<8sIQQI')
+
+PCAP_INDEX_DTYPE = np.dtype([
+    ('frame_offset', '<i8'),
+    ('captured_length', '<u4'),
+    ('original_length', '<u4'),
+    ('timestamp_ns', '<i8'),
+    ('offset', '<i8'),
+    ('length', '<i4'),
+    ('producer_id', '<u2'),
+    ('time_slice', '<u8'),
+    ('image', '<u4'),
+    ('packet_number', '<u4'),
+    ('idle', '?'),
+    ('count_mode', '?')
+])
+
+
+# Operators allowed in select expressions
+FILTER_COMPARE_OPS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge
+}
+FILTER_BINARY_OPS = {
+    ast.BitAnd: operator.and_,
+    ast.BitOr: operator.or_
+}
+# Node type of numbers (ast.Num before Python 3.6)
+FILTER_CONSTANT = getattr(ast, 'Constant', None) or ast.Num
+
+
+class PcapError(Exception):
+    pass
+
+
+def _evaluate_node(node, names):
+    """
+    Evaluate a parsed select expression, allowing only the names given,
+    numbers, comparisons and the &, | and ~ operators.
+    """
+    if isinstance(node, ast.Name):
+        if node.id not in names:
+            raise ValueError("unknown field '{}'".format(node.id))
+        return names[node.id]
+    if isinstance(node, FILTER_CONSTANT):
+        value = node.value if hasattr(node, 'value') else node.n
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError("unsupported constant {!r}".format(value))
+        return value
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Invert):
+        return ~_evaluate_node(node.operand, names)
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub) and \
+            isinstance(node.operand, FILTER_CONSTANT):
+        return -_evaluate_node(node.operand, names)
+    if isinstance(node, ast.BinOp) and type(node.op) in FILTER_BINARY_OPS:
+        return FILTER_BINARY_OPS[type(node.op)](_evaluate_node(node.left, names),
+                                                _evaluate_node(node.right, names))
+    if isinstance(node, ast.Compare):
+        result = True
+        left = _evaluate_node(node.left, names)
+        for op, comparator in zip(node.ops, node.comparators):
+            if type(op) not in FILTER_COMPARE_OPS:
+                raise ValueError("unsupported comparison {}".format(type(op).__name__))
+            right = _evaluate_node(comparator, names)
+            result = result & FILTER_COMPARE_OPS[type(op)](left, right)
+            left = right
+        return result
+    raise ValueError("unsupported syntax {}".format(type(node).__name__))
+
+
+def _be16(data, offsets):
+    # Big endian (network order) 16 bit fields at an array of offsets
+    return (data[offsets].astype(np.int64) << 8) | data[offsets + 1]
+
+
+class PcapReader(object):
+    """
+    Memory mapped reader of the UDP payloads of a packet capture file.
+
+    The arrays timestamps_ns (integer nanoseconds since the epoch, so that the
+    spacing of packets is not rounded away), payload_offsets and payload_lengths
+    hold an entry for every record of the capture.  A record without a UDP payload has an offset
+    and length of -1, and a payload decoded by dpkt has an offset of -1 and is
+    returned as bytes rather than as a view of the file.
+
+    The packet index holds the same entries together with the decoded Tristan
+    packet header of each record, see PCAP_INDEX_DTYPE.
+    """
+    # Number of records checked at a time for a run of records of equal length
+    MIN_PROBE = 64
+    MAX_PROBE = 1024 * 1024
+    # Runs shorter than this are not worth a strided probe, so the headers that
+    # follow are walked one at a time until this many equal lengths are found
+    WALK_RUN = 8
+    # Number of records gathered at a time, to bound temporary index arrays
+    GATHER_RECORDS = 256 * 1024
+
+    def __init__(self, capture, index=False):
+        """
+        Map and index a capture file.
+
+        :param capture: file name or open (binary) file object of the capture
+        :param index: reuse the sidecar index file of the capture if it is up to
+                      date, otherwise scan the capture and (re)write the sidecar
+        """
+        if hasattr(capture, 'fileno'):
+            self.filename = getattr(capture, 'name', None)
+            fileno = capture.fileno()
+        else:
+            self.filename = capture
+            capture = open(capture, 'rb')
+            fileno = capture.fileno()
+        self._file = capture
+        self.size = os.fstat(fileno).st_size
+        if self.size < PCAP_HEADER_SIZE:
+            raise PcapError("{} is too short to be a packet capture file".format(self.filename))
+        self._mmap = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+        self._data = np.frombuffer(self._mmap, dtype=np.uint8)
+
+        magic = struct.unpack_from('<I', self._mmap, 0)[0]
+        if magic in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+            self._endian = '<'
+        else:
+            magic = struct.unpack_from('>I', self._mmap, 0)[0]
+            if magic not in (PCAP_MAGIC_US, PCAP_MAGIC_NS):
+                raise PcapError("{} is not a packet capture file".format(self.filename))
+            self._endian = '>'
+        # Nanoseconds per unit of the sub second field of the record timestamps
+        self._ns_per_tick = 1 if magic == PCAP_MAGIC_NS else 1000
+        self.snaplen, self.linktype = struct.unpack_from(self._endian + 'II', self._mmap, 16)
+
+        self._fallback = {}
+        self._index = None
+        self.index_filename = None
+        if index and self.filename is not None:
+            self.index_filename = self.filename + PCAP_INDEX_SUFFIX
+            self._index = self._read_index()
+        if self._index is not None:
+            self._apply_index()
+        else:
+            self.record_offsets = self._scan_records()
+            self._read_record_headers()
+            self._locate_payloads()
+            if self.index_filename is not None:
+                self.write_index()
+
+    def __len__(self):
+        return len(self.record_offsets)
+
+    def _scan_records(self):
+        """
+        Return the offset of every record header in the file.
+        """
+        length_type = np.dtype(self._endian + 'u4')
+        runs = []
+        position = PCAP_HEADER_SIZE
+        probe = self.MIN_PROBE
+        walk = False
+        while position + RECORD_HEADER_SIZE <= self.size:
+            if walk:
+                walked = []
+                position = self._walk_records(position, walked)
+                runs.append(np.array(walked, dtype=np.int64))
+                probe = self.MIN_PROBE
+                walk = False
+                continue
+            captured = struct.unpack_from(self._endian + 'I', self._mmap, position + 8)[0]
+            stride = RECORD_HEADER_SIZE + captured
+            if position + stride > self.size:
+                break
+            # The records of a run of equal length lie at a fixed stride, so check
+            # the captured length of each of the following records through a
+            # strided view of their headers
+            count = min(probe, (self.size - position) // stride)
+            lengths = np.ndarray(shape=(count,), dtype=length_type, buffer=self._mmap,
+                                 offset=position + 8, strides=(stride,))
+            mismatch = np.flatnonzero(lengths != captured)
+            run = int(mismatch[0]) if len(mismatch) else count
+            runs.append(np.arange(run, dtype=np.int64) * stride + position)
+            position += run * stride
+            probe = min(probe * 2, self.MAX_PROBE) if run == count else self.MIN_PROBE
+            walk = run < self.WALK_RUN
+        if position != self.size:
+            logging.warning("Ignoring %d bytes of truncated record at the end of %s",
+                            self.size - position, self.filename)
+        if not runs:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate(runs)
+
+    def _walk_records(self, position, offsets):
+        """
+        Walk the record headers from position one at a time, appending their
+        offsets, until WALK_RUN consecutive records of equal length are found.
+
+        :return: offset of the first record of that run, for _scan_records to
+                 probe, or of the end of the last complete record
+        """
+        unpack = struct.Struct(self._endian + 'I').unpack_from
+        mapped = self._mmap
+        size = self.size
+        run_start = position
+        run_length = None
+        run = 0
+        while position + RECORD_HEADER_SIZE <= size:
+            captured = unpack(mapped, position + 8)[0]
+            next_position = position + RECORD_HEADER_SIZE + captured
+            if next_position > size:
+                break
+            if captured == run_length:
+                run += 1
+                if run == self.WALK_RUN:
+                    del offsets[len(offsets) - run + 1:]
+                    return run_start
+            else:
+                run_start = position
+                run_length = captured
+                run = 1
+            offsets.append(position)
+            position = next_position
+        return position
+
+    def _gather(self, offsets, no_of_bytes):
+        """
+        Return an array of the no_of_bytes bytes at each of an array of offsets.
+        """
+        gathered = np.empty((len(offsets), no_of_bytes), dtype=np.uint8)
+        span = np.arange(no_of_bytes)
+        for start in range(0, len(offsets), self.GATHER_RECORDS):
+            block = offsets[start:start + self.GATHER_RECORDS]
+            gathered[start:start + len(block)] = self._data[block[:, np.newaxis] + span]
+        return gathered
+
+    def _read_record_headers(self):
+        # Gather the four 32 bit fields of every record header
+        headers = self._gather(self.record_offsets, RECORD_HEADER_SIZE)
+        headers = headers.view(self._endian + 'u4').reshape(-1, 4).astype(np.int64)
+        self.timestamps_ns = headers[:, 0] * 1000000000 + headers[:, 1] * self._ns_per_tick
+        self.captured_lengths = headers[:, 2]
+        self.original_lengths = headers[:, 3]
+        self.frame_offsets = self.record_offsets + RECORD_HEADER_SIZE
+
+    def _locate_payloads(self):
+        """
+        Find the UDP payload of every record.
+        """
+        count = len(self)
+        self.payload_offsets = np.full(count, -1, dtype=np.int64)
+        self.payload_lengths = np.full(count, -1, dtype=np.int64)
+        if count == 0:
+            return
+        if self.linktype != LINKTYPE_ETHERNET:
+            self._decode_fallback(np.arange(count))
+            return
+
+        data = self._data
+        frames = self.frame_offsets
+        frame_end = frames + self.captured_lengths
+        minimum = ETHERNET_HEADER_SIZE + 20 + UDP_HEADER_SIZE
+        usable = np.flatnonzero(self.captured_lengths >= minimum)
+        frames = frames[usable]
+        frame_end = frame_end[usable]
+
+        # Skip a single VLAN tag
+        ethertype = _be16(data, frames + 12)
+        ip_offsets = frames + ETHERNET_HEADER_SIZE
+        tagged = ethertype == ETHERTYPE_VLAN
+        if tagged.any():
+            ethertype[tagged] = _be16(data, frames[tagged] + 16)
+            ip_offsets[tagged] += VLAN_TAG_SIZE
+
+        # IPv4 UDP datagrams that are not fragmented
+        ipv4 = (ethertype == ETHERTYPE_IPV4) & (ip_offsets + 20 + UDP_HEADER_SIZE <= frame_end)
+        ip_offsets = np.where(ipv4, ip_offsets, frames)
+        version = data[ip_offsets] >> 4
+        header_length = (data[ip_offsets] & 0x0F).astype(np.int64) * 4
+        protocol = data[ip_offsets + 9]
+        fragment = _be16(data, ip_offsets + 6) & 0x3FFF
+        udp_offsets = ip_offsets + header_length
+        udp = ipv4 & (version == 4) & (header_length >= 20) & (protocol == IP_PROTOCOL_UDP) & \
+            (fragment == 0) & (udp_offsets + UDP_HEADER_SIZE <= frame_end)
+        udp_offsets = np.where(udp, udp_offsets, frames)
+        udp_length = _be16(data, udp_offsets + 4)
+        udp &= udp_length >= UDP_HEADER_SIZE
+
+        # The payload is limited to the bytes actually captured
+        payload_offsets = udp_offsets + UDP_HEADER_SIZE
+        payload_lengths = np.minimum(udp_length - UDP_HEADER_SIZE, frame_end - payload_offsets)
+        self.payload_offsets[usable[udp]] = payload_offsets[udp]
+        self.payload_lengths[usable[udp]] = payload_lengths[udp]
+
+        unusual = np.ones(count, dtype=bool)
+        unusual[usable[udp]] = False
+        self._decode_fallback(np.flatnonzero(unusual))
+
+    def _decode_fallback(self, records):
+        """
+        Decode records that are not plain Ethernet IPv4 UDP frames with dpkt.
+        """
+        if len(records) == 0:
+            return
+        if dpkt is None or self.linktype not in (LINKTYPE_ETHERNET, LINKTYPE_LINUX_SLL):
+            logging.debug("Skipping %d non UDP records of %s", len(records), self.filename)
+            return
+        for record in records.tolist():
+            payload = self._decode_frame(record)
+            if payload is not None:
+                self._fallback[record] = payload
+                self.payload_lengths[record] = len(payload)
+
+    def _decode_frame(self, record):
+        """
+        Return the UDP payload of a record decoded by dpkt, or None.
+        """
+        if dpkt is None:
+            return None
+        try:
+            if self.linktype == LINKTYPE_ETHERNET:
+                layer = dpkt.ethernet.Ethernet(bytes(self.frame(record))).data
+            else:
+                layer = dpkt.sll.SLL(bytes(self.frame(record))).data
+            udp_layer = layer.data
+        except (dpkt.dpkt.Error, AttributeError, ValueError):
+            return None
+        if isinstance(udp_layer, dpkt.udp.UDP):
+            return bytes(udp_layer.data)
+        return None
+
+    def _fallback_payload(self, record):
+        # Payloads decoded by dpkt are decoded again when the index was reused
+        if record not in self._fallback and self.payload_lengths[record] >= 0:
+            self._fallback[record] = self._decode_frame(record)
+        return self._fallback.get(record)
+
+    def frame(self, index):
+        """
+        Return the captured link layer frame of a record as a memoryview.
+        """
+        start = int(self.frame_offsets[index])
+        return memoryview(self._mmap)[start:start + int(self.captured_lengths[index])]
+
+    def payload(self, index):
+        """
+        Return the UDP payload of a record, or None if it has none.
+        """
+        offset = int(self.payload_offsets[index])
+        if offset < 0:
+            return self._fallback_payload(int(index))
+        return memoryview(self._mmap)[offset:offset + int(self.payload_lengths[index])]
+
+    def payloads(self, records=None):
+        """
+        Return the UDP payloads of a selection of records.
+
+        :param records: record indices, all records if None
+        :return: list of memoryviews (bytes for payloads decoded by dpkt, None for
+                 records without a UDP payload)
+        """
+        if records is None:
+            records = np.arange(len(self))
+        view = memoryview(self._mmap)
+        offsets = self.payload_offsets[records].tolist()
+        ends = (self.payload_offsets[records] + self.payload_lengths[records]).tolist()
+        payloads = []
+        for record, offset, end in zip(np.asarray(records).tolist(), offsets, ends):
+            if offset < 0:
+                payloads.append(self._fallback_payload(record))
+            else:
+                payloads.append(view[offset:end])
+        return payloads
+
+    def header_words(self, count=3, records=None):
+        """
+        Return the first 64 bit little endian words of the UDP payloads.
+
+        :param count: number of words from the start of each payload
+        :param records: record indices, all records if None
+        :return: uint64 array of shape (records, count), words beyond the end of
+                 a payload (or of records without one) are zero
+        """
+        if records is None:
+            records = np.arange(len(self))
+        records = np.asarray(records, dtype=np.int64)
+        no_of_bytes = count * 8
+        words = np.zeros((len(records), no_of_bytes), dtype=np.uint8)
+        offsets = self.payload_offsets[records]
+        lengths = self.payload_lengths[records]
+        whole = (offsets >= 0) & (lengths >= no_of_bytes)
+        mapped = np.flatnonzero(whole)
+        if len(mapped):
+            words[mapped] = self._gather(offsets[mapped], no_of_bytes)
+        # Short payloads and payloads decoded by dpkt are copied individually
+        for index in np.flatnonzero((lengths >= 0) & ~whole).tolist():
+            payload = bytes(self.payload(int(records[index])))[:no_of_bytes]
+            words[index, :len(payload)] = np.frombuffer(payload, dtype=np.uint8)
+        return words.view('<u8')
+
+    def packet_index(self):
+        """
+        Return the packet index of the capture, decoding the Tristan packet
+        headers on first use.
+
+        :return: structured array of PCAP_INDEX_DTYPE with an entry per record
+        """
+        if self._index is None:
+            index = np.zeros(len(self), dtype=PCAP_INDEX_DTYPE)
+            index['frame_offset'] = self.frame_offsets
+            index['captured_length'] = self.captured_lengths
+            index['original_length'] = self.original_lengths
+            index['timestamp_ns'] = self.timestamps_ns
+            index['offset'] = self.payload_offsets
+            index['length'] = self.payload_lengths
+
+            words = self.header_words(3)
+            hdr_pkt_1 = words[:, 1]
+            hdr_pkt_2 = words[:, 2]
+            header = self.payload_lengths >= TRISTAN_HEADER_SIZE
+            idle_mask = np.uint64(IDLE_PACKET_MASK)
+            index['idle'] = header & ((hdr_pkt_1 & idle_mask) == idle_mask)
+            index['count_mode'] = header & ~index['idle'] & \
+                ((hdr_pkt_1 & np.uint64(COUNT_MODE_MASK)) != 0)
+            index['producer_id'] = (hdr_pkt_1 & np.uint64(PRODUCER_ID_MASK)) >> np.uint64(50)
+            ts_wrap = (hdr_pkt_1 & np.uint64(TIME_SLICE_WRAP_MASK)) >> np.uint64(18)
+            ts_buff = (hdr_pkt_2 & np.uint64(TIME_SLICE_BUFFER_MASK)) >> np.uint64(32)
+            index['time_slice'] = ts_wrap * np.uint64(NO_OF_BUFFERS) + ts_buff
+            index['image'] = (hdr_pkt_2 & np.uint64(IMAGE_NUMBER_MASK)) >> np.uint64(32)
+            index['packet_number'] = hdr_pkt_2 & np.uint64(PACKET_ID_MASK)
+            self._index = index
+        return self._index
+
+    def select(self, time_slices=None, images=None, producer_id=None, expression=None):
+        """
+        Return the records of the Tristan data packets (not idle packets) that
+        match a selection.
+
+        The expression is evaluated with each field of the packet index as an
+        array, along with frame (the image of count mode packets and the time
+        slice of others) and record, eg "(frame >= 1000) & (producer_id == 3)".
+        Only those names, numbers, comparisons, the &, | and ~ operators and
+        parentheses may be used.
+
+        :param time_slices: (first, last) time slice IDs, inclusive, or (ts_id,)
+        :param images: (first, last) image numbers, inclusive, or (image,)
+        :param producer_id: producer ID, or list of IDs
+        :param expression: filter expression over the packet index
+        :return: array of record indices in capture order
+        """
+        index = self.packet_index()
+        selected = (index['length'] >= TRISTAN_HEADER_SIZE) & ~index['idle']
+        if time_slices is not None:
+            selected &= (index['time_slice'] >= time_slices[0]) & \
+                (index['time_slice'] <= time_slices[-1])
+        if images is not None:
+            selected &= (index['image'] >= images[0]) & (index['image'] <= images[-1])
+        if producer_id is not None:
+            producer_ids = np.atleast_1d(producer_id)
+            selected &= (index['producer_id'][:, np.newaxis] == producer_ids).any(axis=1)
+        if expression:
+            selected &= self._evaluate(expression)
+        return np.flatnonzero(selected)
+
+    def _evaluate(self, expression):
+        index = self.packet_index()
+        names = dict((name, index[name]) for name in PCAP_INDEX_DTYPE.names)
+        names['frame'] = np.where(index['count_mode'], index['image'], index['time_slice'])
+        names['record'] = np.arange(len(index))
+        try:
+            result = _evaluate_node(ast.parse(expression.strip(), mode='eval').body, names)
+        except (SyntaxError, TypeError, ValueError, OverflowError, RuntimeError) as error:
+            raise ValueError("Invalid filter expression '{}': {}".format(expression, error))
+        return np.broadcast_to(np.asarray(result, dtype=bool), (len(index),))
+
+    def idle_records(self):
+        """
+        Return the records of the idle packets.
+        """
+        return np.flatnonzero(self.packet_index()['idle'])
+
+    def _read_index(self):
+        """
+        Return the packet index from the sidecar file, or None if there is no
+        sidecar or it is older than (or does not match) the capture.
+        """
+        try:
+            if os.path.getmtime(self.index_filename) < os.path.getmtime(self.filename):
+                logging.debug("Index %s is out of date", self.index_filename)
+                return None
+            with open(self.index_filename, 'rb') as index_file:
+                magic, version, count, size, linktype = PCAP_INDEX_HEADER.unpack(
+                    index_file.read(PCAP_INDEX_HEADER.size))
+                if magic != PCAP_INDEX_MAGIC or version != PCAP_INDEX_VERSION or \
+                        size != self.size or linktype != self.linktype:
+                    logging.debug("Index %s does not match %s", self.index_filename, self.filename)
+                    return None
+                index_file.seek(PCAP_INDEX_DATA_OFFSET)
+                index = np.fromfile(index_file, dtype=PCAP_INDEX_DTYPE, count=count)
+        except (IOError, OSError, struct.error):
+            return None
+        if len(index) != count:
+            return None
+        logging.debug("Using index %s", self.index_filename)
+        return index
+
+    def _apply_index(self):
+        index = self._index
+        self.frame_offsets = index['frame_offset'].astype(np.int64)
+        self.record_offsets = self.frame_offsets - RECORD_HEADER_SIZE
+        self.captured_lengths = index['captured_length'].astype(np.int64)
+        self.original_lengths = index['original_length'].astype(np.int64)
+        self.timestamps_ns = index['timestamp_ns'].astype(np.int64)
+        self.payload_offsets = index['offset'].astype(np.int64)
+        self.payload_lengths = index['length'].astype(np.int64)
+
+    def write_index(self, filename=None):
+        """
+        Write the packet index to a sidecar file.  Failure to write the file (eg
+        to a read only directory) is logged rather than raised.
+
+        :param filename: index file name, the sidecar of the capture if None
+        """
+        filename = filename or self.index_filename or self.filename + PCAP_INDEX_SUFFIX
+        index = self.packet_index()
+        temporary = filename + '.tmp'
+        try:
+            with open(temporary, 'wb') as index_file:
+                header = PCAP_INDEX_HEADER.pack(PCAP_INDEX_MAGIC, PCAP_INDEX_VERSION, len(index),
+                                                self.size, self.linktype)
+                index_file.write(header.ljust(PCAP_INDEX_DATA_OFFSET, b'\0'))
+                index_file.write(index.tobytes())
+            os.rename(temporary, filename)
+        except (IOError, OSError) as error:
+            logging.warning("Unable to write index %s: %s", filename, error)
+            return
+        logging.debug("Wrote index of %d records to %s", len(index), filename)
+
+    def close(self):
+        self._data = None
+        try:
+            self._mmap.close()
+        except BufferError:
+            # Payload views are still in use, the mapping is released with them
+            pass
+        self._file.close()
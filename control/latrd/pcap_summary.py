@@ -0,0 +1,315 @@
+"""
+Created on 18 October 2026
+
+Vectorised decoding and summaries of the Tristan packets of a capture.
+
+The payloads of a batch of packets are joined and decoded with a single
+np.frombuffer, and every word is classified with array operations as a header,
+data or control word, recording the coarse timestamp control words.  The results
+for each packet are then grouped by producer and frame (the time slice of an
+event mode packet or the image of a count mode packet) into summaries that can
+be saved to HDF5 or NPZ files for comparison between runs.
+"""
+import os
+
+import h5py
+import numpy as np
+
+from latrd.pcap import TRISTAN_HEADER_SIZE
+from latrd.raw.events import HDF5_EXTENSIONS
+
+
+HEADER_WORDS = 3
+WORD_COUNT_MASK = np.uint64(0x00000000000007FF)
+CONTROL_WORD_SHIFT = np.uint64(63)
+CONTROL_TYPE_SHIFT = np.uint64(58)
+CONTROL_TYPE_MASK = np.uint64(0x3F)
+CONTROL_COURSE_TIMESTAMP = 0x20
+COURSE_TIMESTAMP_MASK = np.uint64(0x000FFFFFFFFFFFFF)
+INTEGRAL_WORD_SHIFT = np.uint64(60)
+INTEGRAL_DATA_WORD = 0x9
+NO_TIMESTAMP = np.iinfo(np.uint64).max
+
+# Bytes of payload decoded at a time, to bound the temporary arrays
+DECODE_BATCH_BYTES = 64 * 1024 * 1024
+# Frames with more missing packets than this (eg from a corrupt packet number)
+# are counted but their missing packets are not listed
+MAX_MISSING_LISTED = 65536
+
+# Summary of each packet.  Data words are event words in event mode and integral
+# (pixel count) words in count mode, other words with the top bit set are
+# control words.  Word counts exclude the three header words.
+PACKET_SUMMARY_DTYPE = np.dtype([
+    ('record', '<i8'),
+    ('producer_id', '<u2'),
+    ('count_mode', '?'),
+    ('frame', '<u8'),
+    ('packet_number', '<u4'),
+    ('word_count', '<u4'),
+    ('words', '<u4'),
+    ('data_words', '<u4'),
+    ('control_words', '<u4'),
+    ('timestamp_words', '<u4'),
+    ('timestamp_min', '<u8'),
+    ('timestamp_max', '<u8')
+])
+
+FRAME_SUMMARY_DTYPE = np.dtype([
+    ('producer_id', '<u2'),
+    ('count_mode', '?'),
+    ('frame', '<u8'),
+    ('packets', '<u4'),
+    ('first_packet', '<u4'),
+    ('last_packet', '<u4'),
+    ('missing', '<u4'),
+    ('duplicates', '<u4'),
+    ('words', '<u8'),
+    ('data_words', '<u8'),
+    ('control_words', '<u8'),
+    ('control_fraction', '<f8'),
+    ('timestamp_min', '<u8'),
+    ('timestamp_max', '<u8')
+])
+
+PRODUCER_SUMMARY_DTYPE = np.dtype([
+    ('producer_id', '<u2'),
+    ('count_mode', '?'),
+    ('frames', '<u8'),
+    ('first_frame', '<u8'),
+    ('last_frame', '<u8'),
+    ('packets', '<u8'),
+    ('missing', '<u8'),
+    ('duplicates', '<u8'),
+    ('words', '<u8'),
+    ('data_words', '<u8'),
+    ('control_words', '<u8'),
+    ('control_fraction', '<f8'),
+    ('timestamp_min', '<u8'),
+    ('timestamp_max', '<u8')
+])
+
+MISSING_PACKET_DTYPE = np.dtype([
+    ('producer_id', '<u2'),
+    ('count_mode', '?'),
+    ('frame', '<u8'),
+    ('packet_number', '<u4')
+])
+
+
+def decode_packets(reader, records):
+    """
+    Decode the words of a selection of packets of a capture.
+
+    :param reader: PcapReader of the capture
+    :param records: record indices of Tristan data packets
+    :return: structured array of PACKET_SUMMARY_DTYPE, one entry per record
+    """
+    records = np.asarray(records, dtype=np.int64)
+    entries = reader.packet_index()[records]
+    packets = np.zeros(len(records), dtype=PACKET_SUMMARY_DTYPE)
+    packets['record'] = records
+    packets['producer_id'] = entries['producer_id']
+    packets['count_mode'] = entries['count_mode']
+    packets['frame'] = np.where(entries['count_mode'], entries['image'], entries['time_slice'])
+    packets['packet_number'] = entries['packet_number']
+    if len(records) == 0:
+        return packets
+    if (entries['length'] < TRISTAN_HEADER_SIZE).any():
+        raise ValueError("Records without a Tristan packet header selected for decoding")
+
+    # Split the selection into batches of about DECODE_BATCH_BYTES of payload
+    ends = np.cumsum(entries['length'].astype(np.int64))
+    boundaries = np.searchsorted(ends, np.arange(DECODE_BATCH_BYTES, ends[-1], DECODE_BATCH_BYTES))
+    boundaries = np.unique(np.concatenate(([0], boundaries, [len(records)])))
+    for start, end in zip(boundaries[:-1], boundaries[1:]):
+        _decode_batch(reader, packets[start:end])
+    return packets
+
+
+def _decode_batch(reader, packets):
+    """
+    Decode a batch of packets, filling in the word counts of their summaries.
+    """
+    count = len(packets)
+    lengths = reader.payload_lengths[packets['record']] // 8
+    payloads = reader.payloads(packets['record'])
+    words = np.frombuffer(b''.join([payload[:length * 8] for payload, length in
+                                    zip(payloads, lengths.tolist())]), dtype='<u8')
+    starts = np.zeros(count + 1, dtype=np.int64)
+    np.cumsum(lengths, out=starts[1:])
+
+    # The header word count is the length of the packet excluding the first
+    # (zero) header word, and may not exceed the words received
+    word_count = (words[starts[:-1] + 1] & WORD_COUNT_MASK).astype(np.int64)
+    packet_words = np.minimum(lengths, word_count + 1)
+    packets['word_count'] = word_count
+
+    packet = np.repeat(np.arange(count), lengths)
+    position = np.arange(len(words)) - starts[:-1][packet]
+    body = (position >= HEADER_WORDS) & (position < packet_words[packet])
+    control = (words >> CONTROL_WORD_SHIFT).astype(bool)
+    data = np.where(packets['count_mode'][packet],
+                    (words >> INTEGRAL_WORD_SHIFT) == INTEGRAL_DATA_WORD, ~control)
+    data &= body
+    control &= body & ~data
+    control_type = (words >> CONTROL_TYPE_SHIFT) & CONTROL_TYPE_MASK
+    timestamp = control & (control_type == CONTROL_COURSE_TIMESTAMP)
+
+    packets['words'] = np.bincount(packet[body], minlength=count)
+    packets['data_words'] = np.bincount(packet[data], minlength=count)
+    packets['control_words'] = np.bincount(packet[control], minlength=count)
+    packets['timestamp_words'] = np.bincount(packet[timestamp], minlength=count)
+
+    # Every packet has at least its header words, so no reduceat segment is empty
+    course = words & COURSE_TIMESTAMP_MASK
+    packets['timestamp_min'] = np.minimum.reduceat(np.where(timestamp, course, NO_TIMESTAMP),
+                                                   starts[:-1])
+    packets['timestamp_max'] = np.maximum.reduceat(np.where(timestamp, course, 0), starts[:-1])
+    packets['timestamp_max'][packets['timestamp_words'] == 0] = 0
+
+
+def _group(keys):
+    """
+    Return the sort order of keys, the start of each run of equal keys in that
+    order and the number of entries in each run.
+    """
+    order = np.argsort(keys, kind='mergesort')
+    sorted_keys = keys[order]
+    starts = np.flatnonzero(np.concatenate(([True], sorted_keys[1:] != sorted_keys[:-1])))
+    sizes = np.diff(np.concatenate((starts, [len(keys)])))
+    return order, starts, sizes
+
+
+def _control_fraction(control_words, data_words):
+    total = (control_words + data_words).astype(np.float64)
+    return np.divide(control_words, total, out=np.zeros(len(total)), where=total > 0)
+
+
+def summarise_frames(packets):
+    """
+    Summarise decoded packets by producer and frame.
+
+    Packet numbers are counted from zero in each frame, so packets missing from
+    the end of a frame are not detected.  The missing packets of frames with more
+    than MAX_MISSING_LISTED missing are not listed.
+
+    :param packets: structured array of PACKET_SUMMARY_DTYPE
+    :return: (frame summaries of FRAME_SUMMARY_DTYPE, missing packets of
+             MISSING_PACKET_DTYPE) tuple
+    """
+    if len(packets) == 0:
+        return np.zeros(0, dtype=FRAME_SUMMARY_DTYPE), np.zeros(0, dtype=MISSING_PACKET_DTYPE)
+    # Sort by producer, mode, frame and then packet number
+    order = np.lexsort((packets['packet_number'], packets['frame'],
+                        packets['count_mode'], packets['producer_id']))
+    packets = packets[order]
+    key = np.empty(len(packets),
+                   dtype=[('producer_id', '<u2'), ('count_mode', '?'), ('frame', '<u8')])
+    for name in key.dtype.names:
+        key[name] = packets[name]
+    first = np.flatnonzero(np.concatenate(([True], key[1:] != key[:-1])))
+    sizes = np.diff(np.concatenate((first, [len(packets)])))
+    last = first + sizes - 1
+
+    frames = np.zeros(len(first), dtype=FRAME_SUMMARY_DTYPE)
+    for name in key.dtype.names:
+        frames[name] = key[name][first]
+    frames['packets'] = sizes
+    frames['first_packet'] = packets['packet_number'][first]
+    frames['last_packet'] = packets['packet_number'][last]
+    packet_number = packets['packet_number']
+    distinct = np.concatenate(([True], (packet_number[1:] != packet_number[:-1]) |
+                               (key[1:] != key[:-1])))
+    distinct_count = np.add.reduceat(distinct.astype(np.int64), first)
+    frames['duplicates'] = sizes - distinct_count
+    frames['missing'] = frames['last_packet'].astype(np.int64) + 1 - distinct_count
+    for name in ('words', 'data_words', 'control_words'):
+        frames[name] = np.add.reduceat(packets[name].astype(np.uint64), first)
+    frames['control_fraction'] = _control_fraction(frames['control_words'], frames['data_words'])
+    frames['timestamp_min'] = np.minimum.reduceat(packets['timestamp_min'], first)
+    frames['timestamp_max'] = np.maximum.reduceat(packets['timestamp_max'], first)
+
+    # The packet numbers from zero to the last packet of each frame that are absent
+    listed = frames['missing'] <= MAX_MISSING_LISTED
+    expected = np.where(listed, frames['last_packet'].astype(np.int64) + 1, 0)
+    offsets = np.cumsum(expected) - expected
+    group = np.repeat(np.arange(len(frames)), expected)
+    number = np.arange(expected.sum()) - np.repeat(offsets, expected)
+    present = np.zeros(len(number), dtype=bool)
+    packet_group = np.repeat(np.arange(len(frames)), sizes)
+    in_listed = listed[packet_group]
+    present[offsets[packet_group[in_listed]] +
+            packets['packet_number'][in_listed].astype(np.int64)] = True
+    missing = np.zeros(np.count_nonzero(~present), dtype=MISSING_PACKET_DTYPE)
+    for name in key.dtype.names:
+        missing[name] = frames[name][group[~present]]
+    missing['packet_number'] = number[~present]
+    return frames, missing
+
+
+def summarise_producers(frames):
+    """
+    Summarise frame summaries by producer (and mode).
+
+    :param frames: structured array of FRAME_SUMMARY_DTYPE
+    :return: structured array of PRODUCER_SUMMARY_DTYPE
+    """
+    if len(frames) == 0:
+        return np.zeros(0, dtype=PRODUCER_SUMMARY_DTYPE)
+    keys = frames['producer_id'].astype(np.int64) * 2 + frames['count_mode']
+    order, starts, sizes = _group(keys)
+    frames = frames[order]
+    producers = np.zeros(len(starts), dtype=PRODUCER_SUMMARY_DTYPE)
+    producers['producer_id'] = frames['producer_id'][starts]
+    producers['count_mode'] = frames['count_mode'][starts]
+    producers['frames'] = sizes
+    producers['first_frame'] = np.minimum.reduceat(frames['frame'], starts)
+    producers['last_frame'] = np.maximum.reduceat(frames['frame'], starts)
+    for name in ('packets', 'missing', 'duplicates', 'words', 'data_words', 'control_words'):
+        producers[name] = np.add.reduceat(frames[name].astype(np.uint64), starts)
+    producers['control_fraction'] = _control_fraction(producers['control_words'],
+                                                      producers['data_words'])
+    producers['timestamp_min'] = np.minimum.reduceat(frames['timestamp_min'], starts)
+    producers['timestamp_max'] = np.maximum.reduceat(frames['timestamp_max'], starts)
+    return producers
+
+
+def summarise(reader, records):
+    """
+    Decode and summarise a selection of packets of a capture.
+
+    :param reader: PcapReader of the capture
+    :param records: record indices of Tristan data packets
+    :return: dictionary of structured arrays: packets, frames, producers and missing
+    """
+    packets = decode_packets(reader, records)
+    frames, missing = summarise_frames(packets)
+    return {
+        'packets': packets,
+        'frames': frames,
+        'producers': summarise_producers(frames),
+        'missing': missing
+    }
+
+
+def save_summary(filename, summary, attributes=None):
+    """
+    Save a summary to an HDF5 file (one compound dataset per table) or an NPZ
+    file (one array per table), selected by the file extension.
+
+    :param filename: output file name
+    :param summary: dictionary of structured arrays returned by summarise
+    :param attributes: dictionary of scalar attributes (eg the capture and filter)
+    """
+    attributes = dict((key, value) for key, value in (attributes or {}).items()
+                      if value is not None)
+    if os.path.splitext(filename)[1].lower() in HDF5_EXTENSIONS:
+        with h5py.File(filename, 'w') as f:
+            for name, table in summary.items():
+                f.create_dataset(name, data=table, chunks=True if len(table) else None)
+            f.attrs.update(attributes)
+    else:
+        tables = dict(summary)
+        for key, value in attributes.items():
+            tables['attribute_' + key] = np.array(value)
+        np.savez_compressed(filename, **tables)
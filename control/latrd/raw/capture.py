@@ -0,0 +1,245 @@
+"""
+Created on 18 October 2026
+
+Conversion of packet captures into raw mode data files.
+
+In raw mode (the raw_mode configuration of the LATRD process plugin) each frame
+processor appends the words of every packet it receives to a LATRDBuffer and
+writes each full buffer of LATRD::frame_qty words as a frame of the raw_data
+dataset.  For each packet it appends the header word count plus two words from
+the start of the packet's primary_packet_size slot, which is the whole packet
+and the word that follows it in the slot.  The buffer is written, zero padded,
+when an idle packet arrives.
+
+This module reproduces those files from a capture.  The packets are routed to
+ports by frame (time slice or image) as by the replay tools, round robin or by
+the UdpRouting of a UDP configuration, and each port is converted by its own
+process into its own file, reading the capture in batches.  The word that
+follows each packet, which in the frame receiver is whatever was left in the
+buffer slot, is written as zero.
+"""
+import logging
+import multiprocessing
+import os
+
+import h5py
+import numpy as np
+
+from latrd.pcap import PcapReader, TRISTAN_HEADER_SIZE
+
+
+# Frame receiver slot size and frame processor buffer size (LATRDDefinitions.h)
+PRIMARY_PACKET_SIZE = 8192
+FRAME_QTY = 0x400000 // 2
+# Chunking of the raw_data dataset in the frame processor configuration
+RAW_DATA_CHUNK = 524288
+RAW_DATA_DATASET = 'raw_data'
+WORD_COUNT_MASK = np.uint64(0x00000000000007FF)
+
+# Number of packets read from the capture at a time
+CONVERT_BATCH = 16384
+
+
+def raw_words(reader, records):
+    """
+    Return the raw mode words of a sequence of packets, as appended to the raw
+    buffer by the frame processor.
+
+    :param reader: PcapReader of the capture
+    :param records: record indices of Tristan data packets, in arrival order
+    :return: uint64 array of the words of every packet
+    """
+    records = np.asarray(records, dtype=np.int64)
+    if len(records) == 0:
+        return np.zeros(0, dtype=np.uint64)
+    lengths = reader.payload_lengths[records] // 8
+    if (lengths < TRISTAN_HEADER_SIZE // 8).any():
+        raise ValueError("Records without a Tristan packet header selected for conversion")
+    payloads = reader.payloads(records)
+    words = np.frombuffer(b''.join([payload[:length * 8] for payload, length in
+                                    zip(payloads, lengths.tolist())]), dtype='<u8')
+    starts = np.cumsum(lengths) - lengths
+
+    # Header word count plus two words, limited to the receive slot
+    count = (words[starts + 1] & WORD_COUNT_MASK).astype(np.int64) + 2
+    count = np.minimum(count, PRIMARY_PACKET_SIZE // 8)
+    available = np.minimum(count, lengths)
+    out_starts = np.cumsum(count) - count
+
+    raw = np.zeros(int(count.sum()), dtype=np.uint64)
+    position = np.arange(available.sum()) - np.repeat(np.cumsum(available) - available, available)
+    source = np.repeat(starts, available) + position
+    raw[np.repeat(out_starts, available) + position] = words[source]
+    return raw
+
+
+class RawFrameBuffer(object):
+    """
+    Python counterpart of LATRDBuffer for 64 bit raw words.
+
+    Words are appended to a buffer of number_of_points words, and each time the
+    buffer fills it is returned as a frame.  Frame numbers are interleaved
+    between concurrent processes as rank + n * processes.
+    """
+    def __init__(self, number_of_points=FRAME_QTY, processes=1, rank=0):
+        """
+        Create the buffer.
+
+        :param number_of_points: number of words per frame
+        :param processes: number of concurrent frame processors
+        :param rank: rank of this frame processor
+        """
+        self.number_of_points = number_of_points
+        self.processes = processes
+        self.rank = rank
+        self.frame_number = 0
+        self._buffer = np.zeros(number_of_points, dtype=np.uint64)
+        self._current = 0
+
+    def append(self, words):
+        """
+        Append words, returning the frames filled.
+
+        :param words: uint64 array of words
+        :return: list of (frame number, frame array) tuples, the last frame array
+                 is only valid until the next call
+        """
+        frames = []
+        offset = 0
+        while offset < len(words):
+            count = min(len(words) - offset, self.number_of_points - self._current)
+            self._buffer[self._current:self._current + count] = words[offset:offset + count]
+            self._current += count
+            offset += count
+            if self._current == self.number_of_points:
+                frame_number, frame = self.retrieve()
+                if offset < len(words):
+                    # The buffer is refilled before this frame is written
+                    frame = frame.copy()
+                frames.append((frame_number, frame))
+        return frames
+
+    def retrieve(self):
+        """
+        Return the current (zero padded) frame, or None if it holds no words.
+
+        :return: (frame number, frame array) tuple or None
+        """
+        if self._current == 0:
+            return None
+        self._buffer[self._current:] = 0
+        frame = (self.rank + self.frame_number * self.processes, self._buffer)
+        self.frame_number += 1
+        self._current = 0
+        return frame
+
+
+def port_filename(output, rank, ports):
+    """
+    Return the raw file name for a port, output itself for a single port and
+    output with _<rank> before the extension otherwise.
+    """
+    if ports == 1:
+        return output
+    stem, extension = os.path.splitext(output)
+    return '{}_{}{}'.format(stem, rank, extension or '.h5')
+
+
+def convert_port(capture, output, rank=0, ports=1, chunk=RAW_DATA_CHUNK, batch=CONVERT_BATCH,
+                 routing=None):
+    """
+    Write the raw mode file of the frame processor receiving one port.
+
+    :param capture: capture file name
+    :param output: raw mode HDF5 file to create
+    :param rank: index of the port (and frame processor)
+    :param ports: number of ports the packets are routed to
+    :param chunk: chunk size in words of the raw_data dataset
+    :param batch: number of packets read from the capture at a time
+    :param routing: UdpRouting of frames to ports, used instead of round robin
+    :return: dictionary of the file name and the packets, words and frames written
+    """
+    reader = PcapReader(capture, index=True)
+    index = reader.packet_index()
+    frame = np.where(index['count_mode'], index['image'], index['time_slice'])
+    data = (index['length'] >= TRISTAN_HEADER_SIZE) & ~index['idle']
+    if routing is not None:
+        ports = routing.no_of_endpoints
+        routed = routing.endpoint_indices(frame) == rank
+    else:
+        routed = frame % ports == rank
+    records = np.flatnonzero(data & routed)
+
+    # Idle packets empty the raw buffer, so split the packets at each idle packet
+    flushes = np.unique(np.searchsorted(records, reader.idle_records()))
+    flushes = flushes[(flushes > 0) & (flushes < len(records))]
+    boundaries = np.unique(np.concatenate((
+        [0], flushes, np.arange(0, len(records), batch), [len(records)])))
+
+    buffer = RawFrameBuffer(FRAME_QTY, ports, rank)
+    words_written = 0
+    with h5py.File(output, 'w') as f:
+        dataset = f.create_dataset(RAW_DATA_DATASET, shape=(0,), maxshape=(None,),
+                                   dtype=np.uint64, chunks=(chunk,))
+
+        def write(frames):
+            for _, frame_words in frames:
+                offset = dataset.shape[0]
+                dataset.resize((offset + len(frame_words),))
+                dataset[offset:] = frame_words
+
+        flushes = set(flushes.tolist())
+        for start, end in zip(boundaries[:-1].tolist(), boundaries[1:].tolist()):
+            if start in flushes:
+                write(filter(None, [buffer.retrieve()]))
+            words = raw_words(reader, records[start:end])
+            words_written += len(words)
+            write(buffer.append(words))
+        write(filter(None, [buffer.retrieve()]))
+    reader.close()
+    logging.debug("Port %d: %d packets, %d words in %d frames written to %s",
+                  rank, len(records), words_written, buffer.frame_number, output)
+    return {
+        'filename': output,
+        'packets': len(records),
+        'words': words_written,
+        'frames': buffer.frame_number
+    }
+
+
+def _convert_port(args):
+    """
+    Worker process entry point, convert the packets of a single port.
+    """
+    return convert_port(*args)
+
+
+def convert_capture(capture, output, ports=1, processes=None, chunk=RAW_DATA_CHUNK, routing=None):
+    """
+    Convert a capture into a raw mode file per port.
+
+    :param capture: capture file name
+    :param output: raw mode HDF5 file name, suffixed with the port index for
+                   more than one port
+    :param ports: number of ports (and frame processors) to route packets to
+    :param processes: number of worker processes (defaults to one per port)
+    :param chunk: chunk size in words of the raw_data datasets
+    :param routing: UdpRouting of frames to ports, which sets the number of
+                    ports, used instead of round robin
+    :return: list of the dictionaries returned by convert_port, one per port
+    """
+    # Index the capture once so that the workers reuse the index file
+    PcapReader(capture, index=True).close()
+    if routing is not None:
+        ports = routing.no_of_endpoints
+    tasks = [(capture, port_filename(output, rank, ports), rank, ports, chunk, CONVERT_BATCH,
+              routing) for rank in range(ports)]
+    processes = min(processes or ports, ports)
+    if processes == 1:
+        return [_convert_port(task) for task in tasks]
+    pool = multiprocessing.Pool(processes)
+    try:
+        return pool.map(_convert_port, tasks)
+    finally:
+        pool.close()
+        pool.join()
@@ -0,0 +1,245 @@
+"""
+Created on 18 October 2026
+
+Vectorised decoding of Tristan raw mode 64 bit data words.
+
+The raw mode file writer stores every 64 bit word received from the detector
+in the /raw_data dataset.  The functions in this module classify and decode
+whole arrays of those words using NumPy operations rather than walking each
+word through a Python loop.
+"""
+import numpy as np
+
+
+class RawWordType(object):
+    """
+    Control word types identified by the top byte of a raw data word.
+    """
+    EXTENDED_TIMESTAMP = 0x80
+    SHUTTER_OPEN       = 0x84
+    SHUTTER_CLOSE      = 0x88
+    TOA_ERROR          = 0xBF
+
+
+# Default number of words read from a raw data file per block (8 MB)
+DEFAULT_BLOCK_SIZE = 1024 * 1024
+
+
+class RawDefinitions(object):
+    """
+    Bit masks and shifts used to decode raw data words.
+    """
+    TYPE_SHIFT             = np.uint64(56)
+    TYPE_MASK              = np.uint64(0x00000000000000FF)
+    SHUTTER_TIME_MASK      = np.uint64(0x00FFFFFFFFFFFFFF)
+    EXTENDED_TS_MASK       = np.uint64(0x00FFFFFFFF800000)
+    UPPER_SHIFT            = np.uint64(32)
+    POS_X_SHIFT            = np.uint32(50 - 32)
+    POS_Y_SHIFT            = np.uint32(37 - 32)
+    POSITION_MASK          = np.uint32(0x00001FFF)
+    FINE_TS_SHIFT          = np.uint64(14)
+    FINE_TS_MASK           = np.uint64(0x00000000007FFFFF)
+    TOT_MASK               = np.uint16(0x3FFF)
+    TOA_ERROR_MASK         = np.uint64(0x0000000000000003)
+
+
+class DecodedWords(object):
+    """
+    Result of decoding a block of raw data words.
+
+    The event arrays (raw, x, y, toa and tot) are all of equal length and hold one
+    entry per event word.  The extended_timestamp and init_time attributes hold the
+    decode state after the final word of the block, so that they can be passed in
+    when decoding the block that follows.
+
+    The leading_events attribute is the number of events that precede the first
+    timestamp word of the block and were therefore decoded using the carried in
+    extended timestamp, and timestamp_words is the number of 0x80 and 0x84 words
+    found in the block.
+    """
+    def __init__(self, raw, x, y, toa, tot, shutter_open, shutter_close, toa_errors,
+                 extended_timestamp, init_time, leading_events=0, timestamp_words=0):
+        self.raw = raw
+        self.x = x
+        self.y = y
+        self.toa = toa
+        self.tot = tot
+        self.shutter_open = shutter_open
+        self.shutter_close = shutter_close
+        self.toa_errors = toa_errors
+        self.extended_timestamp = extended_timestamp
+        self.init_time = init_time
+        self.leading_events = leading_events
+        self.timestamp_words = timestamp_words
+
+    def __len__(self):
+        return len(self.raw)
+
+    @staticmethod
+    def concatenate(blocks):
+        """
+        Join a sequence of consecutively decoded blocks into a single result.
+
+        :param blocks: sequence of DecodedWords objects in decode order
+        :return: DecodedWords object
+        """
+        blocks = list(blocks)
+        if not blocks:
+            return decode(np.zeros(0, dtype=np.uint64))
+
+        def join(name):
+            return np.concatenate([getattr(block, name) for block in blocks])
+
+        # Leading events run up to the first block that contains a timestamp word
+        leading_events = 0
+        for block in blocks:
+            if block.timestamp_words > 0:
+                leading_events += block.leading_events
+                break
+            leading_events += len(block)
+
+        return DecodedWords(
+            raw=join('raw'),
+            x=join('x'),
+            y=join('y'),
+            toa=join('toa'),
+            tot=join('tot'),
+            shutter_open=join('shutter_open'),
+            shutter_close=join('shutter_close'),
+            toa_errors=join('toa_errors'),
+            extended_timestamp=blocks[-1].extended_timestamp,
+            init_time=blocks[-1].init_time,
+            leading_events=leading_events,
+            timestamp_words=sum(block.timestamp_words for block in blocks)
+        )
+
+
+def word_types(words):
+    """
+    Return the type byte (top 8 bits) of each word.
+
+    :param words: uint64 array of raw data words
+    :return: uint8 array of word types
+    """
+    return ((words >> RawDefinitions.TYPE_SHIFT) & RawDefinitions.TYPE_MASK).astype(np.uint8)
+
+
+def toa_error_type(word):
+    """
+    Return a description of a ToA error/warning word.
+
+    :param word: the 0xBF raw data word
+    :return: description string
+    """
+    descriptions = ('ToA warning', 'ToA warning clear', 'ToA error', 'ToA error clear')
+    return descriptions[int(word) & int(RawDefinitions.TOA_ERROR_MASK)]
+
+
+def decode(words, extended_timestamp=0, init_time=0):
+    """
+    Decode a block of raw data words.
+
+    Each event word has its fine ToA combined with the most recent extended
+    timestamp, taken from either an 0x80 extended timestamp word or an 0x84 shutter
+    open word.  Events that occur before any timestamp word in the block use the
+    extended_timestamp argument.
+
+    :param words: uint64 array of raw data words
+    :param extended_timestamp: extended timestamp in force at the start of the block
+    :param init_time: shutter open time in force at the start of the block
+    :return: DecodedWords object
+    """
+    words = np.ascontiguousarray(words, dtype=np.uint64)
+
+    # Event words have the top bit clear, so they are the non-negative values when
+    # viewed as signed integers.  Control words are sparse, so all of the control word
+    # classification is carried out on the (much smaller) array of control words only.
+    is_event = words.view(np.int64) >= 0
+    ctrl_pos = np.flatnonzero(~is_event)
+    ctrl = words[ctrl_pos]
+    types = word_types(ctrl)
+    is_open = types == RawWordType.SHUTTER_OPEN
+    is_timestamp = is_open | (types == RawWordType.EXTENDED_TIMESTAMP)
+
+    events = words[is_event]
+
+    # Forward fill the extended timestamp.  The number of events preceding each
+    # timestamp word splits the events into runs, each of which takes the value of
+    # the timestamp word that starts it (or the carried in value for the first run)
+    ts_values = np.empty(np.count_nonzero(is_timestamp) + 1, dtype=np.uint64)
+    ts_values[0] = extended_timestamp
+    ts_values[1:] = ctrl[is_timestamp] & RawDefinitions.EXTENDED_TS_MASK
+    events_before = ctrl_pos[is_timestamp] - np.flatnonzero(is_timestamp)
+    run_lengths = np.diff(np.concatenate(([0], events_before, [len(events)])))
+
+    toa = (events >> RawDefinitions.FINE_TS_SHIFT) & RawDefinitions.FINE_TS_MASK
+    toa += np.repeat(ts_values, run_lengths)
+    # Position fields both lie within the upper 32 bits of the word
+    upper = (events >> RawDefinitions.UPPER_SHIFT).astype(np.uint32)
+    x = ((upper >> RawDefinitions.POS_X_SHIFT) & RawDefinitions.POSITION_MASK).astype(np.uint16)
+    y = ((upper >> RawDefinitions.POS_Y_SHIFT) & RawDefinitions.POSITION_MASK).astype(np.uint16)
+    tot = events.astype(np.uint16) & RawDefinitions.TOT_MASK
+
+    shutter_open = ctrl[is_open] & RawDefinitions.SHUTTER_TIME_MASK
+    if len(shutter_open) > 0:
+        init_time = int(shutter_open[-1])
+
+    return DecodedWords(
+        raw=events,
+        x=x,
+        y=y,
+        toa=toa,
+        tot=tot,
+        shutter_open=shutter_open,
+        shutter_close=ctrl[types == RawWordType.SHUTTER_CLOSE],
+        toa_errors=ctrl[types == RawWordType.TOA_ERROR],
+        extended_timestamp=int(ts_values[-1]),
+        init_time=init_time,
+        leading_events=int(run_lengths[0]),
+        timestamp_words=len(ts_values) - 1
+    )
+
+
+def block_size_for(dataset, block_size=DEFAULT_BLOCK_SIZE):
+    """
+    Return a read size that is a whole number of dataset chunks.
+
+    :param dataset: h5py dataset (or any array like object)
+    :param block_size: requested number of words per read
+    :return: number of words per read, rounded down to a whole number of chunks
+    """
+    chunks = getattr(dataset, 'chunks', None)
+    if chunks:
+        return max(1, int(block_size) // chunks[0]) * chunks[0]
+    return max(1, int(block_size))
+
+
+def iter_decode(dataset, block_size=DEFAULT_BLOCK_SIZE, start=0, stop=None,
+                extended_timestamp=0, init_time=0):
+    """
+    Decode a raw data dataset one chunk aligned block at a time.
+
+    The extended timestamp and shutter open time are carried from each block into
+    the next, so the concatenation of the yielded blocks is identical to decoding
+    the whole dataset in one call to decode.  Only a single block of raw words is
+    held in memory at any time.
+
+    :param dataset: h5py raw_data dataset (or any sliceable array of uint64 words)
+    :param block_size: number of words to read per block (rounded to whole chunks)
+    :param start: index of the first word to decode
+    :param stop: index after the last word to decode (defaults to the dataset length)
+    :param extended_timestamp: extended timestamp in force at the start word
+    :param init_time: shutter open time in force at the start word
+    :return: generator of DecodedWords objects
+    """
+    if stop is None:
+        stop = len(dataset)
+    block_size = block_size_for(dataset, block_size)
+    while start < stop:
+        # Keep reads aligned to block boundaries within the dataset
+        end = min(stop, (start // block_size + 1) * block_size)
+        decoded = decode(dataset[start:end], extended_timestamp, init_time)
+        extended_timestamp = decoded.extended_timestamp
+        init_time = decoded.init_time
+        start = end
+        yield decoded
@@ -0,0 +1,171 @@
+"""
+Created on 18 October 2026
+
+Compact storage for decoded Tristan events.
+
+Events are held in a single NumPy structured array with one 14 byte record per
+event, rather than in parallel lists of Python integers.  The array grows by
+whole blocks as decoded data is appended.
+
+tristan_parse_raw_h5 is the only tool that accumulates decoded x, y, ToA and
+ToT events.  The sandbox time slice parser writes pixel ids and time offsets in
+batches as it goes, and latrd_pcap_to_raw writes undecoded raw words, so neither
+holds events to store here.
+"""
+import os
+
+import h5py
+import numpy as np
+
+
+EVENT_DTYPE = np.dtype([
+    ('x', np.uint16),
+    ('y', np.uint16),
+    ('toa', np.uint64),
+    ('tot', np.uint16)
+])
+
+HDF5_EXTENSIONS = ('.h5', '.hdf5', '.hdf', '.nxs')
+
+
+def events_from_decoded(decoded):
+    """
+    Create a structured event array from a decoded block of raw data words.
+
+    :param decoded: DecodedWords object
+    :return: structured array of EVENT_DTYPE
+    """
+    events = np.empty(len(decoded), dtype=EVENT_DTYPE)
+    events['x'] = decoded.x
+    events['y'] = decoded.y
+    events['toa'] = decoded.toa
+    events['tot'] = decoded.tot
+    return events
+
+
+class EventArray(object):
+    """
+    Growable container of decoded events backed by a structured array.
+
+    Indexing or slicing an EventArray returns the corresponding records of the
+    underlying structured array, and the x, y, toa and tot properties return views
+    of the individual fields.
+    """
+    def __init__(self, events=None, capacity=0):
+        """
+        Initialise the container.
+
+        :param events: optional initial structured array of EVENT_DTYPE
+        :param capacity: number of events to reserve space for
+        """
+        self._size = 0
+        self._data = np.empty(capacity, dtype=EVENT_DTYPE)
+        if events is not None:
+            self.append(events)
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, item):
+        return self.data[item]
+
+    @property
+    def data(self):
+        """
+        Return a view of the populated part of the structured array.
+        """
+        return self._data[:self._size]
+
+    @property
+    def x(self):
+        return self.data['x']
+
+    @property
+    def y(self):
+        return self.data['y']
+
+    @property
+    def toa(self):
+        return self.data['toa']
+
+    @property
+    def tot(self):
+        return self.data['tot']
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes
+
+    def reserve(self, capacity):
+        """
+        Ensure there is space for at least capacity events without reallocation.
+
+        :param capacity: total number of events
+        """
+        if capacity > len(self._data):
+            data = np.empty(capacity, dtype=EVENT_DTYPE)
+            data[:self._size] = self._data[:self._size]
+            self._data = data
+
+    def append(self, block):
+        """
+        Append a block of events.
+
+        Storage grows geometrically so that appending many small blocks is cheap.
+
+        :param block: structured array of EVENT_DTYPE, DecodedWords or EventArray
+        """
+        if isinstance(block, EventArray):
+            block = block.data
+        elif not isinstance(block, np.ndarray):
+            block = events_from_decoded(block)
+        required = self._size + len(block)
+        if required > len(self._data):
+            self.reserve(max(required, 2 * len(self._data)))
+        self._data[self._size:required] = block
+        self._size = required
+
+    def trim(self):
+        """
+        Release any reserved but unused storage.
+        """
+        if len(self._data) > self._size:
+            self._data = self._data[:self._size].copy()
+
+    def save(self, filename, group='/'):
+        """
+        Save the events to a .npy file or an HDF5 file.
+
+        HDF5 files have one dataset per field (x, y, toa and tot) within group.
+
+        :param filename: output file name, the extension selects the format
+        :param group: HDF5 group to write the datasets into
+        """
+        if os.path.splitext(filename)[1].lower() in HDF5_EXTENSIONS:
+            with h5py.File(filename, 'a') as f:
+                grp = f.require_group(group)
+                for name in EVENT_DTYPE.names:
+                    if name in grp:
+                        del grp[name]
+                    grp.create_dataset(name, data=self.data[name], chunks=True)
+        else:
+            np.save(filename, self.data)
+
+    @staticmethod
+    def load(filename, group='/'):
+        """
+        Load events from a .npy file or an HDF5 file written by save.
+
+        :param filename: input file name, the extension selects the format
+        :param group: HDF5 group to read the datasets from
+        :return: EventArray object
+        """
+        if os.path.splitext(filename)[1].lower() in HDF5_EXTENSIONS:
+            with h5py.File(filename, 'r') as f:
+                grp = f[group]
+                events = np.empty(len(grp[EVENT_DTYPE.names[0]]), dtype=EVENT_DTYPE)
+                for name in EVENT_DTYPE.names:
+                    events[name] = grp[name][...]
+        else:
+            events = np.load(filename)
+        return EventArray(events)
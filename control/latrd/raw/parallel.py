@@ -0,0 +1,102 @@
+"""
+Created on 18 October 2026
+
+Multi-process decoding of a single Tristan raw mode data file.
+
+The raw_data dataset is split into chunk aligned ranges which are decoded
+independently by a pool of worker processes.  Each range is decoded with no
+carried in state, and the parent process then reconciles the events that
+precede the first timestamp word of each range against the last 0x80 or 0x84
+word of the ranges before it.  The result is identical to a serial decode.
+"""
+import multiprocessing
+
+import h5py
+import numpy as np
+
+from latrd.raw.decoder import DecodedWords, iter_decode, block_size_for, DEFAULT_BLOCK_SIZE
+
+
+def split_ranges(length, count, alignment=1):
+    """
+    Split a dataset into contiguous aligned ranges.
+
+    :param length: number of words in the dataset
+    :param count: number of ranges required
+    :param alignment: ranges start on multiples of this many words
+    :return: list of (start, stop) tuples
+    """
+    step = -(-length // max(1, count))
+    step = max(alignment, -(-step // alignment) * alignment)
+    return [(start, min(length, start + step)) for start in range(0, length, step)]
+
+
+def _decode_range(args):
+    """
+    Worker process entry point, decode a single range of a raw data file.
+    """
+    filename, dataset_name, start, stop, block_size = args
+    with h5py.File(filename, 'r') as f:
+        blocks = list(iter_decode(f[dataset_name], block_size, start, stop))
+    return DecodedWords.concatenate(blocks)
+
+
+def reconcile(ranges, extended_timestamp=0, init_time=0):
+    """
+    Apply the decode state carried from each range into the next.
+
+    Each range must have been decoded with an extended timestamp and shutter open
+    time of zero.  The leading events of each range are corrected in place using the
+    extended timestamp of the nearest preceding range that contains a timestamp word.
+
+    :param ranges: sequence of DecodedWords objects in file order
+    :param extended_timestamp: extended timestamp in force at the start of the first range
+    :param init_time: shutter open time in force at the start of the first range
+    :return: the list of reconciled DecodedWords objects
+    """
+    ranges = list(ranges)
+    for decoded in ranges:
+        if extended_timestamp:
+            decoded.toa[:decoded.leading_events] += np.uint64(extended_timestamp)
+        if decoded.timestamp_words > 0:
+            extended_timestamp = decoded.extended_timestamp
+        else:
+            decoded.extended_timestamp = extended_timestamp
+        if len(decoded.shutter_open) > 0:
+            init_time = decoded.init_time
+        else:
+            decoded.init_time = init_time
+    return ranges
+
+
+def parallel_decode(filename, processes=None, dataset_name='raw_data',
+                    block_size=DEFAULT_BLOCK_SIZE, ranges_per_process=4):
+    """
+    Decode a raw data file using a pool of worker processes.
+
+    :param filename: raw mode HDF5 file
+    :param processes: number of worker processes (defaults to the number of CPUs)
+    :param dataset_name: name of the raw data dataset
+    :param block_size: number of words each worker reads at a time
+    :param ranges_per_process: split the file into this many ranges per process
+    :return: DecodedWords object identical to a serial decode of the whole file
+    """
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    with h5py.File(filename, 'r') as f:
+        dataset = f[dataset_name]
+        length = len(dataset)
+        alignment = block_size_for(dataset, 1)
+
+    ranges = split_ranges(length, processes * ranges_per_process, alignment)
+    tasks = [(filename, dataset_name, start, stop, block_size) for start, stop in ranges]
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        decoded = pool.map(_decode_range, tasks, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+    return DecodedWords.concatenate(reconcile(decoded))
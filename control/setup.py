@@ -57,7 +57,8 @@ setup(
     # run-time dependencies here. These will be installed by pip when the project is installed.
     #install_requires=['numpy==1.11.1', 'h5py==2.6.0', 'future==0.15.2', 'enum34==1.1.6', 'npyscreen==4.10.5',
     # 'pyzmq==15.3.0'],
-    install_requires=['odin-control', 'odin-data', 'configparser', 'python-dateutil', 'enum34', 'dpkt'],
+    install_requires=['odin-control', 'odin-data', 'configparser', 'python-dateutil', 'enum34',
+                      'dpkt', 'numpy', 'h5py'],
 
     # Additional groups of dependencies (e.g. development dependencies). 
     # You can install these using the following syntax, for example:
@@ -0,0 +1,94 @@
+"""
+Created on 18 October 2026
+
+Tests of the binary caches of the ASCII stack reader in the sandbox scripts.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'sandbox'))
+
+import ascii_stack_reader
+from ascii_stack_reader import AsciiStackReader
+
+
+def write_words(filename, words, mtime=None):
+    with open(filename, 'w') as out_file:
+        for word in words:
+            out_file.write("{:016X}\n".format(word))
+    if mtime is not None:
+        os.utime(filename, (mtime, mtime))
+
+
+class AsciiCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'data_0.txt')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_convert(self):
+        write_words(self.filename, range(10))
+        self.assertFalse(ascii_stack_reader.cache_is_valid(self.filename))
+        cache = ascii_stack_reader.convert(self.filename, lines_per_block=3)
+        self.assertEqual(cache, self.filename + ascii_stack_reader.CACHE_EXTENSION)
+        self.assertTrue(ascii_stack_reader.cache_is_valid(self.filename))
+        self.assertEqual(np.load(cache).tolist(), list(range(10)))
+
+    def test_empty_file(self):
+        write_words(self.filename, [])
+        self.assertEqual(len(ascii_stack_reader.load(self.filename)), 0)
+
+    def test_refresh(self):
+        write_words(self.filename, [1, 2, 3], time.time() - 10)
+        self.assertEqual(ascii_stack_reader.load(self.filename).tolist(), [1, 2, 3])
+        # A changed file invalidates the cache
+        write_words(self.filename, [4, 5], time.time())
+        self.assertFalse(ascii_stack_reader.cache_is_valid(self.filename))
+        self.assertEqual(ascii_stack_reader.load(self.filename).tolist(), [4, 5])
+
+    def test_cache_dir(self):
+        cache_dir = os.path.join(self.directory, 'cache')
+        os.mkdir(cache_dir)
+        write_words(self.filename, [7])
+        ascii_stack_reader.load(self.filename, cache_dir)
+        self.assertTrue(os.path.isfile(os.path.join(cache_dir, 'data_0.txt.npy')))
+        self.assertFalse(ascii_stack_reader.cache_is_valid(self.filename))
+
+
+class AsciiStackReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        now = time.time()
+        # Files are read in order of modification time
+        write_words(os.path.join(self.directory, 'b.txt'), range(5), now - 20)
+        write_words(os.path.join(self.directory, 'a.txt'), range(5, 12), now - 10)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_read_block(self):
+        reader = AsciiStackReader(self.directory)
+        self.assertEqual(reader.read_block(4).tolist(), [0, 1, 2, 3])
+        # Blocks continue across files
+        self.assertEqual(reader.read_block(4).tolist(), [4, 5, 6, 7])
+        self.assertEqual(reader.read_next(), "0000000000000008\n")
+        self.assertEqual(reader.read_block(10).tolist(), [9, 10, 11])
+        self.assertEqual(len(reader.read_block(10)), 0)
+        self.assertIsNone(reader.read_next())
+
+    def test_caches_skipped(self):
+        AsciiStackReader(self.directory).read_block(12)
+        # A second reader of the directory ignores the caches created by the first
+        reader = AsciiStackReader(self.directory)
+        self.assertEqual(len(reader.files), 1)
+        self.assertEqual(reader.read_block(20).tolist(), list(range(12)))
@@ -0,0 +1,136 @@
+"""
+Created on 18 October 2026
+
+Tests of the PUT handlers of the Tristan control adapter against a simple
+detector, checking that the replies from the detector are returned in the
+response.
+"""
+import json
+import threading
+import unittest
+
+import zmq
+from zmq.utils.strtypes import cast_bytes
+from tornado.ioloop import IOLoop
+
+from latrd.detector.latrd_channel import LATRDChannel
+from latrd.detector.latrd_message import LATRDMessage, GetMessage, PutMessage, PostMessage, \
+    ResponseMessage
+from latrd.detector.tristan_control_adapter import TristanControlAdapter
+
+FIRMWARE = '1.0.0'
+
+
+class Detector(object):
+    """
+    ROUTER socket answering status requests with its state, storing the
+    configuration it is sent and moving through the armed and running states
+    as the commands arrive.
+    """
+    def __init__(self):
+        self.state = 'idle'
+        self.config = {}
+        self.commands = []
+        self._channel = LATRDChannel(LATRDChannel.CHANNEL_TYPE_ROUTER)
+        self._channel.socket.setsockopt(zmq.LINGER, 0)
+        self._channel.socket.setsockopt(zmq.SNDHWM, 0)
+        port = self._channel.socket.bind_to_random_port('tcp://127.0.0.1')
+        self.endpoint = 'tcp://127.0.0.1:{}'.format(port)
+        self._running = True
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.start()
+
+    def _serve(self):
+        while self._running:
+            if self._channel.poll(10) != LATRDChannel.POLLIN:
+                continue
+            identity = self._channel.recv()
+            msg = LATRDMessage.parse_json(self._channel.recv())
+            data = None
+            if isinstance(msg, GetMessage) and 'status' in msg.params:
+                data = {'status': {'state': self.state,
+                                   'detector': {'software_version': FIRMWARE}}}
+            elif isinstance(msg, PutMessage):
+                self.config.update(msg.params['config'])
+            elif isinstance(msg, PostMessage):
+                command = msg.params['command']
+                self.commands.append(command)
+                self.state = {'arm': 'armed', 'run': 'running', 'stop': 'idle'}.get(command,
+                                                                                   self.state)
+            reply = ResponseMessage(msg.msg_id, data)
+            self._channel.send_multi([identity, cast_bytes(reply.encode())])
+        self._channel.close()
+
+    def close(self):
+        self._running = False
+        self._thread.join()
+
+
+class Request(object):
+    """
+    PUT request with a body, as passed to the adapter by odin-control.
+    """
+    def __init__(self, body=''):
+        self.body = body
+        self.headers = {'Accept': 'application/json', 'Content-Type': 'application/json'}
+
+
+class TristanControlAdapterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.detector = Detector()
+        self.adapter = self.create_adapter(self.detector.endpoint)
+
+    def tearDown(self):
+        self.adapter.cleanup()
+        self.detector.close()
+
+    @staticmethod
+    def create_adapter(endpoint):
+        return TristanControlAdapter(endpoint=endpoint, firmware=FIRMWARE,
+                                     update_interval=0.5, udp_file='')
+
+    def put(self, path, body=''):
+        return IOLoop.current().run_sync(lambda: self.adapter.put(path, Request(body)),
+                                         timeout=30)
+
+    def test_is_async(self):
+        self.assertTrue(self.adapter.is_async)
+
+    def test_config(self):
+        response = self.put('config/exposure/2.0')
+        self.assertEqual(response.status_code, 200)
+        # The GUI parses the reply from the detector
+        reply = json.loads(response.data['reply'])
+        self.assertEqual(reply['msg_type'], LATRDMessage.MSG_TYPE_RESPONSE)
+        self.assertEqual(self.detector.config, {'exposure': 2.0})
+
+    def test_engineering(self):
+        response = self.put('engineering_put', json.dumps({'mode': 'count'}))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('msg_id', json.loads(response.data['reply']))
+        self.assertEqual(self.detector.config, {'mode': 'count'})
+
+    def test_command(self):
+        response = self.put('command/stop_acquisition')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('msg_id', json.loads(response.data['reply']))
+        self.assertEqual(self.detector.commands, ['stop'])
+
+    def test_start_acquisition(self):
+        response = self.put('command/start_acquisition')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('msg_id', json.loads(response.data['reply']))
+        self.assertEqual(self.detector.commands, ['arm', 'run'])
+        self.assertFalse(self.adapter._parameters['status']['acquisition_complete'])
+
+    def test_no_reply(self):
+        self.adapter.cleanup()
+        self.detector.close()
+        self.adapter = self.create_adapter(self.detector.endpoint)
+        response = self.put('config/exposure/2.0')
+        self.assertEqual(response.status_code, 408)
+        self.assertEqual(response.data['reply'], TristanControlAdapter.ERROR_NO_RESPONSE)
+        response = self.put('command/start_acquisition')
+        self.assertEqual(response.status_code, 408)
+        self.detector = Detector()
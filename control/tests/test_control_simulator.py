@@ -0,0 +1,40 @@
+"""
+Created on 18 October 2026
+
+Tests of the UDP configuration handling of the detector control simulator.
+"""
+import unittest
+
+from latrd.detector.control_simulator import LATRDControlSimulator
+
+
+class UdpConfigTest(unittest.TestCase):
+
+    ENDPOINTS = [('127.0.0.1', 61649)]
+    CONFIG = {'destinations': [{'ip': '127.0.0.1', 'port': 61700},
+                               {'ip': '127.0.0.1', 'port': 61701}]}
+    ROUTED = [('127.0.0.1', 61700), ('127.0.0.1', 61701)]
+
+    def setUp(self):
+        self.simulator = LATRDControlSimulator(endpoints=self.ENDPOINTS)
+
+    def endpoints(self):
+        return self.simulator._daq._routing.endpoints
+
+    def test_applied_while_idle(self):
+        # Before any run the producer still has packets to send
+        self.assertTrue(self.simulator._daq.running())
+        self.simulator.apply_udp_config(self.CONFIG)
+        self.assertEqual(self.endpoints(), self.ROUTED)
+
+    def test_deferred_while_running(self):
+        self.simulator._acquiring = True
+        self.simulator.apply_udp_config(self.CONFIG)
+        self.assertEqual(self.endpoints(), self.ENDPOINTS)
+        self.simulator.finish_run()
+        self.assertEqual(self.endpoints(), self.ROUTED)
+        self.assertEqual(self.simulator._store['status']['state'], 'idle')
+
+    def test_invalid_config_ignored(self):
+        self.simulator.apply_udp_config({'destinations': []})
+        self.assertEqual(self.endpoints(), self.ENDPOINTS)
@@ -0,0 +1,81 @@
+"""
+Created on 18 October 2026
+
+Tests of the vectorised decoding of data words in the sandbox scripts against
+the original per word DataWord class.
+"""
+import os
+import sys
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'sandbox'))
+
+from data_word import DataWord, DataWordBlock, DataWordException, parse_hex_lines
+
+
+def random_words(count, seed=1):
+    random = np.random.RandomState(seed)
+    words = random.randint(0, 2**32, size=count).astype(np.uint64) << np.uint64(32)
+    words |= random.randint(0, 2**32, size=count).astype(np.uint64)
+    return words
+
+
+class ParseHexLinesTest(unittest.TestCase):
+
+    def test_matches_data_word(self):
+        lines = ["{:016X}\n".format(int(word)) for word in random_words(100)]
+        lines += ["8000000000000000,\n", " 1f\x00 ", "abc", "\t0000000000000001 \n"]
+        words = parse_hex_lines(lines)
+        self.assertEqual(words.dtype, np.uint64)
+        self.assertEqual(words.tolist(), [DataWord(line).raw for line in lines])
+
+    def test_only_trailing_comma_removed(self):
+        self.assertEqual(parse_hex_lines(["12,\n"]).tolist(), [0x12])
+        self.assertRaises(DataWordException, parse_hex_lines, ["1,2\n"])
+        self.assertRaises(DataWordException, parse_hex_lines, ["12G\n"])
+
+    def test_empty(self):
+        self.assertEqual(len(parse_hex_lines([])), 0)
+
+
+class DataWordBlockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.words = random_words(1000)
+        self.block = DataWordBlock(self.words)
+        self.data_words = [DataWord("{:X}".format(int(word))) for word in self.words]
+
+    def test_fields(self):
+        self.assertEqual(self.block.is_ctrl.tolist(), [w.is_ctrl for w in self.data_words])
+        self.assertEqual(self.block.is_event.tolist(), [w.is_event for w in self.data_words])
+        ctrl = [w for w in self.data_words if w.is_ctrl]
+        events = [w for w in self.data_words if w.is_event]
+        block = self.block[self.block.is_ctrl]
+        self.assertEqual(block.ctrl_type.tolist(), [w.ctrl_type for w in ctrl])
+        self.assertEqual(block.timestamp_course.tolist(), [w.timestamp_course for w in ctrl])
+        block = self.block[self.block.is_event]
+        self.assertEqual(block.timestamp_fine.tolist(), [w.timestamp_fine for w in events])
+        self.assertEqual(block.energy.tolist(), [w.energy for w in events])
+        self.assertEqual(block.pos_x.tolist(), [w.pos_x for w in events])
+        self.assertEqual(block.pos_y.tolist(), [w.pos_y for w in events])
+
+    def test_course_timestamps(self):
+        prev_courses, courses, prev_course, course = self.block.course_timestamps(0, 0)
+        expected_prev = expected = 0
+        for index, word in enumerate(self.data_words):
+            if word.is_ctrl and word.ctrl_type == DataWordBlock.EXTENDED_TIME:
+                expected_prev, expected = expected, word.timestamp_course
+            self.assertEqual(prev_courses[index], expected_prev)
+            self.assertEqual(courses[index], expected)
+        self.assertEqual((prev_course, course), (expected_prev, expected))
+
+    def test_full_timestamp(self):
+        # Events are taken against courses either side of a rollover of the fine time
+        events = self.block[self.block.is_event]
+        data_words = [w for w in self.data_words if w.is_event]
+        for prev_course, course in [(0, 0x1000000), (0x0FF8000, 0x1000000), (0x1000000, 0x1300000)]:
+            full_ts = events.full_timestmap(prev_course, course)
+            self.assertEqual(full_ts.tolist(),
+                             [w.full_timestmap(prev_course, course) for w in data_words])
@@ -0,0 +1,136 @@
+"""
+Created on 18 October 2026
+
+Tests of the vectorised raw mode word decoder and the reconciliation of
+independently decoded ranges.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import h5py
+import numpy as np
+
+from latrd.raw.decoder import DecodedWords, decode, iter_decode
+from latrd.raw.parallel import parallel_decode, reconcile, split_ranges
+
+
+def reference_decode(words):
+    """
+    Decode raw data words one at a time, as tristan_parse_raw_h5 used to.
+    """
+    x, y, toa, tot = [], [], [], []
+    extended_timestamp = 0
+    for word in words:
+        word = int(word)
+        word_type = (word >> 56) & 0xFF
+        if word_type == 0x84:
+            extended_timestamp = word & 0x00FFFFFFFF800000
+        elif (word >> 63) & 0x1 == 0:
+            x.append((word >> 50) & 0x1FFF)
+            y.append((word >> 37) & 0x1FFF)
+            toa.append(((word >> 14) & 0x7FFFFF) + extended_timestamp)
+            tot.append(word & 0x3FFF)
+        elif word_type == 0x80:
+            extended_timestamp = word & 0x00FFFFFFFF800000
+    return x, y, toa, tot
+
+
+def make_words(count, seed=0, leading_events=10):
+    """
+    Create a stream of random event words with control words scattered through
+    it, starting with a number of events before the first timestamp word.
+    """
+    random_state = np.random.RandomState(seed)
+    words = random_state.randint(0, 2**62, count, dtype=np.int64).astype(np.uint64)
+    control = np.flatnonzero(random_state.random_sample(count) < 0.05)
+    control = control[control >= leading_events]
+    types = random_state.choice([0x80, 0x80, 0x84, 0x88, 0xBF], len(control))
+    payload = random_state.randint(0, 2**55, len(control), dtype=np.int64).astype(np.uint64)
+    words[control] = (types.astype(np.uint64) << np.uint64(56)) | payload
+    return words
+
+
+class DecoderTest(unittest.TestCase):
+
+    def assert_decoded(self, decoded, words):
+        x, y, toa, tot = reference_decode(words)
+        self.assertEqual(decoded.x.tolist(), x)
+        self.assertEqual(decoded.y.tolist(), y)
+        self.assertEqual(decoded.toa.tolist(), toa)
+        self.assertEqual(decoded.tot.tolist(), tot)
+
+    def test_decode_matches_word_loop(self):
+        words = make_words(20000)
+        decoded = decode(words)
+        self.assert_decoded(decoded, words)
+        self.assertEqual(decoded.raw.tolist(), [int(word) for word in words
+                                                if not int(word) >> 63])
+
+    def test_decode_control_words(self):
+        words = np.array([0x8400000012345678, 0x0000000000004001, 0x8800000000000010,
+                          0xBF00000000000002, 0x8000000001800000, 0x0000000000008002],
+                         dtype=np.uint64)
+        decoded = decode(words)
+        self.assertEqual(decoded.shutter_open.tolist(), [0x12345678])
+        self.assertEqual(decoded.shutter_close.tolist(), [0x8800000000000010])
+        self.assertEqual(decoded.toa_errors.tolist(), [0xBF00000000000002])
+        self.assertEqual(decoded.init_time, 0x12345678)
+        self.assertEqual(decoded.extended_timestamp, 0x1800000)
+        self.assertEqual(decoded.timestamp_words, 2)
+        self.assertEqual(decoded.leading_events, 0)
+        self.assert_decoded(decoded, words)
+
+    def test_decode_empty(self):
+        decoded = decode(np.zeros(0, dtype=np.uint64))
+        self.assertEqual(len(decoded), 0)
+        self.assertEqual(decoded.timestamp_words, 0)
+
+    def test_iter_decode_carries_state(self):
+        words = make_words(10000, seed=1)
+        blocks = list(iter_decode(words, block_size=777))
+        self.assertEqual(len(blocks), -(-len(words) // 777))
+        self.assert_decoded(DecodedWords.concatenate(blocks), words)
+
+    def test_reconcile_ranges(self):
+        words = make_words(10000, seed=2)
+        # Include a range with no timestamp words, whose events all take the
+        # extended timestamp of the ranges before it
+        words[4000:4500] &= np.uint64(0x7FFFFFFFFFFFFFFF)
+        ranges = split_ranges(len(words), 20, alignment=100)
+        decoded = [decode(words[start:stop]) for start, stop in ranges]
+        self.assertTrue(any(block.timestamp_words == 0 for block in decoded))
+        whole = decode(words)
+        reconciled = DecodedWords.concatenate(reconcile(decoded))
+        self.assert_decoded(reconciled, words)
+        self.assertEqual(reconciled.extended_timestamp, whole.extended_timestamp)
+        self.assertEqual(reconciled.init_time, whole.init_time)
+        self.assertEqual(reconciled.leading_events, whole.leading_events)
+
+    def test_split_ranges(self):
+        ranges = split_ranges(1050, 4, alignment=100)
+        self.assertEqual(ranges, [(0, 300), (300, 600), (600, 900), (900, 1050)])
+        self.assertEqual(split_ranges(0, 4), [])
+
+
+class ParallelDecodeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'raw.h5')
+        self.words = make_words(50000, seed=3, leading_events=500)
+        with h5py.File(self.filename, 'w') as f:
+            f.create_dataset('raw_data', data=self.words, chunks=(1000,))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_parallel_decode_matches_serial(self):
+        decoded = parallel_decode(self.filename, processes=2, block_size=2000)
+        serial = decode(self.words)
+        for name in ('raw', 'x', 'y', 'toa', 'tot', 'shutter_open', 'shutter_close',
+                     'toa_errors'):
+            self.assertTrue(np.array_equal(getattr(decoded, name), getattr(serial, name)), name)
+        self.assertEqual(decoded.extended_timestamp, serial.extended_timestamp)
+        self.assertEqual(decoded.leading_events, serial.leading_events)
@@ -0,0 +1,59 @@
+"""
+Created on 18 October 2026
+
+Tests of the vectorised packet builder of the event simulator against the
+original per word TristanPacket class.
+"""
+import unittest
+
+from latrd.detector.event_simulator import GeneratorState, TristanDefinitions, TristanPacket, \
+    TristanPacketBuilder
+
+# Start close to a fine timestamp rollover so that course timestamp words are inserted
+ROLLOVER = TristanDefinitions.FINE_TIMESTAMP_MASK + 1
+TIMESTAMP = 5 * ROLLOVER - 1500
+
+
+def reference_packets(state, time_slice, no_of_packets, words_per_packet):
+    return [TristanPacket(words_per_packet, time_slice, state).to_packet()
+            for _ in range(no_of_packets)]
+
+
+def counters(state):
+    return state.word_index, state.timestamp, state.packet_number
+
+
+class TristanPacketBuilderTest(unittest.TestCase):
+
+    def test_build(self):
+        state = GeneratorState(word_index=7, timestamp=TIMESTAMP, packet_number=3)
+        builder = TristanPacketBuilder(400, GeneratorState(word_index=7, timestamp=TIMESTAMP,
+                                                           packet_number=3))
+        for time_slice in (1, 6):
+            expected = reference_packets(state, time_slice, 5, 400)
+            data, packets = builder.build(time_slice, 5)
+            self.assertEqual([packet.tobytes() for packet in packets], expected)
+            self.assertEqual(data.tobytes(), b''.join(expected))
+            self.assertEqual(counters(builder.state), counters(state))
+
+    def test_build_slices(self):
+        state = GeneratorState(timestamp=TIMESTAMP)
+        expected = []
+        for time_slice in range(2, 6):
+            state.packet_number = 0
+            expected.append(reference_packets(state, time_slice, 3, 250))
+        builder = TristanPacketBuilder(250, GeneratorState(timestamp=TIMESTAMP))
+        _, slice_packets = builder.build_slices(2, 4, 3)
+        self.assertEqual([[packet.tobytes() for packet in packets] for packets in slice_packets],
+                         expected)
+        self.assertEqual(builder.state.timestamp, state.timestamp)
+        self.assertEqual(builder.state.word_index, state.word_index)
+
+    def test_build_time_slices(self):
+        builder = TristanPacketBuilder(250)
+        _, run = builder.build_time_slices(range(2, 6), 3, 2, TIMESTAMP, 0)
+        _, selected = builder.build_time_slices([5, 3], 3, 2, TIMESTAMP, 0)
+        self.assertEqual([[packet.tobytes() for packet in packets] for packets in selected],
+                         [[packet.tobytes() for packet in packets] for packets in (run[3], run[1])])
+        # The stream state is not used or advanced
+        self.assertEqual(counters(builder.state), (0, 0, 0))
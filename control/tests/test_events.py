@@ -0,0 +1,69 @@
+"""
+Created on 18 October 2026
+
+Tests of the structured array event container.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from latrd.raw.decoder import decode
+from latrd.raw.events import EVENT_DTYPE, EventArray
+
+
+def make_events(count, seed=0):
+    random_state = np.random.RandomState(seed)
+    events = np.empty(count, dtype=EVENT_DTYPE)
+    events['x'] = random_state.randint(0, 0x2000, count)
+    events['y'] = random_state.randint(0, 0x2000, count)
+    events['toa'] = random_state.randint(0, 2**62, count, dtype=np.int64)
+    events['tot'] = random_state.randint(0, 0x4000, count)
+    return events
+
+
+class EventArrayTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.events = make_events(1000)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_append_blocks(self):
+        events = EventArray()
+        for start in range(0, 1000, 70):
+            events.append(self.events[start:start + 70])
+        self.assertEqual(len(events), 1000)
+        self.assertGreaterEqual(len(events._data), 1000)
+        self.assertTrue(np.array_equal(events.data, self.events))
+        self.assertEqual(events.toa.tolist(), self.events['toa'].tolist())
+        self.assertEqual(events[10:12].tolist(), self.events[10:12].tolist())
+        events.trim()
+        self.assertEqual(len(events._data), 1000)
+        self.assertEqual(events.nbytes, 14 * 1000)
+
+    def test_append_decoded(self):
+        words = np.array([0x8000000001800000, 0x0004000600008003], dtype=np.uint64)
+        decoded = decode(words)
+        events = EventArray(decoded)
+        events.append(EventArray(decoded))
+        self.assertEqual(events.x.tolist(), decoded.x.tolist() * 2)
+        self.assertEqual(events.toa.tolist(), decoded.toa.tolist() * 2)
+
+    def test_save_load_npy(self):
+        filename = os.path.join(self.directory, 'events.npy')
+        EventArray(self.events).save(filename)
+        self.assertTrue(np.array_equal(EventArray.load(filename).data, self.events))
+
+    def test_save_load_hdf5(self):
+        filename = os.path.join(self.directory, 'events.h5')
+        EventArray(self.events[:10]).save(filename, group='/entry')
+        # Saving again replaces the datasets of the group
+        EventArray(self.events).save(filename, group='/entry')
+        loaded = EventArray.load(filename, group='/entry')
+        self.assertEqual(loaded.data.dtype, EVENT_DTYPE)
+        self.assertTrue(np.array_equal(loaded.data, self.events))
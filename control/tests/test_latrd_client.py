@@ -0,0 +1,133 @@
+"""
+Created on 18 October 2026
+
+Tests of the asynchronous detector control client against a simple detector
+that replies to each request after a delay.
+"""
+import threading
+import time
+import unittest
+
+import zmq
+from zmq.utils.strtypes import cast_bytes
+
+from latrd.detector.latrd_channel import LATRDChannel
+from latrd.detector.latrd_client import LATRDClient
+from latrd.detector.latrd_message import LATRDMessage, GetMessage, ResponseMessage
+
+
+class Detector(object):
+    """
+    ROUTER socket replying to every request with its parameters, after a delay
+    given by the 'delay' parameter.  Requests with a delay of None are ignored.
+    """
+    def __init__(self):
+        self._channel = LATRDChannel(LATRDChannel.CHANNEL_TYPE_ROUTER)
+        self._channel.socket.setsockopt(zmq.LINGER, 0)
+        # A ROUTER socket drops replies beyond its high water mark
+        self._channel.socket.setsockopt(zmq.SNDHWM, 0)
+        port = self._channel.socket.bind_to_random_port('tcp://127.0.0.1')
+        self.endpoint = 'tcp://127.0.0.1:{}'.format(port)
+        self._running = True
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.start()
+
+    def _serve(self):
+        replies = []
+        while self._running:
+            if self._channel.poll(10) == LATRDChannel.POLLIN:
+                identity = self._channel.recv()
+                msg = LATRDMessage.parse_json(self._channel.recv())
+                delay = msg.params.get('delay', 0.0)
+                if delay is not None:
+                    replies.append((time.time() + delay, identity, msg))
+            now = time.time()
+            for reply in sorted(replies, key=lambda reply: reply[0]):
+                if reply[0] <= now:
+                    replies.remove(reply)
+                    _, identity, msg = reply
+                    reply = ResponseMessage(msg.msg_id, msg.params)
+                    self._channel.send_multi([identity, cast_bytes(reply.encode())])
+        self._channel.close()
+
+    def close(self):
+        self._running = False
+        self._thread.join()
+
+
+def request(delay):
+    msg = GetMessage()
+    msg.set_param('delay', delay)
+    return msg
+
+
+class LATRDClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.detector = Detector()
+        self.client = LATRDClient(self.detector.endpoint, timeout=500)
+
+    def tearDown(self):
+        self.client.close()
+        self.detector.close()
+
+    def test_send_recv(self):
+        reply = self.client.send_recv(request(0.0))
+        self.assertEqual(reply.data, {'delay': 0.0})
+
+    def test_requests_complete_independently(self):
+        slow = self.client.request(request(0.3))
+        fast = self.client.request(request(0.0))
+        self.assertEqual(fast.result(1.0).data, {'delay': 0.0})
+        self.assertFalse(slow.done())
+        self.assertEqual(slow.result(1.0).data, {'delay': 0.3})
+
+    def test_many_requests(self):
+        # Once the detector has replied, requests beyond the channel high water
+        # mark are held back rather than failed
+        self.assertIsNotNone(self.client.send_recv(request(0.0)))
+        requests = [self.client.request(request(0.0)) for _ in range(50)]
+        for pending in requests:
+            self.assertIsNotNone(pending.result(2.0))
+        self.assertEqual(self.client.pending, 0)
+
+    def test_expiry(self):
+        start = time.time()
+        self.assertIsNone(self.client.send_recv(request(None)))
+        self.assertLess(time.time() - start, 1.0)
+        # A reply after the timeout is discarded
+        self.assertIsNone(self.client.send_recv(request(0.7)))
+        self.assertEqual(self.client.send_recv(request(0.0)).data, {'delay': 0.0})
+
+    def test_done_callback(self):
+        done = threading.Event()
+        replies = []
+
+        def callback(completed):
+            replies.append(completed.result())
+            done.set()
+
+        self.client.request(request(0.0)).add_done_callback(callback)
+        self.assertTrue(done.wait(1.0))
+        self.assertEqual(replies[0].data, {'delay': 0.0})
+
+    def test_close(self):
+        pending = self.client.request(request(None))
+        self.client.close()
+        self.assertTrue(pending.done())
+        self.assertIsNone(pending.result())
+        self.assertIsNone(self.client.request(request(0.0)).result())
+        self.client = LATRDClient(self.detector.endpoint, timeout=500)
+
+
+class UnreachableDetectorTest(unittest.TestCase):
+
+    def test_no_detector(self):
+        client = LATRDClient('tcp://127.0.0.1:47322', timeout=500,
+                             context=zmq.Context())
+        try:
+            start = time.time()
+            self.assertIsNone(client.send_recv(request(0.0)))
+            self.assertLess(time.time() - start, 1.0)
+        finally:
+            client.close()
@@ -0,0 +1,227 @@
+"""
+Created on 18 October 2026
+
+Tests of the memory mapped packet capture reader, its packet index and the
+packet summaries, using small synthetic captures of Tristan packets.
+"""
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+
+import numpy as np
+
+from latrd.pcap import PcapReader, PcapError, PCAP_MAGIC_NS, PCAP_MAGIC_US, PCAP_INDEX_SUFFIX
+from latrd.pcap_summary import summarise, save_summary
+
+CAPTURE_SECONDS = 1792300000
+
+
+def udp_frame(payload, port=61649, vlan=False):
+    """
+    Return an Ethernet frame holding an IPv4 UDP datagram.
+    """
+    udp = struct.pack('>HHHH', 1000, port, 8 + len(payload), 0) + payload
+    ip = struct.pack('>BBHHHBBH4s4s', 0x45, 0, 20 + len(udp), 0, 0, 64, 17, 0,
+                     b'\x7f\x00\x00\x01', b'\x7f\x00\x00\x01')
+    ethernet = b'\x00' * 12
+    if vlan:
+        ethernet += struct.pack('>HH', 0x8100, 5)
+    return ethernet + b'\x08\x00' + ip + udp
+
+
+def tristan_packet(time_slice, packet_number, producer_id=0, words=4, idle=False):
+    """
+    Return an event mode Tristan packet.
+    """
+    header_1 = 0xE000000000000000 | (producer_id << 50) | ((time_slice // 4) << 18) | (words + 2)
+    if idle:
+        header_1 |= 0x3F800
+    header_2 = 0xE400000000000000 | ((time_slice % 4) << 32) | packet_number
+    return struct.pack('<QQQ', 0, header_1, header_2) + struct.pack('<Q', packet_number) * words
+
+
+def write_capture(filename, payloads, nanoseconds=True, spacing=100):
+    """
+    Write a capture of the UDP frames of a list of payloads, spacing records by
+    a number of ticks of the sub second timestamp field.
+
+    :return: list of the capture timestamps of the records in nanoseconds
+    """
+    magic = PCAP_MAGIC_NS if nanoseconds else PCAP_MAGIC_US
+    timestamps = []
+    with open(filename, 'wb') as capture:
+        capture.write(struct.pack('<IHHiIII', magic, 2, 4, 0, 0, 65535, 1))
+        for record, payload in enumerate(payloads):
+            # A complete frame may be given as a 1-tuple
+            frame = payload[0] if isinstance(payload, tuple) else udp_frame(payload)
+            ticks = 123456 + record * spacing
+            capture.write(struct.pack('<IIII', CAPTURE_SECONDS, ticks, len(frame), len(frame)))
+            capture.write(frame)
+            timestamps.append(CAPTURE_SECONDS * 10**9 + ticks * (1 if nanoseconds else 1000))
+    return timestamps
+
+
+class PcapReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'capture.pcap')
+        # Idle packets, then 8 time slices of 5 packets from producers 0 and 1
+        self.payloads = [tristan_packet(0, 0, idle=True), tristan_packet(0, 0, idle=True)]
+        for time_slice in range(8):
+            for packet_number in range(5):
+                self.payloads.append(tristan_packet(time_slice, packet_number,
+                                                    producer_id=time_slice % 2))
+        self.payloads.append(tristan_packet(0, 0, idle=True))
+        self.timestamps = write_capture(self.filename, self.payloads)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_payloads(self):
+        reader = PcapReader(self.filename)
+        self.assertEqual(len(reader), len(self.payloads))
+        for record, payload in enumerate(self.payloads):
+            self.assertEqual(bytes(reader.payload(record)), payload)
+        self.assertEqual(reader.timestamps_ns.tolist(), self.timestamps)
+        reader.close()
+
+    def test_header_words(self):
+        reader = PcapReader(self.filename)
+        words = reader.header_words(records=[2, 3])
+        self.assertEqual(words.shape, (2, 3))
+        self.assertEqual(words[:, 2].tolist(), [0xE400000000000000, 0xE400000000000001])
+        reader.close()
+
+    def test_mixed_lengths(self):
+        # Records of alternating length are walked one at a time, and the scan
+        # switches back to probing for the run of equal lengths in between
+        words = [1, 2] * 10 + [4] * 20 + [3, 5, 3, 5, 6, 6, 7]
+        payloads = [tristan_packet(0, record, words=count) for record, count in enumerate(words)]
+        write_capture(self.filename, payloads)
+        with open(self.filename, 'ab') as capture:
+            capture.write(struct.pack('<IIII', CAPTURE_SECONDS, 0, 200, 200) + b'\x00' * 100)
+        reader = PcapReader(self.filename)
+        self.assertEqual(len(reader), len(payloads))
+        self.assertEqual([bytes(reader.payload(record)) for record in range(len(payloads))],
+                         payloads)
+        reader.close()
+
+    def test_microsecond_timestamps(self):
+        write_capture(self.filename, self.payloads[:3], nanoseconds=False, spacing=7)
+        reader = PcapReader(self.filename)
+        self.assertEqual(np.diff(reader.timestamps_ns).tolist(), [7000, 7000])
+        reader.close()
+
+    def test_vlan_frames(self):
+        payloads = [tristan_packet(1, 2), tristan_packet(1, 3)]
+        write_capture(self.filename, [(udp_frame(payload, vlan=True),) for payload in payloads])
+        reader = PcapReader(self.filename)
+        self.assertEqual([bytes(reader.payload(record)) for record in range(2)], payloads)
+        self.assertEqual(reader.packet_index()['packet_number'].tolist(), [2, 3])
+        reader.close()
+
+    def test_packet_index(self):
+        reader = PcapReader(self.filename)
+        index = reader.packet_index()
+        self.assertEqual(reader.idle_records().tolist(), [0, 1, len(self.payloads) - 1])
+        data = ~index['idle']
+        self.assertEqual(index['time_slice'][data].tolist(), np.repeat(np.arange(8), 5).tolist())
+        self.assertEqual(index['packet_number'][data].tolist(), list(range(5)) * 8)
+        self.assertEqual(index['producer_id'][data].tolist(),
+                         np.repeat(np.arange(8) % 2, 5).tolist())
+        self.assertFalse(index['count_mode'].any())
+        reader.close()
+
+    def test_select(self):
+        reader = PcapReader(self.filename)
+        self.assertEqual(len(reader.select()), 40)
+        records = reader.select(time_slices=(2, 5), producer_id=0)
+        self.assertEqual(records.tolist(), list(range(12, 17)) + list(range(22, 27)))
+        self.assertEqual(reader.select(time_slices=(3,)).tolist(), list(range(17, 22)))
+        self.assertEqual(reader.select(producer_id=[0, 1]).tolist(), list(range(2, 42)))
+        reader.close()
+
+    def test_select_expression(self):
+        reader = PcapReader(self.filename)
+        expression = "(time_slice >= 2) & (time_slice <= 5) & (producer_id == 0)"
+        self.assertEqual(reader.select(expression=expression).tolist(),
+                         reader.select(time_slices=(2, 5), producer_id=0).tolist())
+        self.assertEqual(reader.select(expression="~(packet_number > 0) & (frame < 2)").tolist(),
+                         [2, 7])
+        reader.close()
+
+    def test_select_rejects_code(self):
+        reader = PcapReader(self.filename)
+        for expression in ("__import__('os')", "np.ones(1)", "time_slice.sum()", "unknown == 1",
+                           "time_slice ==", "True"):
+            self.assertRaises(ValueError, reader.select, expression=expression)
+        reader.close()
+
+    def test_index_sidecar(self):
+        reader = PcapReader(self.filename, index=True)
+        index = reader.packet_index().copy()
+        reader.close()
+        self.assertTrue(os.path.exists(self.filename + PCAP_INDEX_SUFFIX))
+
+        reader = PcapReader(self.filename, index=True)
+        self.assertTrue(np.array_equal(reader.packet_index(), index))
+        self.assertEqual(reader.timestamps_ns.tolist(), self.timestamps)
+        self.assertEqual(bytes(reader.payload(5)), self.payloads[5])
+        reader.close()
+
+    def test_index_sidecar_out_of_date(self):
+        PcapReader(self.filename, index=True).close()
+        write_capture(self.filename, self.payloads[:10])
+        sidecar = self.filename + PCAP_INDEX_SUFFIX
+        mtime = os.path.getmtime(self.filename)
+        os.utime(sidecar, (mtime - 10, mtime - 10))
+        reader = PcapReader(self.filename, index=True)
+        self.assertEqual(len(reader), 10)
+        reader.close()
+
+    def test_not_a_capture(self):
+        with open(self.filename, 'wb') as capture:
+            capture.write(b'\x00' * 64)
+        self.assertRaises(PcapError, PcapReader, self.filename)
+
+
+class PcapSummaryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'capture.pcap')
+        # Time slice 0 with packet 1 duplicated and packet 2 missing, then a
+        # complete time slice 1 from another producer
+        payloads = [tristan_packet(0, number) for number in (0, 1, 1, 3)]
+        payloads += [tristan_packet(1, number, producer_id=1, words=2) for number in range(2)]
+        write_capture(self.filename, payloads)
+        self.reader = PcapReader(self.filename)
+
+    def tearDown(self):
+        self.reader.close()
+        shutil.rmtree(self.directory)
+
+    def test_summarise(self):
+        summary = summarise(self.reader, self.reader.select())
+        self.assertEqual(summary['packets']['data_words'].tolist(), [4, 4, 4, 4, 2, 2])
+        frames = summary['frames']
+        self.assertEqual(frames['frame'].tolist(), [0, 1])
+        self.assertEqual(frames['packets'].tolist(), [4, 2])
+        self.assertEqual(frames['duplicates'].tolist(), [1, 0])
+        self.assertEqual(frames['missing'].tolist(), [1, 0])
+        self.assertEqual(frames['words'].tolist(), [16, 4])
+        self.assertEqual(summary['missing']['packet_number'].tolist(), [2])
+        producers = summary['producers']
+        self.assertEqual(producers['producer_id'].tolist(), [0, 1])
+        self.assertEqual(producers['packets'].tolist(), [4, 2])
+
+    def test_save_summary(self):
+        summary = summarise(self.reader, self.reader.select())
+        filename = os.path.join(self.directory, 'summary.npz')
+        save_summary(filename, summary, {'pcap_file': self.filename})
+        saved = np.load(filename)
+        self.assertTrue(np.array_equal(saved['frames'], summary['frames']))
+        self.assertEqual(str(saved['attribute_pcap_file']), self.filename)
@@ -0,0 +1,68 @@
+"""
+Created on 18 October 2026
+
+Tests of the prefetching raw HDF5 stack reader in the sandbox scripts.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+import h5py
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'sandbox'))
+
+from raw_h5_stack_reader import RawH5StackReader
+
+
+def write_words(filename, words, mtime, dataset='/raw_data'):
+    with h5py.File(filename, 'w', libver='latest') as h5_file:
+        h5_file.create_dataset(dataset, data=np.array(words, dtype=np.uint64))
+    os.utime(filename, (mtime, mtime))
+
+
+class RawH5StackReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.now = time.time()
+        # Files are read in order of modification time
+        write_words(os.path.join(self.directory, 'b.h5'), range(25), self.now - 20)
+        write_words(os.path.join(self.directory, 'a.h5'), range(25, 32), self.now - 10)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_read_block(self):
+        reader = RawH5StackReader(self.directory, chunk_size=10, prefetch=2)
+        try:
+            self.assertEqual(reader.read_block(4).tolist(), [0, 1, 2, 3])
+            # Blocks continue across chunks and files
+            self.assertEqual(reader.read_block(20).tolist(), list(range(4, 24)))
+            self.assertEqual(reader.read_next(), "18")
+            self.assertEqual(reader.read_block(100).tolist(), list(range(25, 32)))
+            self.assertEqual(len(reader.read_block(10)), 0)
+            self.assertIsNone(reader.read_next())
+        finally:
+            reader.close()
+
+    def test_close_before_end(self):
+        reader = RawH5StackReader(self.directory, chunk_size=1, prefetch=1)
+        self.assertEqual(reader.read_block(2).tolist(), [0, 1])
+        # The prefetch thread is blocked on a full queue and must still stop
+        reader.close()
+        self.assertFalse(reader._thread.is_alive())
+
+    def test_error_raised(self):
+        write_words(os.path.join(self.directory, 'c.h5'), range(3), self.now, dataset='/other')
+        reader = RawH5StackReader(self.directory, chunk_size=100)
+        try:
+            self.assertEqual(len(reader.read_block(32)), 32)
+            self.assertRaises(KeyError, reader.read_block, 1)
+            # The end of the files follows the error
+            self.assertEqual(len(reader.read_block(1)), 0)
+        finally:
+            reader.close()
@@ -0,0 +1,162 @@
+"""
+Created on 18 October 2026
+
+Tests of the packet send plans of the replay and packet generator tools.
+"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from latrd.detector.send_plan import SendPlan, StreamingSendPlan
+from latrd.detector.udp_routing import UdpRouting
+
+
+def capture(time_slices=40, packets=25):
+    """
+    Return the frame and packet number of each packet of a capture, in order.
+    """
+    frames = np.repeat(np.arange(time_slices), packets)
+    packet_numbers = np.tile(np.arange(packets), time_slices)
+    return frames, packet_numbers
+
+
+def stream(plan, frames, packet_numbers, batch):
+    """
+    Feed a capture through a StreamingSendPlan in batches, returning the send
+    order of each endpoint.
+    """
+    orders = [[] for _ in range(plan.no_of_ports)]
+    for start in range(0, len(frames), batch):
+        items = list(range(start, min(len(frames), start + batch)))
+        for order, released in zip(orders, plan.add(frames[start:start + batch],
+                                                     packet_numbers[start:start + batch], items)):
+            order.extend(released)
+    for order, released in zip(orders, plan.finish()):
+        order.extend(released)
+    return orders
+
+
+class SendPlanTest(unittest.TestCase):
+
+    def test_round_robin(self):
+        frames, packet_numbers = capture()
+        plan = SendPlan(frames, packet_numbers, 3, seed=1)
+        for index in range(3):
+            self.assertEqual(plan.order(index), np.flatnonzero(frames % 3 == index).tolist())
+        manifest = plan.manifest()
+        self.assertEqual(manifest['packets'], len(frames))
+        self.assertEqual(manifest['dropped'], 0)
+        self.assertEqual(sum(endpoint['sent'] for endpoint in manifest['endpoints']), len(frames))
+
+    def test_routing(self):
+        frames, packet_numbers = capture()
+        routing = UdpRouting([('127.0.0.1', 61649), ('127.0.0.1', 61650)], [3, 1])
+        plan = SendPlan(frames, packet_numbers, 2, seed=1, routing=routing)
+        self.assertEqual(plan.order(1), np.flatnonzero(frames % 4 == 3).tolist())
+
+    def test_drops(self):
+        frames, packet_numbers = capture()
+        plan = SendPlan(frames, packet_numbers, 2, drop_frac=0.1, drop_list=[0, 7], seed=5)
+        manifest = plan.manifest()
+        sent = plan.order(0) + plan.order(1)
+        dropped = sorted(set(range(len(frames))) - set(sent))
+        self.assertEqual(manifest['dropped'], len(dropped))
+        self.assertTrue(all(packet_numbers[index] not in (0, 7) for index in sent))
+        self.assertGreater(len(dropped), 80)
+        listed = [tuple(packet) for endpoint in manifest['endpoints']
+                  for packet in endpoint['dropped']]
+        self.assertEqual(sorted(listed),
+                         sorted((frames[index], packet_numbers[index]) for index in dropped))
+        # The same seed gives the same plan
+        again = SendPlan(frames, packet_numbers, 2, drop_frac=0.1, drop_list=[0, 7], seed=5)
+        self.assertEqual(again.manifest(), manifest)
+
+    def test_duplicates(self):
+        frames, packet_numbers = capture()
+        plan = SendPlan(frames, packet_numbers, 2, duplicate_frac=0.2, seed=3)
+        for index, endpoint in enumerate(plan.manifest()['endpoints']):
+            order = plan.order(index)
+            # Each duplicate is sent immediately after the original
+            repeats = [order[position] for position in range(1, len(order))
+                       if order[position] == order[position - 1]]
+            self.assertEqual(len(order), endpoint['packets'] + len(repeats))
+            self.assertEqual([[frames[packet], packet_numbers[packet]] for packet in repeats],
+                             endpoint['duplicated'])
+            self.assertGreater(len(repeats), 0)
+
+    def test_reorder(self):
+        frames, packet_numbers = capture()
+        plan = SendPlan(frames, packet_numbers, 2, reorder=8, seed=4)
+        for index, endpoint in enumerate(plan.manifest()['endpoints']):
+            order = plan.order(index)
+            expected = np.flatnonzero(frames % 2 == index).tolist()
+            self.assertNotEqual(order, expected)
+            # Packets only move within their window
+            for start in range(0, len(order), 8):
+                self.assertEqual(sorted(order[start:start + 8]), expected[start:start + 8])
+            moved = sum(1 for sent, packet in zip(order, expected) if sent != packet)
+            self.assertEqual(endpoint['reordered'], moved)
+
+    def test_chunks(self):
+        frames, packet_numbers = capture(4, 10)
+        plan = SendPlan(frames, packet_numbers, 1, seed=1)
+        chunks = plan.chunks(0, 15)
+        self.assertEqual([len(chunk) for chunk in chunks], [15, 15, 10])
+        self.assertEqual(sum(chunks, []), plan.order(0))
+        self.assertEqual(plan.chunks(0), [plan.order(0)])
+
+    def test_write_manifest(self):
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'manifest.json')
+            frames, packet_numbers = capture(4, 10)
+            plan = SendPlan(frames, packet_numbers, 2, drop_frac=0.2, seed=2)
+            plan.write_manifest(filename, {'pcap_file': 'capture.pcap'})
+            with open(filename) as manifest_file:
+                manifest = json.load(manifest_file)
+            self.assertEqual(manifest['seed'], 2)
+            self.assertEqual(manifest['pcap_file'], 'capture.pcap')
+            self.assertEqual(manifest['endpoints'], plan.manifest()['endpoints'])
+        finally:
+            shutil.rmtree(directory)
+
+class StreamingSendPlanTest(unittest.TestCase):
+
+    OPTIONS = (
+        {},
+        {'drop_frac': 0.1, 'drop_list': [3]},
+        {'reorder': 7},
+        {'duplicate_frac': 0.1},
+        {'drop_frac': 0.1, 'reorder': 9, 'duplicate_frac': 0.05},
+    )
+
+    def test_matches_loaded_plan(self):
+        frames, packet_numbers = capture(53, 31)
+        for options in self.OPTIONS:
+            loaded = SendPlan(frames, packet_numbers, 3, seed=11, **options)
+            for batch in (1, 100, 1000, len(frames)):
+                plan = StreamingSendPlan(3, seed=11, **options)
+                orders = stream(plan, frames, packet_numbers, batch)
+                for index, order in enumerate(orders):
+                    self.assertEqual(order, loaded.order(index), (options, batch))
+                self.assertEqual(plan.manifest(), loaded.manifest(), (options, batch))
+
+    def test_items_released(self):
+        frames, packet_numbers = capture(10, 10)
+        plan = StreamingSendPlan(2, reorder=4, seed=1)
+        released = plan.add(frames[:30], packet_numbers[:30], ['packet'] * 30)
+        # Only whole reorder windows are released, the rest are held back
+        self.assertEqual([len(items) for items in released], [20, 8])
+        self.assertEqual(len(plan._items), 2)
+        self.assertEqual([len(items) for items in plan.finish()], [0, 2])
+        self.assertEqual(len(plan._items), 0)
+
+    def test_no_send_order(self):
+        # The sender pauses every pkt_gap packets as the released packets are sent
+        plan = StreamingSendPlan(2, seed=1)
+        self.assertFalse(hasattr(plan, 'order'))
+        self.assertFalse(hasattr(plan, 'chunks'))
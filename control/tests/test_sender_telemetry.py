@@ -0,0 +1,79 @@
+"""
+Created on 18 October 2026
+
+Tests of the shared memory telemetry of the simulated detector UDP senders.
+"""
+import multiprocessing
+import time
+import unittest
+
+from latrd.detector.sender_telemetry import SenderTelemetry
+from latrd.detector.udp_pacer import PacketPacer
+
+
+def send(telemetry, index, packets, size=1000, pacer=None):
+    for _ in range(packets):
+        telemetry.sent(index, size, pacer)
+
+
+class SenderTelemetryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.telemetry = SenderTelemetry(2, names=['10.0.0.1:61649', '10.0.0.2:61650'])
+        self.telemetry.start(0)
+        self.telemetry.start(1)
+
+    def test_counters(self):
+        send(self.telemetry, 0, 10)
+        send(self.telemetry, 1, 5, size=500)
+        self.telemetry.error(1)
+        self.assertEqual(self.telemetry.packets(0), 10)
+        self.assertEqual(self.telemetry.packets(), 15)
+        sample = self.telemetry.sample(1)
+        self.assertEqual(sample['endpoint'], '10.0.0.2:61650')
+        self.assertEqual(sample['packets'], 5)
+        self.assertEqual(sample['bytes'], 2500)
+        self.assertEqual(sample['errors'], 1)
+        self.telemetry.reset()
+        self.assertEqual(self.telemetry.packets(), 0)
+        self.assertEqual([sample['bytes'] for sample in self.telemetry.samples()], [0, 0])
+
+    def test_rates(self):
+        send(self.telemetry, 0, 10)
+        # There is no previous sample to take the current rate from
+        sample = self.telemetry.sample(0)
+        self.assertEqual(sample['packet_rate'], 0.0)
+        self.assertGreater(sample['average_packet_rate'], 0.0)
+        time.sleep(0.05)
+        send(self.telemetry, 0, 100)
+        sample = self.telemetry.sample(0)
+        self.assertGreater(sample['packet_rate'], 100 / 0.2)
+        self.assertLess(sample['packet_rate'], 100 / 0.04)
+        self.assertAlmostEqual(sample['data_rate'], sample['packet_rate'] * 8000 / 1.0e9, 3)
+
+    def test_jitter(self):
+        send(self.telemetry, 0, 1)
+        self.assertEqual(self.telemetry.sample(0)['jitter_us'], [0.0] * 4)
+        # One interval well above the others, after more packets than the ring holds
+        send(self.telemetry, 0, 2 * SenderTelemetry.SAMPLES)
+        time.sleep(0.01)
+        send(self.telemetry, 0, 1)
+        jitter = self.telemetry.sample(0)['jitter_us']
+        self.assertEqual(len(jitter), len(SenderTelemetry.PERCENTILES) + 1)
+        self.assertEqual(jitter, sorted(jitter))
+        self.assertLess(jitter[0], 1000.0)
+        self.assertGreater(jitter[-1], 9000.0)
+
+    def test_lag(self):
+        pacer = PacketPacer(packet_rate=1000)
+        pacer.start()
+        time.sleep(0.05)
+        send(self.telemetry, 0, 1, pacer=pacer)
+        self.assertGreater(self.telemetry.sample(0)['lag'], 0.04)
+
+    def test_shared_with_process(self):
+        process = multiprocessing.Process(target=send, args=(self.telemetry, 1, 20))
+        process.start()
+        process.join()
+        self.assertEqual(self.telemetry.sample(1)['packets'], 20)
+        self.assertEqual(self.telemetry.sample(1)['bytes'], 20000)
@@ -0,0 +1,128 @@
+"""
+Created on 18 October 2026
+
+Tests of the rate control of the simulated detector UDP senders.
+"""
+import time
+import unittest
+
+from latrd.detector.udp_pacer import CapturePacer, PacketPacer
+
+
+MS = 1000000
+
+
+def send(pacer, packets, size=1000):
+    start = time.time()
+    for _ in range(packets):
+        pacer.wait(size)
+    return time.time() - start
+
+
+class PacketPacerTest(unittest.TestCase):
+
+    def test_unpaced(self):
+        pacer = PacketPacer()
+        self.assertEqual(pacer.requested(), "unpaced")
+        self.assertLess(send(pacer, 10000), 0.5)
+        self.assertEqual(pacer.packets, 10000)
+        self.assertEqual(pacer.bytes, 10000 * 1000)
+        self.assertEqual(pacer.lag(), 0.0)
+
+    def test_packet_rate(self):
+        pacer = PacketPacer(packet_rate=2000)
+        self.assertEqual(pacer.requested(), "2000.0 packets/s")
+        # The first packet is sent straight away from a full bucket
+        elapsed = send(pacer, 201)
+        self.assertGreater(elapsed, 0.095)
+        self.assertLess(elapsed, 0.2)
+        self.assertLess(pacer.lag(), 0.01)
+
+    def test_bit_rate(self):
+        pacer = PacketPacer(bit_rate=8.0e6)
+        self.assertEqual(pacer.requested(), "0.008 Gbit/s")
+        # 1 MB/s, so 100 packets of 1000 bytes after the first take 0.1 s
+        elapsed = send(pacer, 101)
+        self.assertGreater(elapsed, 0.095)
+        self.assertLess(elapsed, 0.2)
+
+    def test_packet_rate_takes_precedence(self):
+        pacer = PacketPacer(packet_rate=2000, bit_rate=8.0e6)
+        self.assertEqual(pacer.requested(), "2000.0 packets/s")
+
+    def test_burst(self):
+        pacer = PacketPacer(packet_rate=100, burst=10)
+        # A burst is sent back to back, then the sender waits for a whole burst
+        self.assertLess(send(pacer, 10), 0.01)
+        elapsed = send(pacer, 1)
+        self.assertGreater(elapsed, 0.095)
+        self.assertLess(send(pacer, 9), 0.01)
+
+    def test_pause_not_made_up(self):
+        pacer = PacketPacer(packet_rate=1000)
+        send(pacer, 1)
+        pacer.pause(0.1)
+        # Tokens are not accumulated while paused, so sending continues at the rate
+        elapsed = send(pacer, 50)
+        self.assertGreater(elapsed, 0.04)
+
+    def test_restart(self):
+        pacer = PacketPacer(packet_rate=1000)
+        send(pacer, 5)
+        pacer.start()
+        self.assertEqual(pacer.packets, 0)
+        self.assertEqual(pacer.bytes, 0)
+
+
+def replay(pacer, timestamps, size=1000):
+    start = time.time()
+    for timestamp in timestamps:
+        pacer.wait(size, timestamp)
+    return time.time() - start
+
+
+class CapturePacerTest(unittest.TestCase):
+
+    # Capture timestamps in ns, a burst of packets followed by a gap of 100 ms
+    TIMESTAMPS = [5 * MS, 5 * MS + 1, 5 * MS + 2, 105 * MS]
+
+    def test_capture_timing(self):
+        pacer = CapturePacer()
+        self.assertEqual(pacer.requested(), "capture timing x1")
+        self.assertLess(replay(pacer, self.TIMESTAMPS[:3]), 0.01)
+        elapsed = replay(pacer, self.TIMESTAMPS[3:])
+        self.assertGreater(elapsed, 0.095)
+        self.assertLess(elapsed, 0.15)
+        self.assertLess(pacer.lag(), 0.01)
+        self.assertIn("in 0.100 s", pacer.original())
+
+    def test_speed(self):
+        pacer = CapturePacer(speed=4.0)
+        elapsed = replay(pacer, self.TIMESTAMPS)
+        self.assertGreater(elapsed, 0.024)
+        self.assertLess(elapsed, 0.075)
+
+    def test_maximum_rate(self):
+        pacer = CapturePacer(speed=None)
+        self.assertEqual(pacer.requested(), "maximum rate")
+        self.assertLess(replay(pacer, self.TIMESTAMPS), 0.01)
+        self.assertEqual(pacer.lag(), 0.0)
+        # The capture timestamps still give the original throughput
+        self.assertIn("capture 40.0 packets/s", pacer.original())
+
+    def test_shared_start(self):
+        first = CapturePacer(origin=5 * MS)
+        first.start()
+        time.sleep(0.05)
+        second = CapturePacer(origin=5 * MS)
+        second.start(first.start_time)
+        # The second port is already 50 ms into the schedule of the first
+        elapsed = replay(second, [105 * MS])
+        self.assertGreater(elapsed, 0.045)
+        self.assertLess(elapsed, 0.075)
+
+    def test_pause_delays_schedule(self):
+        pacer = CapturePacer()
+        replay(pacer, self.TIMESTAMPS[:1])
+        pacer.pause(0.05)
+        self.assertGreater(replay(pacer, self.TIMESTAMPS[3:]), 0.095)
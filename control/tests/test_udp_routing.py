@@ -0,0 +1,74 @@
+"""
+Created on 18 October 2026
+
+Tests of the routing of time slices to UDP destinations.
+"""
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from latrd.detector.udp_routing import UdpRouting
+
+
+class UdpRoutingTest(unittest.TestCase):
+
+    ENDPOINTS = [('10.0.0.1', 61649), ('10.0.0.2', 61650), ('10.0.0.3', 61651)]
+
+    def test_round_robin(self):
+        routing = UdpRouting(self.ENDPOINTS)
+        self.assertEqual(routing.no_of_endpoints, 3)
+        self.assertEqual(routing.endpoint_indices(range(7)).tolist(), [0, 1, 2, 0, 1, 2, 0])
+        self.assertEqual(routing.endpoint(5), self.ENDPOINTS[2])
+        self.assertEqual(routing.frames(range(10), 1), [1, 4, 7])
+
+    def test_shares(self):
+        routing = UdpRouting(self.ENDPOINTS, [2, 1, 1])
+        self.assertEqual(routing.endpoint_indices(range(8)).tolist(), [0, 0, 1, 2, 0, 0, 1, 2])
+        self.assertEqual(routing.endpoint_index(6), 1)
+
+    def test_invalid(self):
+        self.assertRaises(ValueError, UdpRouting, [])
+        self.assertRaises(ValueError, UdpRouting, self.ENDPOINTS, [1, 1])
+        self.assertRaises(ValueError, UdpRouting, self.ENDPOINTS, [1, 0, 1])
+
+    def test_config_objects(self):
+        config = {'module': {'udp': {'destinations': [
+            {'dest_ip': '10.0.0.1', 'dest_port': 61649, 'time_slices': 2},
+            {'dest_ip': '10.0.0.2', 'dest_port': 61650}
+        ]}}}
+        routing = UdpRouting.from_config(config)
+        self.assertEqual(routing.endpoints, self.ENDPOINTS[:2])
+        self.assertEqual(routing.shares, [2, 1])
+
+    def test_config_strings_and_pairs(self):
+        routing = UdpRouting.from_config({'destinations': ['10.0.0.1:61649', '10.0.0.2:61650']})
+        self.assertEqual(routing.endpoints, self.ENDPOINTS[:2])
+        routing = UdpRouting.from_config([['10.0.0.1', 61649], ['10.0.0.3', 61651]])
+        self.assertEqual(routing.endpoints, [self.ENDPOINTS[0], self.ENDPOINTS[2]])
+
+    def test_config_parallel_lists(self):
+        routing = UdpRouting.from_config({'ip': '10.0.0.1', 'port': [61649, 61650]})
+        self.assertEqual(routing.endpoints, [('10.0.0.1', 61649), ('10.0.0.1', 61650)])
+        self.assertRaises(ValueError, UdpRouting.from_config, {'other': 1})
+
+    def test_from_file(self):
+        directory = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(directory, 'udp_tristan.json')
+            with open(filename, 'w') as config_file:
+                json.dump({'destinations': ['10.0.0.1:61649']}, config_file)
+            self.assertEqual(UdpRouting.from_file(filename).endpoints, self.ENDPOINTS[:1])
+        finally:
+            shutil.rmtree(directory)
+
+    def test_split(self):
+        routing = UdpRouting(self.ENDPOINTS, [2, 1, 1])
+        first, second = routing.split([self.ENDPOINTS[:2], self.ENDPOINTS[2:]])
+        self.assertEqual(first.endpoints, self.ENDPOINTS[:2])
+        self.assertEqual(first.shares, [2, 1])
+        self.assertEqual(second.endpoints, self.ENDPOINTS[2:])
+        # Endpoints shared between groups keep an equal share
+        shared = routing.split([self.ENDPOINTS[:1], self.ENDPOINTS[:1]])
+        self.assertEqual(shared[1].shares, [1])
@@ -1,32 +1,181 @@
 import os
+import sys
+import json
+import numpy as np
+from data_word import parse_hex_lines
+
+# Cache files are written alongside the ASCII files they are created from
+CACHE_EXTENSION = ".npy"
+CACHE_META_EXTENSION = ".npy.json"
+CACHE_TMP_EXTENSION = ".npy.tmp"
+
+
+def cache_filename(filename, cache_dir=None):
+    if cache_dir is None:
+        return filename + CACHE_EXTENSION
+    return os.path.join(cache_dir, os.path.basename(filename) + CACHE_EXTENSION)
+
+
+def is_cache_file(filename):
+    return filename.endswith((CACHE_EXTENSION, CACHE_META_EXTENSION, CACHE_TMP_EXTENSION))
+
+
+def source_signature(filename):
+    stat = os.stat(filename)
+    return {'mtime': stat.st_mtime, 'size': stat.st_size}
+
+
+def cache_is_valid(filename, cache_dir=None):
+    """
+    A cache is valid if the modification time and size of the ASCII file match
+    those recorded when the cache was created.
+    """
+    cache = cache_filename(filename, cache_dir)
+    try:
+        with open(cache + ".json", 'r') as meta_file:
+            meta = json.load(meta_file)
+    except (IOError, OSError, ValueError):
+        return False
+    return os.path.isfile(cache) and meta == source_signature(filename)
+
+
+def convert(filename, cache_dir=None, lines_per_block=1000000):
+    """
+    Convert an ASCII hex dump into a uint64 .npy file, one word per line.
+
+    The line count is taken in a first pass so that the output can be written
+    block by block into a memory mapped .npy file without holding the whole
+    file in memory.
+    """
+    signature = source_signature(filename)
+    cache = cache_filename(filename, cache_dir)
+    with open(filename, 'r') as in_file:
+        no_of_lines = sum(1 for _ in in_file)
+
+    tmp_cache = cache + ".tmp"
+    if no_of_lines == 0:
+        with open(tmp_cache, 'wb') as out_file:
+            np.save(out_file, np.zeros(0, dtype=np.uint64))
+    else:
+        _convert_lines(filename, tmp_cache, no_of_lines, lines_per_block)
+    os.rename(tmp_cache, cache)
+
+    with open(cache + ".json", 'w') as meta_file:
+        json.dump(signature, meta_file)
+    return cache
+
+
+def _convert_lines(filename, out_filename, no_of_lines, lines_per_block):
+    words = np.lib.format.open_memmap(out_filename, mode='w+', dtype=np.uint64,
+                                      shape=(no_of_lines,))
+    index = 0
+    with open(filename, 'r') as in_file:
+        while index < no_of_lines:
+            lines = []
+            for line in in_file:
+                lines.append(line)
+                if len(lines) == lines_per_block:
+                    break
+            if not lines:
+                break
+            words[index:index+len(lines)] = parse_hex_lines(lines)
+            index += len(lines)
+    words.flush()
+    del words
+
+
+def load(filename, cache_dir=None):
+    """
+    Return the words of an ASCII hex dump as a memory mapped uint64 array, creating
+    or refreshing the binary cache first if required.  If the cache cannot be
+    written (for example a read only data directory) the file is parsed in memory.
+    """
+    if not cache_is_valid(filename, cache_dir):
+        try:
+            convert(filename, cache_dir)
+        except (IOError, OSError) as e:
+            print("Unable to cache '%s' (%s), parsing in memory" % (filename, e))
+            with open(filename, 'r') as in_file:
+                return parse_hex_lines(in_file.readlines())
+    return np.load(cache_filename(filename, cache_dir), mmap_mode='r')
+
 
 class AsciiStackReader(object):
 
-    def __init__(self, path):
+    def __init__(self, path, cache_dir=None):
         self.path = path
+        self.cache_dir = cache_dir
         cpath = os.getcwd()
         os.chdir(path)
         self.files = filter(os.path.isfile, os.listdir(path))
-        self.files = [os.path.join(path, f) for f in self.files] # add path to each file
+        # add path to each file, skipping the binary caches
+        self.files = [os.path.join(path, f) for f in self.files if not is_cache_file(f)]
         self.files.sort(key=lambda x: os.path.getmtime(x), reverse=True)
         os.chdir(cpath)
-        self.currentfile = open(self.files.pop(), 'r')
-        self.buffer = self.currentfile.readlines(10000)
+        self._words = load(self.files.pop(), self.cache_dir)
+        self._current_index = 0
+
+    def _next_file(self):
+        if self.files:
+            # there are still files avaialble, load the next one
+            filename = self.files.pop()
+            print("Moving to new file '%s'" %(filename))
+            self._words = load(filename, self.cache_dir)
+            self._current_index = 0
+            return True
+        return False
+
+    def read_words(self, no_of_words):
+        """
+        Return the next slice of up to no_of_words words from the current file
+        without copying.  A shorter slice is returned at the end of each file, and
+        an empty slice signifies the end of the files.
+        """
+        while self._current_index >= len(self._words):
+            if not self._next_file():
+                return self._words[0:0]
+        words = self._words[self._current_index:self._current_index+no_of_words]
+        self._current_index += len(words)
+        return words
+
+    def read_block(self, no_of_words):
+        """
+        Return an array of up to no_of_words words, moving across files as
+        required.  An empty array signifies the end of the files.
+        """
+        words = self.read_words(no_of_words)
+        if len(words) == no_of_words or len(words) == 0:
+            return words
+        # Crossing into the next file, gather the remainder
+        blocks = [words]
+        count = len(words)
+        while count < no_of_words:
+            words = self.read_words(no_of_words - count)
+            if len(words) == 0:
+                break
+            blocks.append(words)
+            count += len(words)
+        return np.concatenate(blocks)
 
     def read_next(self):
-        if not self.buffer:
-            # buffer is empty, add some more content
-            self.buffer = self.currentfile.readlines(10000)
-            if not self.buffer:
-                # buffer is still empty, try a new file
-                if self.files:
-                    # there are still files avaialble, load the next one#
-                    filename = self.files.pop()
-                    print("Moving to new file '%s'" %(filename))
-                    self.currentfile = open(filename, 'r')
-                    self.buffer = self.currentfile.readlines(10000)
-                else :
-                    # no more files, so return None to signify end of files
-                    return None
-        return self.buffer.pop(0)
+        words = self.read_words(1)
+        if len(words) == 0:
+            # no more files, so return None to signify end of files
+            return None
+        return "{:016X}\n".format(int(words[0]))
+
+
+def main():
+    # Create the binary caches for a directory of ASCII files ahead of time
+    path = sys.argv[1]
+    for filename in sorted(os.listdir(path)):
+        filename = os.path.join(path, filename)
+        if not os.path.isfile(filename) or is_cache_file(filename):
+            continue
+        if not cache_is_valid(filename):
+            print("Converting '%s'" % filename)
+            convert(filename)
+
 
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 import re
+import numpy as np
 
 class DataWordException(Exception):
     pass
@@ -88,3 +89,145 @@ class DataWord(object):
         # matching a course timestamp to an extended timestamp
         match = (time_stamp >> 21) & 0x03
         return match
+
+
+# Characters stripped from each line of an ASCII hex dump before conversion,
+# followed by a trailing comma
+_CLEAN_LINE = re.compile("[\s\x00]")
+_TRAILING_COMMA = re.compile(",$")
+
+# Lookup table from ASCII character code to hex nibble value (0xFF for invalid)
+_HEX_NIBBLES = np.full(256, 0xFF, dtype=np.uint8)
+for _index, _char in enumerate("0123456789ABCDEF"):
+    _HEX_NIBBLES[ord(_char)] = _index
+    _HEX_NIBBLES[ord(_char.lower())] = _index
+
+
+def parse_hex_lines(lines):
+    """
+    Convert a list of ASCII hex dump lines into a uint64 array, one word per line.
+
+    Each line is cleaned in the same way as DataWord (whitespace, NUL characters
+    and a trailing comma removed), and the hex digits of the whole block are then
+    converted in a single vectorised operation.
+    """
+    cleaned = [_TRAILING_COMMA.sub("", _CLEAN_LINE.sub("", line)).rjust(16, "0")
+               for line in lines]
+    if not cleaned:
+        return np.zeros(0, dtype=np.uint64)
+    text = "".join(cleaned)
+    if len(text) != 16 * len(cleaned):
+        # At least one line has more than 16 digits, let int() report it
+        return np.array([int(line, 16) for line in cleaned], dtype=np.uint64)
+    nibbles = _HEX_NIBBLES[np.frombuffer(text.encode("ascii"), dtype=np.uint8)]
+    if np.any(nibbles == 0xFF):
+        raise DataWordException("Invalid hex digit in data block")
+    nibbles = nibbles.reshape(-1, 16)
+    # Pack pairs of nibbles into bytes and read each row as a big endian word
+    packed = (nibbles[:, 0::2] << 4) | nibbles[:, 1::2]
+    return packed.copy().view(">u8").ravel().astype(np.uint64)
+
+
+class DataWordBlock(object):
+    """
+    Vectorised equivalent of DataWord for a block of 64 bit words.
+
+    Properties return arrays with one entry per word.  Control word fields
+    (ctrl_type, timestamp_course) are only meaningful where is_ctrl is True, and
+    event fields (timestamp_fine, energy, pos_x, pos_y) where is_event is True.
+    """
+
+    COURSE_ROLLOVER = DataWord.COURSE_ROLLOVER
+    EXTENDED_TIME = 0x20
+
+    def __init__(self, lines):
+        if isinstance(lines, np.ndarray):
+            self._packets = lines.astype(np.uint64, copy=False)
+        else:
+            self._packets = parse_hex_lines(lines)
+
+    def __len__(self):
+        return len(self._packets)
+
+    def __getitem__(self, item):
+        return DataWordBlock(self._packets[item])
+
+    @property
+    def raw(self):
+        return self._packets
+
+    @property
+    def is_ctrl(self):
+        return self._packets >= np.uint64(0x8000000000000000)
+
+    @property
+    def is_event(self):
+        return self._packets < np.uint64(0x8000000000000000)
+
+    @property
+    def ctrl_type(self):
+        return ((self._packets >> np.uint64(58)) & np.uint64(0x03F)).astype(np.uint8)
+
+    @property
+    def timestamp_course(self):
+        return self._packets & np.uint64(0x000FFFFFFFFFFFF8)
+
+    @property
+    def timestamp_fine(self):
+        return (self._packets >> np.uint64(14)) & np.uint64(0x00000000007FFFFF)
+
+    @property
+    def energy(self):
+        return (self._packets & np.uint64(0x0000000000003FFF)).astype(np.uint16)
+
+    @property
+    def pos_x(self):
+        return ((self._packets >> np.uint64(51)) & np.uint64(0x0000000000000FFF)).astype(np.uint16)
+
+    @property
+    def pos_y(self):
+        return ((self._packets >> np.uint64(39)) & np.uint64(0x0000000000000FFF)).astype(np.uint16)
+
+    def course_timestamps(self, prev_course, course):
+        """
+        Track the extended time words through the block.
+
+        Returns the previous and current course timestamps in force at each word,
+        along with the previous and current course timestamps at the end of the
+        block to pass in to the next block.
+        """
+        is_extended = self.is_ctrl & (self.ctrl_type == self.EXTENDED_TIME)
+        courses = np.concatenate((np.array([prev_course, course], dtype=np.uint64),
+                                  self.timestamp_course[is_extended]))
+        index = np.cumsum(is_extended, dtype=np.intp)
+        return courses[index], courses[index + 1], int(courses[-2]), int(courses[-1])
+
+    def full_timestmap(self, prev_course, course):
+        """
+        Vectorised DataWord.full_timestmap, prev_course and course may be scalars
+        or arrays with one entry per word.  Words that match neither course
+        timestamp are given a full timestamp of zero.
+        """
+        course = np.asarray(course, dtype=np.uint64)
+        prev_course = np.asarray(prev_course, dtype=np.uint64)
+        prev_course = np.where(prev_course == 0, course - np.uint64(self.COURSE_ROLLOVER),
+                               prev_course)
+        fine = self.timestamp_fine
+        fine_match = self.find_match_ts(fine)
+        course_match = self.find_match_ts(course)
+        prev_match = self.find_match_ts(prev_course)
+        use_course = (course_match == fine_match) | (course_match + 1 == fine_match)
+        use_prev = ~use_course & ((prev_match == fine_match) | (prev_match + 1 == fine_match))
+        mask = np.uint64(0x0FFFFFFF800000)
+        full_ts = np.where(use_course, (course & mask) + fine,
+                           np.where(use_prev, (prev_course & mask) + fine, np.uint64(0)))
+        unmatched = np.count_nonzero(~(use_course | use_prev) & self.is_event)
+        if unmatched > 0:
+            print("********* Warning *********** ({} unmatched timestamps)".format(unmatched))
+        return full_ts
+
+    @staticmethod
+    def find_match_ts(time_stamp):
+        # This method will return the 2 bits required for
+        # matching a course timestamp to an extended timestamp
+        return ((time_stamp >> np.uint64(21)) & np.uint64(0x03)).astype(np.uint8)
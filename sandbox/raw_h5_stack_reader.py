@@ -1,9 +1,27 @@
 import os
+import threading
 import h5py
+import numpy as np
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
 
 class RawH5StackReader(object):
+    """
+    Reads the /raw_data datasets of a directory of raw mode files, in order of
+    modification time, as blocks of uint64 words.
+
+    A background thread reads ahead by up to prefetch chunks of chunk_size words,
+    opening the next file of the stack as soon as the current one is exhausted, so
+    that file I/O overlaps with decoding of the data already read.  Files are opened
+    in SWMR mode and the dataset is refreshed before the end of each file is
+    accepted, so files that are still being written are read up to their latest
+    flushed size.
+    """
 
-    def __init__(self, path):
+    def __init__(self, path, chunk_size=10000, prefetch=4):
         self.path = path
         cpath = os.getcwd()
         os.chdir(path)
@@ -11,45 +29,117 @@ class RawH5StackReader(object):
         self.files = [os.path.join(path, f) for f in self.files] # add path to each file
         self.files.sort(key=lambda x: os.path.getmtime(x), reverse=True)
         os.chdir(cpath)
-        self._current_file = h5py.File(self.files.pop(), 'r', libver='latest', swmr=True)
-        self._raw_dset = self._current_file["/raw_data"]
+        self._chunk_size = chunk_size
+        self._chunks = queue.Queue(maxsize=prefetch)
+        self._current = np.zeros(0, dtype=np.uint64)
         self._current_index = 0
-        self.buffer = self.read_lines(10000)
+        self._finished = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._prefetch)
+        self._thread.daemon = True
+        self._thread.start()
 
-    def read_lines(self, no_of_lines):
-        lines = []
-        for data in self._raw_dset[self._current_index:self._current_index+no_of_lines]:
-            lines.append("{:X}".format(data))
-        self._current_index += no_of_lines
-        return lines
+    def _put(self, item):
+        # Block until there is space in the queue, unless the reader is closed
+        while not self._stop.is_set():
+            try:
+                self._chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
 
-    def read_next(self):
-        if not self.buffer:
-            # buffer is empty, add some more content
-            self.buffer = self.read_lines(10000)
-            if not self.buffer:
-                # buffer is still empty, try a new file
-                if self.files:
-                    # there are still files avaialble, load the next one#
-                    filename = self.files.pop()
+    def _prefetch(self):
+        try:
+            first = True
+            while self.files and not self._stop.is_set():
+                filename = self.files.pop()
+                if not first:
                     print("Moving to new file '%s'" %(filename))
-                    self._current_file = h5py.File(self.files.pop(), 'r', libver='latest', swmr=True)
-                    self._raw_dset = self._current_file["/raw_data"]
-                    self._current_index = 0
-                    self.buffer = self.read_lines(10000)
-                else :
-                    # no more files, so return None to signify end of files
-                    return None
-        #print("READ NEXT {}".format(self.buffer[0]))
-        return self.buffer.pop(0)
+                first = False
+                with h5py.File(filename, 'r', libver='latest', swmr=True) as h5_file:
+                    raw_dset = h5_file["/raw_data"]
+                    index = 0
+                    while not self._stop.is_set():
+                        if index >= raw_dset.shape[0]:
+                            # Pick up any data flushed since the file was opened
+                            raw_dset.id.refresh()
+                            if index >= raw_dset.shape[0]:
+                                break
+                        words = raw_dset[index:index+self._chunk_size].astype(np.uint64, copy=False)
+                        index += len(words)
+                        if not self._put(words):
+                            return
+        except Exception as e:
+            self._put(e)
+            return
+        # None signifies the end of the files
+        self._put(None)
+
+    def _next_chunk(self):
+        if self._finished:
+            return False
+        chunk = self._chunks.get()
+        if chunk is None:
+            self._finished = True
+            return False
+        if isinstance(chunk, Exception):
+            self._finished = True
+            raise chunk
+        self._current = chunk
+        self._current_index = 0
+        return True
+
+    def read_words(self, no_of_words):
+        """
+        Return the next slice of up to no_of_words words from the current prefetched
+        chunk without copying.  An empty array signifies the end of the files.
+        """
+        while self._current_index >= len(self._current):
+            if not self._next_chunk():
+                return np.zeros(0, dtype=np.uint64)
+        words = self._current[self._current_index:self._current_index+no_of_words]
+        self._current_index += len(words)
+        return words
+
+    def read_block(self, no_of_words):
+        """
+        Return an array of up to no_of_words words, moving across chunks and files
+        as required.  An empty array signifies the end of the files.
+        """
+        words = self.read_words(no_of_words)
+        if len(words) == no_of_words or len(words) == 0:
+            return words
+        blocks = [words]
+        count = len(words)
+        while count < no_of_words:
+            words = self.read_words(no_of_words - count)
+            if len(words) == 0:
+                break
+            blocks.append(words)
+            count += len(words)
+        return np.concatenate(blocks)
+
+    def read_next(self):
+        words = self.read_words(1)
+        if len(words) == 0:
+            # no more files, so return None to signify end of files
+            return None
+        return "{:X}".format(int(words[0]))
+
+    def close(self):
+        self._stop.set()
+        self._thread.join()
 
 def main():
 
     rs = RawH5StackReader('/dls/i19-2/data/2018/cm19670-3/timepix/19_PdNO2_-210_286K_timepix_TR_7_ON3_OFF4_repeat10')
     while True:
-        print("{}".format(rs.read_lines(20)))
+        words = rs.read_block(20)
+        if len(words) == 0:
+            break
+        print("{}".format(["{:X}".format(int(word)) for word in words]))
 
 
 if __name__ == "__main__":
     main()
-
@@ -1,9 +1,10 @@
 import os
 import random
 import sys
+import numpy as np
 from ascii_stack_reader import AsciiStackReader
 from raw_h5_stack_reader import RawH5StackReader
-from data_word import DataWord
+from data_word import DataWordBlock
 from nexus_swmr_file import NexusSwmrFileWriter
 
 class TimepixDataParser(object):
@@ -12,8 +13,7 @@ class TimepixDataParser(object):
             self._asr = RawH5StackReader(data_dir)
         else:
             self._asr = AsciiStackReader(data_dir)
-        for x in range(0, 50000):
-            self._asr.read_next()
+        self._asr.read_block(50000)
 
         self._num_files = num_files
         self._data_dir = data_dir
@@ -30,8 +30,8 @@ class TimepixDataParser(object):
             for fn in range(0, num_files):
                 self._nx_files[fn].detector_dset[x,] = range((x * 256), (x * 256) + 256)
 
-        self._event_ids = []
-        self._event_times = []
+        self._event_ids = np.zeros(0, dtype=np.uint32)
+        self._event_times = np.zeros(0, dtype=np.uint64)
 
         self._current_file = 0
         self._time_slice_count = 0
@@ -46,92 +46,146 @@ class TimepixDataParser(object):
             self._slice_counts.append(0)
             self._cue_counts.append(0)
 
-    def execute(self, samples):
+    def execute(self, samples, block_size=10000):
         eof = False
         print "Working ",
         sys.stdout.flush()
         while not eof:
 
-            if self._time_slice_count == self._time_slices[self._current_file]:
+            block = DataWordBlock(self._asr.read_block(block_size))
+            if len(block) == 0:
+                eof = True
+                continue
+
+            # Decode the whole block up front, tracking the course timestamps in
+            # force at each word so that full timestamps can be calculated in one go
+            prev_courses, courses, self._prev_timestamp_course, self._timestamp_course = \
+                block.course_timestamps(self._prev_timestamp_course, self._timestamp_course)
+            have_course = (prev_courses > 0) & (courses > 0)
+            timed = block.is_event & have_course
+            full_timestamps = np.zeros(len(block), dtype=np.uint64)
+            full_timestamps[timed] = block[timed].full_timestmap(prev_courses[timed],
+                                                                 courses[timed])
+            counted = timed & (full_timestamps > 0)
+
+            # Number of events counted up to and including each word, stopping at
+            # the word that brings the count up to samples
+            counts = self._count + np.cumsum(counted, dtype=np.int64)
+            reached = np.flatnonzero(counts == samples)
+            end = len(block)
+            if len(reached):
+                end = int(reached[0]) + 1
+                eof = True
+            counted = counted[:end]
+            counts = counts[:end] - counted
+
+            ctrl_types = block.ctrl_type[:end]
+            is_ctrl = block.is_ctrl[:end]
+            extended = np.count_nonzero(is_ctrl & (ctrl_types == 0x20))
+            if extended:
+                # Course timestamps have already been tracked for the block
+                print("Extended time words found", extended)
+            other = np.count_nonzero(is_ctrl & (ctrl_types == 0x30))
+            if other:
+                print("Other data words", other)
+            cues = is_ctrl & (ctrl_types != 0x20) & (ctrl_types != 0x30)
+            if np.any(cues):
+                print("Events recorded", np.count_nonzero(cues))
+
+            event_ids = block.pos_x.astype(np.uint32) + (256 * block.pos_y.astype(np.uint32))
+            events = np.flatnonzero(counted)
+            dots = self._count // 2000
+
+            # Split the events into the time slices of each file in turn, a new
+            # time slice starting with the word after the last event of the previous
+            start = 0
+            taken = 0
+            while True:
+                remaining = self._time_slices[self._current_file] - self._time_slice_count
+                slice_events = events[taken:taken + remaining]
+                taken += len(slice_events)
+                complete = len(slice_events) == remaining
+                stop = int(slice_events[-1]) + 1 if complete else end
+                cue_words = start + np.flatnonzero(cues[start:stop])
+                self.add_cues(counts[cue_words], ctrl_types[cue_words],
+                              block.timestamp_course[cue_words])
+                # The time slice also ends at the last event when samples is reached
+                end_of_slice = complete or (eof and taken == len(events) and len(slice_events) > 0)
+                self.add_events(full_timestamps[slice_events], event_ids[slice_events],
+                                end_of_slice)
+                if not complete:
+                    break
                 self._time_slices[self._current_file] = random.randint(1000, 20000)
                 self._current_file += 1
                 if self._current_file == self._num_files:
                     self._current_file = 0
                 self._time_slice_count = 0
+                start = stop
 
-            data = self._asr.read_next()  # readline()
-            if data is None:
-                eof = True
-                continue
-            packet = DataWord(data)
-
-            if packet.is_event:
-                if self._timestamp_course > 0 and self._prev_timestamp_course > 0:
-                    # print("Data Event found at index", count)
-                    if packet.full_timestmap(self._prev_timestamp_course, self._timestamp_course) > 0:
-                        self._count += 1
-                        self._time_slice_count += 1
-                        self._file_counts[self._current_file] += 1
-                        self._event_times.append(packet.full_timestmap(self._prev_timestamp_course, self._timestamp_course))
-
-                        if len(self._event_times) > 999 or self._time_slice_count == self._time_slices[self._current_file] or self._count == samples:
-                            self._nx_files[self._current_file].event_time_offset.resize((self._file_counts[self._current_file],))
-                            self._nx_files[self._current_file].event_time_offset[self._file_counts[self._current_file] - len(self._event_times):self._file_counts[self._current_file]] = self._event_times
-                            self._event_times = []
-
-                        self._event_ids.append(packet.pos_x + (256 * packet.pos_y))
-
-                        if len(self._event_ids) > 999 or self._time_slice_count == self._time_slices[self._current_file] or self._count == samples:
-                            self._nx_files[self._current_file].event_id_dset.resize((self._file_counts[self._current_file],))
-                            self._nx_files[self._current_file].event_id_dset[self._file_counts[self._current_file] - len(self._event_ids):self._file_counts[self._current_file]] = self._event_ids
-                            self._nx_files[self._current_file].event_id_dset.flush()
-                            self._event_ids = []
-
-                        if self._time_slice_count == self._time_slices[self._current_file] or self._count == samples:
-                            # End of a time slice so put in a marker
-                            self._slice_counts[self._current_file] += 1
-                            self._nx_files[self._current_file].event_index_dset.resize((self._slice_counts[self._current_file],))
-                            self._nx_files[self._current_file].event_index_dset[self._slice_counts[self._current_file] - 1] = self._file_counts[self._current_file]
-                            self._nx_files[self._current_file].event_index_dset.flush()
-                            self._nx_files[self._current_file].event_time_zero_dset.resize((self._slice_counts[self._current_file],))
-                            self._nx_files[self._current_file].event_time_zero_dset[self._slice_counts[self._current_file] - 1] = packet.full_timestmap(self._prev_timestamp_course, self._timestamp_course)
-
-            else:
-                if packet.ctrl_type == 0x20:  # Extended Time
-                    print("Extended time found at index", self._count)
-                    self._prev_timestamp_course = self._timestamp_course
-                    self._timestamp_course = packet.timestamp_course
-                else:  # Other event
-                    if packet.ctrl_type == 0x30:
-                        # Other data words
-                        print("Other data word", packet.ctrl_type)
-                    else:
-                        print("Event recorded", packet.ctrl_type)
-                        self._cue_counts[self._current_file] += 1
-                        self._nx_files[self._current_file].cue_index_dset.resize((self._cue_counts[self._current_file],))
-                        self._nx_files[self._current_file].cue_index_dset[self._cue_counts[self._current_file] - 1] = self._count
-                        # Determine the event type
-                        if packet.ctrl_type == 0x21:  # Shutter Open
-                            cue_type = 0
-                        elif packet.ctrl_type == 0x22:  # Shutter Close
-                            cue_type = 1
-                        elif packet.ctrl_type == 0x23:  # Trigger
-                            cue_type = 2
-                        else:  # Other
-                            cue_type = 3
-                        self._nx_files[self._current_file].cue_id_dset.resize((self._cue_counts[self._current_file],))
-                        self._nx_files[self._current_file].cue_id_dset[self._cue_counts[self._current_file] - 1] = cue_type
-                        self._nx_files[self._current_file].cue_timestamp_zero_dset.resize((self._cue_counts[self._current_file],))
-                        self._nx_files[self._current_file].cue_timestamp_zero_dset[self._cue_counts[self._current_file] - 1] = packet.timestamp_course
-
-            if self._count % 2000 == 0:
-                if self._timestamp_course > 0 and self._prev_timestamp_course > 0:
-                    print ".",
-                    sys.stdout.flush()
-
-            if self._count == samples:
-                eof = True
+            dots = self._count // 2000 - dots
+            if dots > 0:
+                print "." * dots,
+                sys.stdout.flush()
 
         print ""
         for fn in range(0, self._num_files):
             self._nx_files[fn].close()
+
+    def add_events(self, event_times, event_ids, end_of_slice):
+        """
+        Add events to the current file, writing them out in blocks of 1000 and
+        marking the end of the time slice after the last event if requested.
+        """
+        count = len(event_times)
+        self._count += count
+        self._time_slice_count += count
+        self._file_counts[self._current_file] += count
+        self._event_times = np.concatenate((self._event_times, event_times))
+        self._event_ids = np.concatenate((self._event_ids, event_ids))
+
+        nx_file = self._nx_files[self._current_file]
+        file_count = self._file_counts[self._current_file]
+        written = len(self._event_times)
+        if not end_of_slice:
+            written -= written % 1000
+        if written > 0:
+            last = file_count - (len(self._event_times) - written)
+            nx_file.event_time_offset.resize((last,))
+            nx_file.event_time_offset[last - written:last] = self._event_times[:written]
+            nx_file.event_id_dset.resize((last,))
+            nx_file.event_id_dset[last - written:last] = self._event_ids[:written]
+            nx_file.event_id_dset.flush()
+            self._event_times = self._event_times[written:]
+            self._event_ids = self._event_ids[written:]
+
+        if end_of_slice:
+            # End of a time slice so put in a marker
+            self._slice_counts[self._current_file] += 1
+            slice_count = self._slice_counts[self._current_file]
+            nx_file.event_index_dset.resize((slice_count,))
+            nx_file.event_index_dset[slice_count - 1] = file_count
+            nx_file.event_index_dset.flush()
+            nx_file.event_time_zero_dset.resize((slice_count,))
+            nx_file.event_time_zero_dset[slice_count - 1] = event_times[-1]
+
+    def add_cues(self, counts, ctrl_types, timestamp_courses):
+        """
+        Add the cues of control words (shutter, trigger and other events) to the
+        current file.
+        """
+        if len(counts) == 0:
+            return
+        nx_file = self._nx_files[self._current_file]
+        first = self._cue_counts[self._current_file]
+        self._cue_counts[self._current_file] += len(counts)
+        last = self._cue_counts[self._current_file]
+        # Determine the event types: shutter open, shutter close, trigger or other
+        cue_types = np.full(len(ctrl_types), 3, dtype=np.int64)
+        for ctrl_type, cue_type in ((0x21, 0), (0x22, 1), (0x23, 2)):
+            cue_types[ctrl_types == ctrl_type] = cue_type
+        nx_file.cue_index_dset.resize((last,))
+        nx_file.cue_index_dset[first:last] = counts
+        nx_file.cue_id_dset.resize((last,))
+        nx_file.cue_id_dset[first:last] = cue_types
+        nx_file.cue_timestamp_zero_dset.resize((last,))
+        nx_file.cue_timestamp_zero_dset[first:last] = timestamp_courses
@@ -16,6 +16,10 @@ class TimepixPacket(object):
         self._data.append(word)
         self._word_count += 1
 
+    def add_words(self, words):
+        self._data.extend(np.asarray(words, dtype=np.uint64).tolist())
+        self._word_count = len(self._data)
+
     def create_header(self):
         header = 0xE000000000000000
         header |= (self._producer_id << 50)
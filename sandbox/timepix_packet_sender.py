@@ -1,15 +1,15 @@
 import socket
 import time
+import numpy as np
 from ascii_stack_reader import AsciiStackReader
-from data_word import DataWord
+from data_word import DataWordBlock
 from timepix_packet import TimepixPacket
 
 
 class TimepixPacketSender(object):
     def __init__(self, data_dir):
         self._asr = AsciiStackReader(data_dir)
-        for x in range(0, 50000):
-            self._asr.read_next()
+        self._asr.read_block(50000)
 
         self._data_dir = data_dir
         self._count = 0
@@ -41,52 +41,45 @@ class TimepixPacketSender(object):
         port = self._port[0]
         self._bytes_sent += self._sock.sendto(packet.to_bytes(), (host, port))
 
-    def execute(self, samples):
+    def execute(self, samples, block_size=10000):
         self._packets = []
         eof = False
         udp_packet = TimepixPacket(self._packet_id)
         while not eof:
 
-            data = self._asr.read_next()  # readline()
-            if data is None:
+            block = DataWordBlock(self._asr.read_block(block_size))
+            if len(block) == 0:
                 eof = True
                 continue
-            word = DataWord(data)
 
             if self._timestamp_course == 0:
                 # We want a course timestamp before anything else
-                if not word.is_event:
-                    if word.ctrl_type == 0x20:  # Extended Time
-                        print("Extended time found at index", self._count)
-                        self._timestamp_word = word
-                        udp_packet.add_word(self._timestamp_word.raw)
-                        self._prev_timestamp_course = self._timestamp_course
-                        self._timestamp_course = word.timestamp_course
-            else:
-                # Once we have our first timestamp then we can create UDP packets
-                udp_packet.add_word(word.raw)
-                if udp_packet.word_count == 1022:
-                    print("=== Packet ID ===", udp_packet._packet_number)
-                    udp_packet.report()
-                    self._packets.append(udp_packet)
-                    #self.send_packet(udp_packet)
-                    self._packet_id += 1
-                    self._timeslice_counter += 1
-                    if self._timeslice_counter == 20:
-                        self._timeslice_counter = 1
-                        self._timeslice_id += 1
-                    udp_packet = TimepixPacket(self._packet_id, self._timeslice_id)
-                    udp_packet.add_word(self._timestamp_word.raw)
-                if word.is_event:
-                    self._count += 1
-                else:
-                    if word.ctrl_type == 0x20:  # Extended Time
-                        print("Extended time found at index", self._count)
-                        self._timestamp_word = word
+                extended = np.flatnonzero(block.is_ctrl & (block.ctrl_type == 0x20))
+                courses = block.timestamp_course[extended]
+                found = np.flatnonzero(courses > 0)
+                if len(found):
+                    extended = extended[:found[0] + 1]
+                if len(extended) == 0:
+                    continue
+                print("Extended time found at index", self._count)
+                udp_packet.add_words(block.raw[extended])
+                self._timestamp_word = int(block.raw[extended[-1]])
+                self._prev_timestamp_course = self._timestamp_course
+                self._timestamp_course = int(courses[len(extended) - 1])
+                if self._timestamp_course == 0:
+                    continue
+                block = block[int(extended[-1]) + 1:]
 
-
-            if self._count == samples:
+            # Once we have our first timestamp then we can create UDP packets, up to
+            # the word that brings the event count up to samples
+            counts = self._count + np.cumsum(block.is_event, dtype=np.int64)
+            reached = np.flatnonzero(counts == samples)
+            if len(reached):
+                block = block[:int(reached[0]) + 1]
                 eof = True
+            if len(block):
+                self._count = int(counts[len(block) - 1])
+            udp_packet = self.add_words(udp_packet, block)
 
         counter = 0
         for packet in self._packets:
@@ -95,3 +88,41 @@ class TimepixPacketSender(object):
             if counter == 10:
                 time.sleep(0.01)
                 counter = 0
+
+    def add_words(self, udp_packet, block):
+        """
+        Add a block of words to the UDP packets, starting a new packet (with the
+        latest extended time word) each time a packet is full.
+
+        :return: the packet being filled at the end of the block
+        """
+        raw = block.raw
+        is_extended = block.is_ctrl & (block.ctrl_type == 0x20)
+        if np.any(is_extended):
+            print("Extended time words found", np.count_nonzero(is_extended))
+        # Index of the latest extended time word up to each word, -1 if none
+        latest = np.maximum.accumulate(np.where(is_extended, np.arange(len(raw)), -1))
+        added = 0
+        while added < len(raw):
+            words = raw[added:added + 1022 - udp_packet.word_count]
+            udp_packet.add_words(words)
+            added += len(words)
+            if udp_packet.word_count == 1022:
+                print("=== Packet ID ===", udp_packet._packet_number)
+                udp_packet.report()
+                self._packets.append(udp_packet)
+                #self.send_packet(udp_packet)
+                self._packet_id += 1
+                self._timeslice_counter += 1
+                if self._timeslice_counter == 20:
+                    self._timeslice_counter = 1
+                    self._timeslice_id += 1
+                # The new packet starts with the extended time word in force before
+                # the word that filled the last packet
+                if added > 1 and latest[added - 2] >= 0:
+                    self._timestamp_word = int(raw[latest[added - 2]])
+                udp_packet = TimepixPacket(self._packet_id, self._timeslice_id)
+                udp_packet.add_word(self._timestamp_word)
+        if len(raw) and latest[-1] >= 0:
+            self._timestamp_word = int(raw[latest[-1]])
+        return udp_packet
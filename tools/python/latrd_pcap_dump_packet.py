@@ -4,15 +4,17 @@ LATRDProducer - load LATRD packets from packet capture file and send via UDP.
 Tim Nicholls, STFC Application Engineering Group.
 """
 
-import struct
 import logging
 import argparse
 import os
 import socket
 import time
 import random
-import dpkt
 import threading
+import numpy as np
+from latrd.pcap import PcapReader
+from latrd.pcap_summary import summarise, save_summary
+from latrd.detector.udp_routing import UdpRouting
 
 
 class LATRDPacket(object):
@@ -108,6 +110,7 @@ class LATRDFrameProducer(object):
         # Load default parameters
         self.defaults = LATRDProducerDefaults()
 
+        self._routing = None
         self._no_of_ports = 1
 
         # Set the terminal width for argument help formatting
@@ -139,6 +142,11 @@ class LATRDFrameProducer(object):
             default=self.defaults.port_list, metavar='PORT[,PORT,...]',
             help='Comma separatied list of port numbers to transmit UDP frame data to'
         )
+        parser.add_argument(
+            '--udp_config', type=str, dest='udp_config', metavar='FILE',
+            help='UDP configuration file (eg udp_tristan.json) whose destinations time slices are '
+                 'routed to as by the detector, instead of round robin to the ports'
+        )
         parser.add_argument(
             '--frames', '-n', type=int, dest='num_frames',
             default=self.defaults.num_frames, metavar='FRAMES',
@@ -168,6 +176,24 @@ class LATRDFrameProducer(object):
             default=self.defaults.drop_list,
             help='Packet number(s) to drop from each frame',
         )
+        parser.add_argument(
+            '--filter', type=str, dest='filter', metavar='EXPRESSION',
+            help='Select packets with an expression over the packet index fields, '
+                 'eg "(time_slice >= 1000) & (time_slice <= 2000) & (producer_id == 3)"'
+        )
+        parser.add_argument(
+            '--summary', action='store_true', dest='summary',
+            help='Decode the selected packets and print a summary of each producer'
+        )
+        parser.add_argument(
+            '--output', '-o', type=str, dest='output', metavar='FILE',
+            help='Decode the selected packets and write the packet, frame and producer '
+                 'summaries to an HDF5 (.h5) or NPZ file'
+        )
+        parser.add_argument(
+            '--no_index', action='store_true', dest='no_index',
+            help='Scan the capture rather than using (and writing) its .idx index file'
+        )
         parser.add_argument(
             '--logging', type=str, dest='log_level',
             default=self.defaults.log_level, choices=self.defaults.log_levels.keys(),
@@ -190,101 +216,114 @@ class LATRDFrameProducer(object):
         )
 
         # Initialise the packet capture file reader
-        self.pcap = dpkt.pcap.Reader(self.args.pcap_file)
+        self.pcap = PcapReader(self.args.pcap_file, index=not self.args.no_index)
 
     def run(self):
         """
         Run the frame producer.
         """
-        self.load_pcap()
+        try:
+            self._records = self.pcap.select(expression=self.args.filter)
+        except ValueError as error:
+            logging.error("%s", error)
+            return
+        if self.args.summary or self.args.output:
+            self.summarise_pcap()
+        else:
+            self.load_pcap()
 #        self.send_packets()
 
+    def _dump_packet(self, payload):
+        logging.debug("Length of packet: {}".format(len(payload) - 24))
+        for word in np.frombuffer(payload, dtype='<u8', count=len(payload) // 8).tolist():
+            logging.debug("0x{0:016X}".format(word))
+
     def load_pcap(self):
         """
         Load frame packets from a packet capture file.
         """
-
-        # Set up packet capture counters
-        total_packets = 0
-        total_bytes = 0
-
-        # Initialise current frame
-        current_frame = None
-
         logging.info(
             "Extracting LATRD packets from PCAP file %s",
             self.args.pcap_file.name
         )
-
-        # Loop over packets in capture
-        for _, buf in self.pcap:
-
-            # Extract Ethernet, IP and UDP layers from packet buffer
-            eth_layer = dpkt.ethernet.Ethernet(buf)
-            ip_layer = eth_layer.data
-            udp_layer = ip_layer.data
-
-            # Unpack the packet header
-            if len(udp_layer.data) >= 24:
-                (zero_pkt, hdr_pkt_1, hdr_pkt_2) = struct.unpack('<QQQ', udp_layer.data[:24])
-
-                # Check for an idle packet
-                if (hdr_pkt_1 & LATRDPacket.IDLE_PACKET_MASK) == LATRDPacket.IDLE_PACKET_MASK:
-                    if self._idle_packet is None:
-                        logging.debug("IDLE Packet processed...")
-                        pkt_length = len(udp_layer.data[24:])
-                        logging.debug("Length of packet: {}".format(pkt_length))
-                        words = struct.unpack('<{}Q'.format(pkt_length/8), udp_layer.data[24:])
-                        logging.debug("0x{0:016X}".format(zero_pkt))
-                        logging.debug("0x{0:016X}".format(hdr_pkt_1))
-                        logging.debug("0x{0:016X}".format(hdr_pkt_2))
-                        for word in words:
-                            logging.debug("0x{0:016X}".format(word))
-                        self._idle_packet = udp_layer.data
-                else:
-                    # Store the packets exactly as recorded
-                    self._packets.append(udp_layer.data)
-                    # Store the source timeslice so that we can use it for round robin
-                    ts_wrap = (hdr_pkt_1 & LATRDPacket.TIME_SLICE_WRAP_MASK) >> 18
-                    ts_buff = (hdr_pkt_2 & LATRDPacket.TIME_SLICE_BUFFER_MASK) >> 32
-                    self._ts.append((ts_wrap * LATRDPacket.NO_OF_BUFFERS) + ts_buff)
-                    #logging.debug("Ts ID: %d", (ts_wrap * LATRDPacket.NO_OF_BUFFERS) + ts_buff)
-                    if self._data_packet is None:
-                        logging.debug("Data Packet processed...")
-                        pkt_length = len(udp_layer.data[24:])
-                        logging.debug("Length of packet: {}".format(pkt_length))
-                        words = struct.unpack('<{}Q'.format(pkt_length/8), udp_layer.data[24:])
-                        logging.debug("0x{0:016X}".format(zero_pkt))
-                        logging.debug("0x{0:016X}".format(hdr_pkt_1))
-                        logging.debug("0x{0:016X}".format(hdr_pkt_2))
-                        for word in words:
-                            logging.debug("0x{0:016X}".format(word))
-                        self._data_packet = udp_layer.data
-
-            else:
-                logging.debug("Ignoring data packet with length [%s]...", len(udp_layer.data))
+        index = self.pcap.packet_index()
+        ignored = np.count_nonzero(index['length'] < 24)
+        if ignored:
+            logging.debug("Ignoring %d packets shorter than a packet header...", ignored)
+
+        # Dump the first idle packet
+        idle = self.pcap.idle_records()
+        if len(idle):
+            logging.debug("IDLE Packet processed...")
+            self._idle_packet = self.pcap.payload(int(idle[0]))
+            self._dump_packet(self._idle_packet)
+
+        # Store the packets exactly as recorded, with the source timeslice so that
+        # we can use it for round robin
+        self._packets = self.pcap.payloads(self._records)
+        self._ts = index['time_slice'][self._records].tolist()
+        if self._packets:
+            logging.debug("Data Packet processed...")
+            self._data_packet = self._packets[0]
+            self._dump_packet(self._data_packet)
 
         logging.debug("Number of data packets processed: %d", len(self._packets))
 
+    def summarise_pcap(self):
+        """
+        Decode the selected packets into arrays and summarise them by producer and
+        by frame (time slice or image).
+        """
+        logging.info(
+            "Decoding %d LATRD packets from PCAP file %s",
+            len(self._records), self.args.pcap_file.name
+        )
+        summary = summarise(self.pcap, self._records)
+        frames = summary['frames']
+        for producer in summary['producers']:
+            print("Producer {} ({} mode): {} frames [{}-{}], {} packets, {} missing, "
+                  "{} duplicated, {} words ({} data, {} control, control fraction {:.4f}), "
+                  "coarse timestamps [0x{:X}-0x{:X}]".format(
+                      producer['producer_id'], 'count' if producer['count_mode'] else 'event',
+                      producer['frames'], producer['first_frame'], producer['last_frame'],
+                      producer['packets'], producer['missing'], producer['duplicates'],
+                      producer['words'], producer['data_words'], producer['control_words'],
+                      producer['control_fraction'],
+                      producer['timestamp_min'] if producer['timestamp_max'] else 0,
+                      producer['timestamp_max']))
+        incomplete = np.count_nonzero((frames['missing'] > 0) | (frames['duplicates'] > 0))
+        print("{} of {} frames have missing or duplicated packets".format(incomplete, len(frames)))
+
+        if self.args.output:
+            save_summary(self.args.output, summary, {
+                'pcap_file': self.args.pcap_file.name,
+                'filter': self.args.filter
+            })
+            logging.info("Summary written to %s", self.args.output)
+
     def send_packets(self):
 
         send_threads = []
         if isinstance(self.args.ports, str):
             self.args.ports = [self.args.ports]
 
-        self._no_of_ports = len(self.args.ports)
-        logging.info("Launching threads to send packets to {} destination ports".format(
-            len(self.args.ports)
+        if self.args.udp_config:
+            self._routing = UdpRouting.from_file(self.args.udp_config)
+        else:
+            self._routing = UdpRouting([(self.args.ip_addr, port) for port in self.args.ports])
+        self._no_of_ports = self._routing.no_of_endpoints
+        logging.info("Launching threads to send packets to {} destinations".format(
+            self._no_of_ports
         ))
 
         index = 0
-        for port in self.args.ports:
-            send_thread = threading.Thread(target=self._send_packets, args=(int(port),int(index)))
+        for endpoint in self._routing.endpoints:
+            send_thread = threading.Thread(target=self._send_packets, args=(endpoint, int(index)))
             send_threads.append(send_thread)
             send_thread.start()
             index += 1
 
-    def _send_packets(self, port, index):
+    def _send_packets(self, endpoint, index):
         """
         Send loaded packets over UDP socket.
         """
@@ -304,7 +343,7 @@ class LATRDFrameProducer(object):
         for packets in range(int(self.args.num_idle)):
             # Send the packet over the UDP socket
             try:
-                idle_bytes_sent += udp_socket.sendto(self._idle_packet, (self.args.ip_addr, port))
+                idle_bytes_sent += udp_socket.sendto(self._idle_packet, endpoint)
                 idle_packets_sent += 1
                 # Add 1 second delay
                 time.sleep(1.0)
@@ -317,11 +356,12 @@ class LATRDFrameProducer(object):
         data_bytes_sent = 0
         data_packets_sent = 0
         delay = float(self.args.duration)/float(len(self._packets)/self._no_of_ports)
-        for packet, ts_id in zip(self._packets, self._ts):
+        endpoint_indices = self._routing.endpoint_indices(self._ts).tolist()
+        for packet, endpoint_index in zip(self._packets, endpoint_indices):
             # Send the packet over the UDP socket
             try:
-                if ts_id % self._no_of_ports == index:
-                    data_bytes_sent += udp_socket.sendto(packet, (self.args.ip_addr, port))
+                if endpoint_index == index:
+                    data_bytes_sent += udp_socket.sendto(packet, endpoint)
                     data_packets_sent += 1
                     # Add 1 second delay
                     if delay > 0.001:
@@ -338,7 +378,7 @@ class LATRDFrameProducer(object):
         for packets in range(int(self.args.num_idle)):
             # Send the packet over the UDP socket
             try:
-                idle_bytes_sent += udp_socket.sendto(self._idle_packet, (self.args.ip_addr, port))
+                idle_bytes_sent += udp_socket.sendto(self._idle_packet, endpoint)
                 idle_packets_sent += 1
                 # Add 1 second delay
                 time.sleep(1.0)
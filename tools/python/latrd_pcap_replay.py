@@ -4,15 +4,11 @@ LATRDProducer - load LATRD packets from packet capture file and send via UDP.
 Tim Nicholls, STFC Application Engineering Group.
 """
 
-import struct
 import logging
 import argparse
 import os
-import socket
-import time
-import random
-import dpkt
-import threading
+from latrd.pcap import PcapReader
+from latrd.detector.pcap_replay import PcapReplay
 
 
 class LATRDPacket(object):
@@ -21,6 +17,7 @@ class LATRDPacket(object):
     TIME_SLICE_WRAP_MASK   = 0x0003FFFFFFFC0000
     TIME_SLICE_BUFFER_MASK = 0x000000FF00000000
     WORD_COUNT_MASK        = 0x00000000000007FF
+    PACKET_ID_MASK         = 0x00000000FFFFFFFF
     NO_OF_BUFFERS          = 4
 
 
@@ -38,6 +35,11 @@ class LATRDProducerDefaults(object):
         self.duration = 6.0
         self.drop_frac = 0
         self.drop_list = None
+        self.reorder = 0
+        self.dup_frac = 0
+        self.gap_time = 0.001
+        self.manifest = 'latrd_replay_manifest.json'
+        self.queue_depth = 8
 
         self.log_level = 'info'
         self.log_levels = {
@@ -85,7 +87,7 @@ class CsvAction(argparse.Action):
             raise argparse.ArgumentError(self, e)
         setattr(namespace, self.dest, item_list)
 
-class LATRDFrameProducer(object):
+class LATRDFrameProducer(PcapReplay):
     """
     LATRD frame procducer - loads frame packets data from capture file and replays it to
     a receiver via a UDP socket.
@@ -95,20 +97,11 @@ class LATRDFrameProducer(object):
         """
         Initialise the packet producer object, setting defaults and parsing command-line options.
         """
-        # IDLE packet record
-        self._idle_packet = None
-
-        # Create an empty list for packet storage
-        self._packets = []
-
-        # Create an empty list for timeslice information
-        self._ts = []
+        super(LATRDFrameProducer, self).__init__()
 
         # Load default parameters
         self.defaults = LATRDProducerDefaults()
 
-        self._no_of_ports = 1
-
         # Set the terminal width for argument help formatting
         try:
             term_columns = int(os.environ['COLUMNS']) - 2
@@ -138,6 +131,11 @@ class LATRDFrameProducer(object):
             default=self.defaults.port_list, metavar='PORT[,PORT,...]',
             help='Comma separatied list of port numbers to transmit UDP frame data to'
         )
+        parser.add_argument(
+            '--udp_config', type=str, dest='udp_config', metavar='FILE',
+            help='UDP configuration file (eg udp_tristan.json) whose destinations frames are '
+                 'routed to as by the detector, instead of round robin to the ports'
+        )
         parser.add_argument(
             '--frames', '-n', type=int, dest='num_frames',
             default=self.defaults.num_frames, metavar='FRAMES',
@@ -153,6 +151,16 @@ class LATRDFrameProducer(object):
             default=self.defaults.num_idle, metavar='IDLE',
             help='Number of idle packets to send before and after'
         )
+        parser.add_argument(
+            '--speed', type=float, dest='speed', metavar='FACTOR',
+            help='Reproduce the packet timing of the capture, sped up by this factor '
+                 '(instead of spreading the packets over the duration)'
+        )
+        parser.add_argument(
+            '--max_rate', action='store_true', dest='max_rate',
+            help='Send the packets as fast as possible (instead of spreading them over the '
+                 'duration)'
+        )
         parser.add_argument(
             '--pkt_gap', type=int, dest='pkt_gap', metavar='PACKETS',
             help='Insert brief pause between every N packets'
@@ -167,6 +175,56 @@ class LATRDFrameProducer(object):
             default=self.defaults.drop_list,
             help='Packet number(s) to drop from each frame',
         )
+        parser.add_argument(
+            '--reorder', type=int, dest='reorder',
+            default=self.defaults.reorder, metavar='PACKETS',
+            help='Shuffle the packets sent to each port within windows of this many packets'
+        )
+        parser.add_argument(
+            '--dup_frac', type=float, dest='dup_frac',
+            min=0.0, max=1.0, action=Range,
+            default=self.defaults.dup_frac, metavar='FRACTION',
+            help='Fraction of packets to send twice'
+        )
+        parser.add_argument(
+            '--gap_time', type=float, dest='gap_time',
+            default=self.defaults.gap_time, metavar='SECONDS',
+            help='Length of the pause inserted every pkt_gap packets'
+        )
+        parser.add_argument(
+            '--seed', type=int, dest='seed',
+            help='Random seed for dropping, reordering and duplicating packets'
+        )
+        parser.add_argument(
+            '--manifest', type=str, dest='manifest',
+            default=self.defaults.manifest, metavar='FILE',
+            help='File to write the manifest of dropped and duplicated packets to'
+        )
+        parser.add_argument(
+            '--stream', action='store_true', dest='stream',
+            help='Send packets while the capture is read, rather than loading it first (the '
+                 'capture packet index, about 56 bytes a packet, is still built or read from '
+                 'its .idx file before the first packet is sent)'
+        )
+        parser.add_argument(
+            '--queue', type=int, dest='queue_depth',
+            default=self.defaults.queue_depth, metavar='BATCHES',
+            help='Batches of packets buffered for each port when streaming'
+        )
+        parser.add_argument(
+            '--slices', type=str, val_type=int, dest='slices', action=CsvAction,
+            metavar='FIRST,LAST',
+            help='Only send the packets of this range of time slices (inclusive)'
+        )
+        parser.add_argument(
+            '--producer', type=str, val_type=int, dest='producer', action=CsvAction,
+            metavar='ID[,ID,...]',
+            help='Only send the packets of these producer IDs'
+        )
+        parser.add_argument(
+            '--no_index', action='store_true', dest='no_index',
+            help='Scan the capture rather than using (and writing) its .idx index file'
+        )
         parser.add_argument(
             '--logging', type=str, dest='log_level',
             default=self.defaults.log_level, choices=self.defaults.log_levels.keys(),
@@ -175,6 +233,10 @@ class LATRDFrameProducer(object):
 
         # Parse arguments
         self.args = parser.parse_args()
+        if self.args.speed is not None and self.args.max_rate:
+            parser.error("--speed and --max_rate are mutually exclusive")
+        if self.args.speed is not None and self.args.speed <= 0.0:
+            parser.error("--speed must be greater than zero")
 
         # Map logging level option onto real level
         if self.args.log_level in self.defaults.log_levels:
@@ -188,144 +250,14 @@ class LATRDFrameProducer(object):
             datefmt='%y%m%d %H:%M:%S'
         )
 
-        # Initialise the packet capture file reader
-        self.pcap = dpkt.pcap.Reader(self.args.pcap_file)
-
-    def run(self):
-        """
-        Run the frame producer.
-        """
-        self.load_pcap()
-        self.send_packets()
-
-    def load_pcap(self):
-        """
-        Load frame packets from a packet capture file.
-        """
-
-        # Set up packet capture counters
-        total_packets = 0
-        total_bytes = 0
-
-        # Initialise current frame
-        current_frame = None
-
-        logging.info(
-            "Extracting LATRD packets from PCAP file %s",
-            self.args.pcap_file.name
-        )
-
-        # Loop over packets in capture
-        for _, buf in self.pcap:
-
-            # Extract Ethernet, IP and UDP layers from packet buffer
-            eth_layer = dpkt.ethernet.Ethernet(buf)
-            ip_layer = eth_layer.data
-            udp_layer = ip_layer.data
+        # Initialise the packet capture file reader, using its index file if up to date
+        self.pcap = PcapReader(self.args.pcap_file, index=not self.args.no_index)
 
-            # Unpack the packet header
-            if len(udp_layer.data) >= 24:
-                (zero_pkt, hdr_pkt_1, hdr_pkt_2) = struct.unpack('<QQQ', udp_layer.data[:24])
-
-                # Check for an idle packet
-                if (hdr_pkt_1 & LATRDPacket.IDLE_PACKET_MASK) == LATRDPacket.IDLE_PACKET_MASK:
-                    if self._idle_packet is None:
-                        logging.debug("IDLE Packet processed...")
-                        self._idle_packet = udp_layer.data
-                else:
-                    # Store the packets exactly as recorded
-                    self._packets.append(udp_layer.data)
-                    # Store the source timeslice so that we can use it for round robin
-                    ts_wrap = (hdr_pkt_1 & LATRDPacket.TIME_SLICE_WRAP_MASK) >> 18
-                    ts_buff = (hdr_pkt_2 & LATRDPacket.TIME_SLICE_BUFFER_MASK) >> 32
-                    self._ts.append((ts_wrap * LATRDPacket.NO_OF_BUFFERS) + ts_buff)
-                    #logging.debug("Ts ID: %d", (ts_wrap * LATRDPacket.NO_OF_BUFFERS) + ts_buff)
-            else:
-                logging.debug("Ignoring data packet with length [%s]...", len(udp_layer.data))
-
-        logging.debug("Number of data packets processed: %d", len(self._packets))
-
-    def send_packets(self):
-
-        send_threads = []
-        if isinstance(self.args.ports, str):
-            self.args.ports = [self.args.ports]
-
-        self._no_of_ports = len(self.args.ports)
-        logging.info("Launching threads to send packets to {} destination ports".format(
-            len(self.args.ports)
-        ))
-
-        index = 0
-        for port in self.args.ports:
-            send_thread = threading.Thread(target=self._send_packets, args=(int(port),int(index)))
-            send_threads.append(send_thread)
-            send_thread.start()
-            index += 1
-
-    def _send_packets(self, port, index):
+    def select(self):
         """
-        Send loaded packets over UDP socket.
+        Return the record indices of the capture packets to send.
         """
-
-        # Create the UDP socket
-        udp_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-
-        if udp_socket is None:
-            logging.error("Failed to open UDP socket")
-            return
-
-
-        idle_bytes_sent = 0
-        idle_packets_sent = 0
-        logging.info("Sending %d idle packets at 1 Hz", self.args.num_idle)
-        # Start by sending Idle packets at a rate of 1Hz
-        for packets in range(int(self.args.num_idle)):
-            # Send the packet over the UDP socket
-            try:
-                idle_bytes_sent += udp_socket.sendto(self._idle_packet, (self.args.ip_addr, port))
-                idle_packets_sent += 1
-                # Add 1 second delay
-                time.sleep(1.0)
-            except socket.error as exc:
-                logging.error("Got error sending frame packet: %s", exc)
-                break
-
-        # Packet delay is total duration / number of packets
-        logging.info("Sending %d data packets in %f seconds", len(self._packets)/self._no_of_ports, self.args.duration)
-        data_bytes_sent = 0
-        data_packets_sent = 0
-        delay = float(self.args.duration)/float(len(self._packets)/self._no_of_ports)
-        for packet, ts_id in zip(self._packets, self._ts):
-            # Send the packet over the UDP socket
-            try:
-                if ts_id % self._no_of_ports == index:
-                    data_bytes_sent += udp_socket.sendto(packet, (self.args.ip_addr, port))
-                    data_packets_sent += 1
-                    # Add 1 second delay
-                    if delay > 0.001:
-                        time.sleep(delay)
-            except socket.error as exc:
-                logging.error("Got error sending frame packet: %s", exc)
-                break
-
-        time.sleep(1.0)
-        idle_bytes_sent = 0
-        idle_packets_sent = 0
-        logging.info("Sending %d idle packets at 1 Hz", self.args.num_idle)
-        # Start by sending Idle packets at a rate of 1Hz
-        for packets in range(int(self.args.num_idle)):
-            # Send the packet over the UDP socket
-            try:
-                idle_bytes_sent += udp_socket.sendto(self._idle_packet, (self.args.ip_addr, port))
-                idle_packets_sent += 1
-                # Add 1 second delay
-                time.sleep(1.0)
-            except socket.error as exc:
-                logging.error("Got error sending frame packet: %s", exc)
-                break
-
-        udp_socket.close()
+        return self.pcap.select(time_slices=self.args.slices, producer_id=self.args.producer)
 
 if __name__ == '__main__':
 
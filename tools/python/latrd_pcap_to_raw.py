@@ -0,0 +1,54 @@
+"""
+Convert a packet capture into raw mode HDF5 files.
+
+The raw_data datasets written are laid out as the frame processor writes them in
+raw mode, one file per port, so that offline decoding of real captures can be
+benchmarked without running the frame receiver and processor.
+"""
+import argparse
+import logging
+import time
+
+from latrd.raw.capture import convert_capture, RAW_DATA_CHUNK
+from latrd.detector.udp_routing import UdpRouting
+
+
+def options():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("pcap_file", help="Packet capture file to convert")
+    parser.add_argument("-o", "--output", default="/tmp/latrd_raw.h5",
+                        help="Raw mode file to write, suffixed with _<port index> for more than "
+                             "one port (/tmp/latrd_raw.h5)")
+    parser.add_argument("-p", "--ports", type=int, default=1,
+                        help="Number of ports (and frame processors) the packets are routed to (1)")
+    parser.add_argument("--udp_config", default=None,
+                        help="UDP configuration file (eg udp_tristan.json) to route the packets "
+                             "to its destinations as the detector does, instead of to --ports "
+                             "round robin")
+    parser.add_argument("-j", "--processes", type=int, default=None,
+                        help="Number of worker processes (one per port)")
+    parser.add_argument("-c", "--chunk", type=int, default=RAW_DATA_CHUNK,
+                        help="Chunk size in words of the raw_data datasets "
+                             "({})".format(RAW_DATA_CHUNK))
+    parser.add_argument("-v", "--verbose", action="store_true",
+                        help="Log the progress of each port")
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = options()
+    logging.basicConfig(level=logging.DEBUG if args.verbose else logging.INFO,
+                        format='%(levelname)1.1s %(message)s')
+    start = time.time()
+    routing = UdpRouting.from_file(args.udp_config) if args.udp_config else None
+    results = convert_capture(args.pcap_file, args.output, args.ports, args.processes, args.chunk,
+                              routing)
+    for result in results:
+        print("Wrote {} packets, {} words in {} frames to {}".format(
+            result['packets'], result['words'], result['frames'], result['filename']))
+    print("Converted {} in {:.3f} s".format(args.pcap_file, time.time() - start))
+
+
+if __name__ == '__main__':
+    main()
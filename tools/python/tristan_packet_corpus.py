@@ -0,0 +1,57 @@
+"""
+Generate a persistent corpus of simulated Tristan packets.
+
+The corpus holds exactly the packets that the control simulator would generate
+for the same parameters, and can be replayed by the simulator with --corpus.
+"""
+import argparse
+
+from latrd.detector.event_simulator import GeneratorState, TristanModule, TristanSliceSource
+from latrd.detector.packet_corpus import write_corpus
+
+
+def options():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-o", "--output", default="/tmp/tristan.corpus",
+                        help="Corpus file to write (/tmp/tristan.corpus)")
+    parser.add_argument("-e", "--events", type=int, default=80000000,
+                        help="Number of events to generate (80000000)")
+    parser.add_argument("-s", "--slice", type=int, default=800,
+                        help="Number of events per time slice (800)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for the event stream")
+    parser.add_argument("--producer", type=int, default=None,
+                        help="Producer ID of a module stream, the stream is sequential if "
+                             "not given")
+    parser.add_argument("--geometry", default="0,0,2068,514",
+                        help="Module pixel range x_min,y_min,x_max,y_max (0,0,2068,514)")
+    parser.add_argument("--clock-skew", type=float, default=0.0,
+                        help="Module clock skew in ppm (0)")
+    args = parser.parse_args()
+    return args
+
+
+def main():
+    args = options()
+    module = None
+    stream_id = 0
+    if args.producer is not None:
+        x_min, y_min, x_max, y_max = [int(value) for value in args.geometry.split(',')]
+        module = TristanModule(args.producer, x_min, y_min, x_max, y_max, args.clock_skew)
+        stream_id = args.producer
+    state = GeneratorState(seed=args.seed, stream_id=stream_id)
+    source = TristanSliceSource(args.events, args.slice, state=state, module=module)
+    parameters = {
+        'total_events': args.events,
+        'per_slice': args.slice,
+        'seed': args.seed,
+        'producer_id': args.producer,
+        'geometry': args.geometry if module is not None else None,
+        'clock_skew': args.clock_skew if module is not None else None
+    }
+    count = write_corpus(args.output, source, parameters)
+    print("Wrote {} packets in {} time slices to {}".format(count, source.no_of_slices,
+                                                            args.output))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,7 +4,6 @@ LATRDProducer - load LATRD packets from packet capture file and send via UDP.
 Tim Nicholls, STFC Application Engineering Group.
 """
 
-import struct
 import logging
 import argparse
 import os
@@ -12,125 +11,10 @@ import socket
 import time
 import random
 import threading
-
-
-class TristanDefinitions(object):
-    IDLE_PACKET_MASK       = 0x000000000003F800
-    PRODUCER_ID_MASK       = 0x03FC000000000000
-    TIME_SLICE_WRAP_MASK   = 0x0003FFFFFFFC0000
-    TIME_SLICE_BUFFER_MASK = 0x000000FF00000000
-    WORD_COUNT_MASK        = 0x00000000000007FF
-    PACKET_ID_MASK         = 0x00000000FFFFFFFF
-    COURSE_TIMESTAMP_MASK  = 0x000FFFFFFFFFFFF8
-    FINE_TIMESTAMP_MASK    = 0x00000000007FFFFF
-    ENERGY_MASK            = 0x0000000000003FFF
-    POSITION_MASK          = 0x0000000003FFFFFF
-    TIMESTAMP_CONTROL_WORD = 0x8000000000000000
-    HEADER_WORD_1          = 0x0000000000000000
-    HEADER_WORD_2          = 0xE000000000000000
-    HEADER_WORD_3          = 0xE400000000000000
-    NO_OF_BUFFERS          = 4
-
-
-class TristanData(object):
-    WORD_INDEX = 0
-#    TIMESTAMP = 9033808973057
-    TIMESTAMP = 0
-    TIME_SLICE_NUMBER = 0
-    PACKET_NUMBER = 0
-
-
-class TristanTimestampWord(object):
-    def __init__(self, ts):
-        self._ts = ts
-
-    def to_64_bit_word(self):
-        data_word = (self._ts&TristanDefinitions.COURSE_TIMESTAMP_MASK) | TristanDefinitions.TIMESTAMP_CONTROL_WORD
-        return data_word
-
-
-class TristanWord(object):
-    def __init__(self, ts):
-        self._index = TristanData.WORD_INDEX
-        TristanData.WORD_INDEX+=1
-        self._ts = ts
-
-    def to_64_bit_word(self):
-        data_word = (self._index&TristanDefinitions.POSITION_MASK)<<37 | \
-                    (self._ts&TristanDefinitions.FINE_TIMESTAMP_MASK)<<14
-        return data_word
-
-
-class TristanIdlePacket(object):
-    def __init__(self):
-        self._words = [
-            0x0000000000000003,
-            0xE00000000003F803,
-            0xE400000000000000,
-            0xFC00000000000000
-        ]
-
-    def to_packet(self):
-        byte_array = struct.pack('<Q', self._words[0])
-        byte_array += struct.pack('<Q', self._words[1])
-        byte_array += struct.pack('<Q', self._words[2])
-        byte_array += struct.pack('<Q', self._words[3])
-        return byte_array
-
-
-class TristanPacket(object):
-    def __init__(self, words, time_slice):
-        self._words = []
-
-        # Calculate the current course and fine timestamp
-        self._course_ts = TristanData.TIMESTAMP&TristanDefinitions.COURSE_TIMESTAMP_MASK
-        self._fine_ts = TristanData.TIMESTAMP&TristanDefinitions.FINE_TIMESTAMP_MASK
-
-        self._ts_word = TristanTimestampWord(self._course_ts)
-        extra_words = 0
-
-        for index in range(words):
-            if index > 0:
-                if self._fine_ts&TristanDefinitions.FINE_TIMESTAMP_MASK == 0:
-                    self._course_ts = TristanData.TIMESTAMP&TristanDefinitions.COURSE_TIMESTAMP_MASK
-                    self._words.append(TristanTimestampWord(self._course_ts))
-                    extra_words += 1
-            self._words.append(TristanWord(self._fine_ts))
-            self._fine_ts += 1
-            TristanData.TIMESTAMP += 1
-
-        # Record the header information
-        self._ts_buffer = time_slice%TristanDefinitions.NO_OF_BUFFERS
-        self._ts_wrap = int(time_slice/TristanDefinitions.NO_OF_BUFFERS)
-        self._packet = TristanData.PACKET_NUMBER
-        TristanData.PACKET_NUMBER += 1
-
-        # Create the header words
-        # Fixed header 1
-        self._hdr_1 = TristanDefinitions.HEADER_WORD_1
-        # Header 2 contains time slice wrap and word count
-        # Word count is no of words + 1 for timestamp + 2 for header words
-        # plus any additional timestamp words required for wrapping
-        word_count = words + 3 + extra_words
-        self._hdr_2 = TristanDefinitions.HEADER_WORD_2 | \
-                      (word_count&TristanDefinitions.WORD_COUNT_MASK) | \
-                      ((self._ts_wrap<<18)&TristanDefinitions.TIME_SLICE_WRAP_MASK)
-        # Header 3 contains time slice buffer number and the packet ID
-        self._hdr_3 = TristanDefinitions.HEADER_WORD_3 | \
-                      ((self._ts_buffer<<32)&TristanDefinitions.TIME_SLICE_BUFFER_MASK) | \
-                      (self._packet&TristanDefinitions.PACKET_ID_MASK)
-
-    def to_packet(self):
-        words = [self._hdr_1, self._hdr_2, self._hdr_3, self._ts_word.to_64_bit_word()]
-        for word in self._words:
-            words.append(word.to_64_bit_word())
-        byte_array = None
-        for word in words:
-            if byte_array is None:
-                byte_array = struct.pack('<Q', word)
-            else:
-                byte_array += struct.pack('<Q', word)
-        return byte_array
+from latrd.detector.event_simulator import GeneratorState, TristanIdlePacket, TristanPacketBuilder
+from latrd.detector.udp_pacer import PacketPacer, set_send_buffer
+from latrd.detector.send_plan import SendPlan
+from latrd.detector.udp_routing import UdpRouting
 
 
 class Range(argparse.Action):
@@ -183,6 +67,11 @@ class LATRDProducerDefaults(object):
         self.duration = 6.0
         self.drop_frac = 0
         self.drop_list = None
+        self.reorder = 0
+        self.dup_frac = 0
+        self.gap_time = 0.001
+        self.manifest = 'tristan_generator_manifest.json'
+        self.burst = 1
 
         self.log_level = 'info'
         self.log_levels = {
@@ -215,6 +104,13 @@ class LATRDFrameProducer(object):
         # Time slice container
         self._time_slices = []
 
+        # Packet number of each packet within its time slice
+        self._pkt_ids = []
+
+        # Routing of time slices to destinations, and send plan for each destination
+        self._routing = None
+        self._plan = None
+
         # Start packet numbers from 0
         self._pkt_number = 0
 
@@ -246,6 +142,11 @@ class LATRDFrameProducer(object):
             default=self.defaults.port_list, metavar='PORT[,PORT,...]',
             help='Comma separatied list of port numbers to transmit UDP frame data to'
         )
+        parser.add_argument(
+            '--udp_config', type=str, dest='udp_config', metavar='FILE',
+            help='UDP configuration file (eg udp_tristan.json) whose destinations time slices are '
+                 'routed to as by the detector, instead of round robin to the ports'
+        )
         parser.add_argument(
             '--events', '-e', type=int, dest='num_events',
             default=self.defaults.num_events, metavar='FRAMES',
@@ -261,6 +162,23 @@ class LATRDFrameProducer(object):
             default=self.defaults.num_idle, metavar='IDLE',
             help='Number of idle packets to send before and after'
         )
+        parser.add_argument(
+            '--rate', type=float, dest='packet_rate', metavar='PACKETS',
+            help='Data packets per second to send to each port (overrides duration)'
+        )
+        parser.add_argument(
+            '--gbps', type=float, dest='data_rate', metavar='GBPS',
+            help='Data rate in Gbit/s to send to each port (overrides duration)'
+        )
+        parser.add_argument(
+            '--burst', type=int, dest='burst',
+            default=self.defaults.burst, metavar='PACKETS',
+            help='Number of packets to send back to back'
+        )
+        parser.add_argument(
+            '--sndbuf', type=int, dest='send_buffer', metavar='BYTES',
+            help='UDP socket send buffer size'
+        )
         parser.add_argument(
             '--pkt_gap', type=int, dest='pkt_gap', metavar='PACKETS',
             help='Insert brief pause between every N packets'
@@ -275,6 +193,31 @@ class LATRDFrameProducer(object):
             default=self.defaults.drop_list,
             help='Packet number(s) to drop from each frame',
         )
+        parser.add_argument(
+            '--reorder', type=int, dest='reorder',
+            default=self.defaults.reorder, metavar='PACKETS',
+            help='Shuffle the packets sent to each port within windows of this many packets'
+        )
+        parser.add_argument(
+            '--dup_frac', type=float, dest='dup_frac',
+            min=0.0, max=1.0, action=Range,
+            default=self.defaults.dup_frac, metavar='FRACTION',
+            help='Fraction of packets to send twice'
+        )
+        parser.add_argument(
+            '--gap_time', type=float, dest='gap_time',
+            default=self.defaults.gap_time, metavar='SECONDS',
+            help='Length of the pause inserted every pkt_gap packets'
+        )
+        parser.add_argument(
+            '--seed', type=int, dest='seed',
+            help='Random seed for dropping, reordering and duplicating packets'
+        )
+        parser.add_argument(
+            '--manifest', type=str, dest='manifest',
+            default=self.defaults.manifest, metavar='FILE',
+            help='File to write the manifest of dropped and duplicated packets to'
+        )
         parser.add_argument(
             '--logging', type=str, dest='log_level',
             default=self.defaults.log_level, choices=self.defaults.log_levels.keys(),
@@ -301,6 +244,7 @@ class LATRDFrameProducer(object):
         Run the frame producer.
         """
         self.create_packets(self.args.num_events, 5000000)
+        self.create_plan()
         self.send_packets()
 
     def create_packets(self, total_events, per_slice):
@@ -311,48 +255,68 @@ class LATRDFrameProducer(object):
         self._idle_packet = TristanIdlePacket().to_packet()
 
         # Now create enough packets for the number of words
-        generated_events = 0
-        time_slice = 0
-
-        while generated_events < total_events:
-            time_slice_dict = {'id': time_slice, 'packets': [], 'ts': []}
-            # Generate a new packet
-            slice_events = 0
-            while slice_events < per_slice:
-                pkt = TristanPacket(800, time_slice)
-                #print("Packet length bytes: {}".format(len(pkt.to_packet())))
-                generated_events += 800
-                slice_events+=800
-
-                time_slice_dict['packets'].append(pkt.to_packet())
-                time_slice_dict['ts'].append(self._pkt_number)
-                #self._packets.append(pkt.to_packet())
-                #self._ts.append(self._pkt_number)
-                self._pkt_number += 1
+        builder = TristanPacketBuilder(800, GeneratorState())
+        packets_per_slice = -(-per_slice // 800)
+        total_slices = -(-total_events // (packets_per_slice * 800))
+
+        for time_slice in range(total_slices):
+            _, packets = builder.build(time_slice, packets_per_slice)
+            time_slice_dict = {
+                'id': time_slice,
+                'packets': packets,
+                'ts': list(range(self._pkt_number, self._pkt_number + len(packets)))
+            }
+            self._pkt_number += len(packets)
+            # Flat packet list for the send plan
+            self._packets.extend(packets)
+            self._ts.extend([time_slice] * len(packets))
+            self._pkt_ids.extend(range(len(packets)))
             #print("Generated time slice {}".format(time_slice))
             self._time_slices.append(time_slice_dict)
-            time_slice += 1
-            TristanData.PACKET_NUMBER=0
+            builder.state.packet_number=0
 
-    def send_packets(self):
-
-        send_threads = []
+    def create_plan(self):
+        """
+        Decide which packets to drop, reorder and duplicate for each port, and
+        write the manifest.
+        """
         if isinstance(self.args.ports, str):
             self.args.ports = [self.args.ports]
 
-        self._no_of_ports = len(self.args.ports)
-        logging.info("Launching threads to send packets to {} destination ports".format(
-            len(self.args.ports)
+        if self.args.udp_config:
+            self._routing = UdpRouting.from_file(self.args.udp_config)
+        else:
+            self._routing = UdpRouting([(self.args.ip_addr, port) for port in self.args.ports])
+        self._no_of_ports = self._routing.no_of_endpoints
+        self._plan = SendPlan(self._ts, self._pkt_ids, self._no_of_ports,
+                              drop_frac=self.args.drop_frac, drop_list=self.args.drop_list,
+                              reorder=self.args.reorder, duplicate_frac=self.args.dup_frac,
+                              seed=self.args.seed, routing=self._routing)
+        self._plan.write_manifest(self.args.manifest, {
+            'num_events': self.args.num_events,
+            'address': self.args.ip_addr,
+            'ports': self.args.ports,
+            'destinations': self._routing.endpoints
+        })
+        logging.info("Dropping %d of %d packets (seed %d), manifest written to %s",
+                     self._plan.manifest()['dropped'], len(self._packets), self._plan.seed,
+                     self.args.manifest)
+
+    def send_packets(self):
+
+        send_threads = []
+        logging.info("Launching threads to send packets to {} destinations".format(
+            self._no_of_ports
         ))
 
         index = 0
-        for port in self.args.ports:
-            send_thread = threading.Thread(target=self._send_packets, args=(int(port),int(index)))
+        for endpoint in self._routing.endpoints:
+            send_thread = threading.Thread(target=self._send_packets, args=(endpoint, int(index)))
             send_threads.append(send_thread)
             send_thread.start()
             index += 1
 
-    def _send_packets(self, port, index):
+    def _send_packets(self, endpoint, index):
         """
         Send loaded packets over UDP socket.
         """
@@ -372,7 +336,7 @@ class LATRDFrameProducer(object):
         for packets in range(int(self.args.num_idle)):
             # Send the packet over the UDP socket
             try:
-                idle_bytes_sent += udp_socket.sendto(self._idle_packet, (self.args.ip_addr, port))
+                idle_bytes_sent += udp_socket.sendto(self._idle_packet, endpoint)
                 idle_packets_sent += 1
                 # Add 1 second delay
                 time.sleep(1.0)
@@ -380,36 +344,39 @@ class LATRDFrameProducer(object):
                 logging.error("Got error sending frame packet: %s", exc)
                 break
 
-        # Packet delay is total duration / number of packets
-        packet_count = 0
-        for ts in self._time_slices:
-            if ts['id'] % self._no_of_ports == index:
-                packet_count += len(ts['packets'])
+        # Packet rate is number of packets / total duration unless a rate is set
+        chunks = self._plan.chunks(index, self.args.pkt_gap)
+        packet_count = sum(len(chunk) for chunk in chunks)
         logging.info("Sending %d data packets in %f seconds", packet_count, self.args.duration)
         data_bytes_sent = 0
         data_packets_sent = 0
-        delay = float(self.args.duration)/float(packet_count)
-        logging.info("Packet send delay %f", delay)
-        if delay < 0.001:
-            delay = 0.001
-#        for packet, ts_id in zip(self._packets, self._ts):
-        for ts in self._time_slices:
-            if ts['id'] % self._no_of_ports == index:
-                # Send the packet over the UDP socket
-                for packet in ts['packets']:
-                    try:
-                    #logging.info("Checking port number for %d at index %d", ts_id, index)
-                        #logging.info("Sending UDP packet")
-                        data_bytes_sent += udp_socket.sendto(packet, (self.args.ip_addr, port))
-                        #logging.info("Sent UDP packet")
-                        data_packets_sent += 1
-                        # Add 1 second delay
-                        time.sleep(delay)
-                        if data_packets_sent % 1000 == 0:
-                            logging.info("Sent %d packets", data_packets_sent)
-                    except socket.error as exc:
-                        logging.error("Got error sending frame packet: %s", exc)
-                        break
+        packet_rate = self.args.packet_rate
+        bit_rate = None
+        if self.args.data_rate:
+            bit_rate = self.args.data_rate * 1.0e9
+        elif not packet_rate and packet_count > 0 and self.args.duration > 0:
+            packet_rate = float(packet_count) / float(self.args.duration)
+        pacer = PacketPacer(packet_rate=packet_rate, bit_rate=bit_rate, burst=self.args.burst)
+        logging.info("Packet send rate %s", pacer.requested())
+        set_send_buffer(udp_socket, self.args.send_buffer)
+        pacer.start()
+        packets = self._packets
+        try:
+            for chunk in chunks:
+                for packet_index in chunk:
+                    # Send the packet over the UDP socket
+                    packet = packets[packet_index]
+                    pacer.wait(len(packet))
+                    data_bytes_sent += udp_socket.sendto(packet, endpoint)
+                    data_packets_sent += 1
+                    if data_packets_sent % 1000 == 0:
+                        logging.info("Sent %d packets", data_packets_sent)
+                if self.args.pkt_gap:
+                    pacer.pause(self.args.gap_time)
+        except socket.error as exc:
+            logging.error("Got error sending frame packet: %s", exc)
+        logging.info("%s:%d requested %s, achieved %s", endpoint[0], endpoint[1],
+                     pacer.requested(), pacer.achieved())
 
         time.sleep(1.0)
         idle_bytes_sent = 0
@@ -419,7 +386,7 @@ class LATRDFrameProducer(object):
         for packets in range(int(self.args.num_idle)):
             # Send the packet over the UDP socket
             try:
-                idle_bytes_sent += udp_socket.sendto(self._idle_packet, (self.args.ip_addr, port))
+                idle_bytes_sent += udp_socket.sendto(self._idle_packet, endpoint)
                 idle_packets_sent += 1
                 # Add 1 second delay
                 time.sleep(1.0)
@@ -1,109 +1,114 @@
-import numpy as np
 import h5py
 #import shelve
 import argparse
+from latrd.raw.decoder import iter_decode, toa_error_type, DEFAULT_BLOCK_SIZE
+from latrd.raw.events import EventArray
+from latrd.raw.parallel import parallel_decode
+
+# Number of events printed by the reports
+REPORT_EVENTS = 100
 
 class RawParser:
     def __init__(self):
         self._raw = None
-        self._x = None
-        self._y = None
-        self._toa = None
-        self._tot = None
+        self._events = None
         self._file = None
         self._wrong_timing = None
 
-    def parse(self, filename):
+    def iter_parse(self, filename, block_size=DEFAULT_BLOCK_SIZE):
+        """
+        Decode the raw_data dataset one chunk aligned block at a time, yielding
+        the decoded events of each block.  Memory use is bounded by the block size.
+        """
         self._file = filename
         f = h5py.File(filename, 'r')
+        try:
+            for decoded in iter_decode(f['raw_data'], block_size):
+                ##### report any ToA ERROR/WARNING PACKETS
+                for word in decoded.toa_errors:
+                    print ('ToA error/warning found')
+                    print (toa_error_type(word))
+                yield decoded
+        finally:
+            f.close()
 
-        dataset = f['raw_data']
-        raw_data = f.get('raw_data')
-        raw_data = np.array(raw_data)
-        f.close()
-
-        self._raw = []
-        self._x = []
-        self._y = []
-        self._toa = []
-        self._tot = []
+    def parse(self, filename, block_size=DEFAULT_BLOCK_SIZE, processes=1):
+        if processes > 1:
+            self._file = filename
+            decoded = parallel_decode(filename, processes, block_size=block_size)
+            ##### report any ToA ERROR/WARNING PACKETS
+            for word in decoded.toa_errors:
+                print ('ToA error/warning found')
+                print (toa_error_type(word))
+            self._raw = decoded.raw[:REPORT_EVENTS].copy()
+            self._events = EventArray(decoded)
+        else:
+            # Keep the raw words of the reported events alongside the decoded events
+            raw = []
+            self._events = EventArray()
+            for decoded in self.iter_parse(filename, block_size):
+                if len(self._events) < REPORT_EVENTS:
+                    raw.append(decoded.raw[:REPORT_EVENTS - len(self._events)].copy())
+                self._events.append(decoded)
+            self._events.trim()
+            self._raw = [word for block in raw for word in block]
+        # ToA is unsigned so no events can be rejected for negative timing
         self._wrong_timing = 0
-        init_time = 0
-        lToA_single = 0
 
-        for item in raw_data:
-            single_entry = int(item)
-            ##### hunt for SHUTTER OPER TIMESTSAMP PACKET
-            if (single_entry >> 56) & 0x00000000000000FF == 0x84:
-                #print ('Shutter open timestamp found')
-                in_acquisition = True
-                init_time = single_entry & 0x00FFFFFFFFFFFFFF
-                #            lToA = [0, 0, 0, 0]
-                #            lToA[(single_entry >> 21) & 0x0000000000000003] = single_entry & 0x00FFFFFFFFE00000
-                #  one the first extnded timestamp is extracted from the shutter open timestamp, the others can be calculated
-                lToA_single = single_entry & 0x00FFFFFFFF800000
-            else:
-                ##### hunt for ETOA PACKET
-                if ( (single_entry >> 63) & 0x0000000000000001 == 0x0 ):
-                    #print ('Event found')
-                    #            single_toa = ((single_entry >> 14) & 0x0000000007FFFFF) + lToA[(single_entry >> 35) & 0x0000000000000003] - init_time
-                    single_toa = ((single_entry >> 14) & 0x0000000007FFFFF) + lToA_single # - init_time
-                    if ( single_toa >= 0 ):
-                        self._raw.append(single_entry)
-                        self._x.append((single_entry >> 50) & 0x0000000000001FFF)
-                        self._y.append((single_entry >> 37) & 0x0000000000001FFF)
-                        self._toa.append(single_toa)
-                        self._tot.append(single_entry & 0x0000000000003FFF)
-                    else:
-                        self._wrong_timing += 1
-                ##### hunt for EXTENDED TIMESTAMP PACKET
-                elif ( (single_entry >> 56) & 0x00000000000000FF == 0x80 ):
-                    #print ('Extended timestamp found')
-                    #            lToA[(single_entry >> 21) & 0x0000000000000003] = single_entry & 0x00FFFFFFFFE00000
-                    lToA_single = single_entry & 0x00FFFFFFFF800000
-                ##### hunt for SHUTTER CLOSE TIMESTAMP PACKET
-                elif ( (single_entry >> 56) & 0x00000000000000FF == 0x88 ):
-                    #print ('Shutter close timestamp found')
-                    # add here when needed
-                    continue
-                ##### hunt for TRIGGER RE TIMESTAMP PACKET
-                #elif ( (single_entry >> 56) & 0x00000000000000FF == 0x8E ):
-                #    #print ('Trigger RE timestamp packet found')
-                #    # add here when needed
-                #    trig_re_ts.append(single_entry & 0x000FFFFFFFFFFFF0)
-                #elif ( (single_entry >> 56) & 0x00000000000000FF == 0x8C ):
-                #    #print ('Trigger FE timestamp packet found')
-                #    # add here when needed
-                #    trig_fe_ts.append(single_entry & 0x000FFFFFFFFFFFF0)
-                ##### hunt for ToA ERROR/WARNING PACKETS
-                elif ( (single_entry >> 56) & 0x00000000000000FF == 0xBF ):
-                    print ('ToA error/warning found')
-                    if ( single_entry & 0x0000000000000003 == 0x0 ):
-                        print ('ToA warning')
-                    elif ( single_entry & 0x0000000000000003 == 0x1 ):
-                        print ('ToA warning clear')
-                    elif ( single_entry & 0x0000000000000003 == 0x2 ):
-                        print ('ToA error')
-                    elif ( single_entry & 0x0000000000000003 == 0x3 ):
-                        print ('ToA error clear')
+    @property
+    def events(self):
+        return self._events
+
+    def save(self, filename):
+        self._events.save(filename)
 
     def report(self):
-        for index in range(0, 100):
-            print("[{}] {}".format(hex(self._raw[index]), self._toa[index]))
+        for raw, toa in zip(self._raw[:REPORT_EVENTS], self._events.toa[:REPORT_EVENTS]):
+            print("[{}] {}".format(hex(int(raw)), toa))
+
+    def stream_report(self, filename, block_size=DEFAULT_BLOCK_SIZE):
+        """
+        Report the first 100 events and the total event count without holding
+        the decoded file in memory.
+        """
+        reported = 0
+        total = 0
+        for decoded in self.iter_parse(filename, block_size):
+            if reported < REPORT_EVENTS:
+                count = min(len(decoded), REPORT_EVENTS - reported)
+                for raw, toa in zip(decoded.raw[:count], decoded.toa[:count]):
+                    print("[{}] {}".format(hex(int(raw)), toa))
+                reported += count
+            total += len(decoded)
+        print("Total events: {}".format(total))
 
 # Command line inputs
 def options():
     parser = argparse.ArgumentParser()
 #    parser.add_argument("-p", "--path", default="/tmp", help="Path to write to (/tmp)")
     parser.add_argument("-f", "--file", default="/tmp/test.h5", help="File to read and parse (/tmp/test.h5)")
+    parser.add_argument("-b", "--block", type=int, default=DEFAULT_BLOCK_SIZE,
+                        help="Number of words to read per block, rounded to whole chunks "
+                             "({})".format(DEFAULT_BLOCK_SIZE))
+    parser.add_argument("-s", "--stream", action="store_true",
+                        help="Stream the file block by block without keeping the decoded events")
+    parser.add_argument("-j", "--processes", type=int, default=1,
+                        help="Number of processes to decode the file with (1)")
+    parser.add_argument("-o", "--output", default=None,
+                        help="Save the decoded events to this .npy or HDF5 file")
     args = parser.parse_args()
     return args
 
 def main():
     args = options()
     parser = RawParser()
-    parser.parse(args.file)
-    parser.report()
+    if args.stream:
+        parser.stream_report(args.file, args.block)
+    else:
+        parser.parse(args.file, args.block, args.processes)
+        parser.report()
+        if args.output is not None:
+            parser.save(args.output)
 
 
 if __name__ == '__main__':